@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Ядро комбинирования: сигма-отбраковка через np.partition против маскированных массивов
+
+Сравнивает combine_to_ccd (мастер-кадры) с прежним путем через
+astropy sigma_clip на маскированных массивах и с ccdproc.combine
+(если установлен): время и максимальное расхождение результата.
+
+Запуск:
+    python benchmarks/bench_combine.py [--frames 21] [--size 1024] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+from importlib.util import find_spec
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import numpy as np
+
+from processing.combine import ArrayBandSource, combine_to_ccd
+
+# Отбраковка как у create_master_bias / create_master_dark
+MASTER_CLIP = {'clip': 'sigma', 'low': 5.0, 'high': 5.0, 'center': 'median', 'dev': 'mad_std'}
+
+
+def make_frames(n_frames, size, seed=0):
+    """Кадры смещения с шумом, космическими частицами и горячими пикселями"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n_frames):
+        frame = rng.normal(1000.0, 10.0, (size, size))
+        hits = rng.integers(0, size, (size // 4, 2))
+        frame[hits[:, 0], hits[:, 1]] += rng.uniform(200.0, 5000.0, len(hits))
+        frames.append(frame)
+    return frames
+
+
+def masked_combine(frames, method='median'):
+    """
+    Прежний путь ccdproc.Combiner на маскированных массивах
+
+    sigma_clip с cenfunc=np.ma.median, stdfunc=mad_std и порогами
+    MASTER_CLIP, затем np.ma.median / np.ma.average по маске.
+    """
+    from astropy.stats import mad_std, sigma_clip
+
+    stack = np.ma.masked_invalid(np.array(frames, dtype=np.float64))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        clipped = sigma_clip(stack, sigma_lower=MASTER_CLIP['low'], sigma_upper=MASTER_CLIP['high'],
+                             axis=0, maxiters=1,
+                             cenfunc=np.ma.median, stdfunc=mad_std, masked=True, copy=False)
+        if method == 'average':
+            return np.ma.average(clipped, axis=0).filled(np.nan)
+        return np.ma.median(clipped, axis=0).filled(np.nan)
+
+
+def ccdproc_combine(frames, method='median'):
+    """Эталон: ccdproc.combine с теми же параметрами, что у мастер-кадров"""
+    from astropy.nddata import CCDData
+    from astropy.stats import mad_std
+    import ccdproc
+
+    ccds = [CCDData(frame, unit='adu') for frame in frames]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ccdproc.combine(ccds, method=method, sigma_clip=True,
+                               sigma_clip_low_thresh=MASTER_CLIP['low'],
+                               sigma_clip_high_thresh=MASTER_CLIP['high'],
+                               sigma_clip_func=np.ma.median, sigma_clip_dev_func=mad_std,
+                               mem_limit=360e6).data
+
+
+def _timed(func, repeat):
+    """Медиана времени и результат последнего запуска"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def run(frames=21, size=1024, repeat=3):
+    """Замер ядра для среднего и медианы"""
+    print(f"=== Комбинирование {frames} кадров {size}x{size} ===")
+    data = make_frames(frames, size)
+    have_ccdproc = find_spec('ccdproc') is not None
+    if not have_ccdproc:
+        print("ccdproc не установлен: сравнение только с маскированными массивами")
+
+    for method in ('median', 'average'):
+        kernel_time, kernel = _timed(
+            lambda: combine_to_ccd(ArrayBandSource(data), method=method, **MASTER_CLIP).data, repeat)
+        print(f"\n{method}: ядро partition {kernel_time * 1000:8.1f} ms")
+
+        masked_time, masked = _timed(lambda: masked_combine(data, method), repeat)
+        print(f"  маскированные массивы {masked_time * 1000:8.1f} ms, "
+              f"ускорение {masked_time / kernel_time:5.1f}x, "
+              f"max |разница| {np.nanmax(np.abs(kernel - masked)):.3g}")
+
+        if have_ccdproc:
+            reference_time, reference = _timed(lambda: ccdproc_combine(data, method), repeat)
+            print(f"  ccdproc.combine       {reference_time * 1000:8.1f} ms, "
+                  f"ускорение {reference_time / kernel_time:5.1f}x, "
+                  f"max |разница| {np.nanmax(np.abs(kernel - reference)):.3g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=21, help='число кадров в стеке')
+    parser.add_argument('--size', type=int, default=1024, help='размер кадра, пиксели')
+    parser.add_argument('--repeat', type=int, default=3, help='число запусков для медианы')
+    args = parser.parse_args()
+    run(args.frames, args.size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
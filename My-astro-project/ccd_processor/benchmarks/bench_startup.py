@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Время запуска: отчет об импорте (как python -X importtime) и время холодного старта
+
+Запуск:
+    python benchmarks/bench_startup.py [--repeat 5] [--top 20]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Точки входа: модуль окна (main.py импортирует app) и пакет обработки
+ENTRY_POINTS = ['app', 'processing']
+
+# Модули, которые при запуске импортироваться не должны
+HEAVY_MODULES = ['numpy', 'astropy', 'ccdproc', 'scipy', 'matplotlib', 'photutils']
+
+# Первое обращение к процессору - сюда переезжает стоимость импорта
+FIRST_USE = [
+    'processing.calibration',
+    'processing.masters',
+    'processing.quality',
+    'processing.registration',
+    'processing.stacking',
+]
+
+_IMPORTTIME_LINE = re.compile(r'import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)')
+
+
+def _run_python(code, *flags):
+    """Запуск кода в новом интерпретаторе (src в sys.path); возвращает stderr"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, *flags, '-c', code],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stderr
+
+
+def import_time_report(module):
+    """
+    Разбор вывода -X importtime для импорта module
+
+    Returns:
+    --------
+    list
+        (self мкс, cumulative мкс, глубина вложенности, имя модуля)
+    """
+    stderr = _run_python(f'import {module}', '-X', 'importtime')
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return rows
+
+
+def cold_start_time(module, repeat=5):
+    """Медиана времени импорта module в новом процессе, секунды"""
+    code = ('import time; t = time.perf_counter(); '
+            f'import {module}; '
+            'import sys; sys.stderr.write(str(time.perf_counter() - t))')
+    return statistics.median(float(_run_python(code)) for _ in range(repeat))
+
+
+def loaded_heavy_modules(module):
+    """Тяжелые модули, попавшие в sys.modules после импорта module"""
+    code = (f'import sys, {module}; '
+            f'sys.stderr.write(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    output = _run_python(code).strip()
+    return output.split(',') if output else []
+
+
+def print_report(module, rows, top):
+    """Отчет в формате -X importtime: самые дорогие импорты по cumulative"""
+    total = next((cumulative for _, cumulative, depth, name in rows
+                  if depth == 0 and name == module), sum(r[0] for r in rows))
+    print(f"\nimport {module}: {total / 1000:.1f} ms, модулей {len(rows)}")
+    print(f"{'self [us]':>10} | {'cumulative':>10} | imported package")
+    for self_us, cumulative_us, depth, name in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"{self_us:>10} | {cumulative_us:>10} | {'  ' * depth}{name}")
+
+
+def run(repeat=5, top=20):
+    """Все замеры запуска"""
+    print("=== Запуск приложения ===")
+    for module in ENTRY_POINTS:
+        print_report(module, import_time_report(module), top)
+        heavy = loaded_heavy_modules(module)
+        print(f"Холодный старт: {cold_start_time(module, repeat) * 1000:.1f} ms (медиана {repeat})")
+        print(f"Тяжелые модули при импорте: {', '.join(heavy) if heavy else 'нет'}")
+
+    print("\n=== Первое обращение к процессорам ===")
+    for module in FIRST_USE:
+        print(f"  {module:<28} {cold_start_time(module, repeat) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='число запусков для медианы')
+    parser.add_argument('--top', type=int, default=20, help='строк в отчете об импорте')
+    args = parser.parse_args()
+    run(args.repeat, args.top)
+
+
+if __name__ == '__main__':
+    main()
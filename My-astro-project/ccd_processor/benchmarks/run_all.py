@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Запуск всех бенчмарков (файлы bench_*.py этой папки, функция run())
+
+Запуск:
+    python benchmarks/run_all.py [имя ...]
+"""
+
+import importlib.util
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def discover(names=None):
+    """Модули бенчмарков в порядке имен; names - фильтр по подстроке"""
+    for filename in sorted(os.listdir(BENCH_DIR)):
+        if not (filename.startswith('bench_') and filename.endswith('.py')):
+            continue
+        name = filename[:-3]
+        if names and not any(n in name for n in names):
+            continue
+        spec = importlib.util.spec_from_file_location(name, os.path.join(BENCH_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        yield name, module
+
+
+def main():
+    for name, module in discover(sys.argv[1:]):
+        print(f"\n##### {name} #####")
+        module.run()
+
+
+if __name__ == '__main__':
+    main()
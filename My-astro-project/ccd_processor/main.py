@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
 """
 Точка входа в приложение CCD Processor
+
+    python main.py                       - графический интерфейс
+    python main.py --worker host:port    - рабочий процесс распределенного режима
+                                           (ключ - в переменной CCD_WORKER_AUTHKEY)
 """
 
+import argparse
 import sys
 import os
 
 # Добавляем src в путь для импортов
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from app import CCDProcessorApp
-
 if __name__ == "__main__":
-    app = CCDProcessorApp()
-    app.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="CCD Processor")
+    parser.add_argument("--worker", metavar="ADDRESS",
+                        help="подключиться к координатору как рабочий процесс ('host:port' или путь Unix-сокета)")
+    parser.add_argument("--verbose", action="store_true", help="лог задач рабочего процесса")
+    args = parser.parse_args()
+    
+    if args.worker:
+        # Рабочему интерфейс не нужен: tkinter и matplotlib не импортируются
+        from processing.distributed import run_worker
+        run_worker(args.worker, verbose=args.verbose)
+    else:
+        from app import CCDProcessorApp
+        app = CCDProcessorApp()
+        app.run()
@@ -5,40 +5,69 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox  # Добавлен ttk здесь
 import os
-from astropy.nddata import CCDData
-import numpy as np
-import ccdproc
-import astropy.units as u
+import queue
+import threading
 import re
 
+# numpy, astropy, ccdproc и matplotlib при запуске не импортируются:
+# процессоры создаются при первом обращении, тяжелые модули
+# импортируются внутри методов, которым они нужны
 from gui.main_window import MainWindow
-from utils.config import Config
-from processing.calibration import CalibrationProcessor
-from processing.masters import MastersProcessor
+from utils.config import Config, MASTER_TYPES
+from utils.helpers import fingerprint_matches
+from utils.lazy import LazyProcessor
 
 class CCDProcessorApp:
+    # Процессоры обработки (модуль импортируется при первом обращении)
+    calibration_processor = LazyProcessor('processing.calibration', 'CalibrationProcessor')
+    masters_processor = LazyProcessor('processing.masters', 'MastersProcessor')
+    detection_processor = LazyProcessor('processing.detection', 'StarDetectionProcessor')
+    background_processor = LazyProcessor('processing.background', 'BackgroundProcessor')
+    photometry_processor = LazyProcessor('processing.photometry', 'PhotometryProcessor')
+    registration_processor = LazyProcessor('processing.registration', 'RegistrationProcessor')
+    stacking_processor = LazyProcessor('processing.stacking', 'StackingProcessor')
+    quality_processor = LazyProcessor('processing.quality', 'QualityProcessor')
+    live_processor = LazyProcessor('processing.live', 'LiveProcessor')
+    thumbnail_processor = LazyProcessor('processing.thumbnails', 'ThumbnailProcessor')
+    manifest_processor = LazyProcessor('processing.manifest', 'ManifestProcessor')
+    distributed_processor = LazyProcessor('processing.distributed', 'DistributedProcessor')
+    ptc_processor = LazyProcessor('processing.ptc', 'PhotonTransferProcessor')
+    frame_stats_processor = LazyProcessor('processing.frame_stats', 'FrameStatsProcessor')
+    histogram_processor = LazyProcessor('processing.histogram', 'HistogramProcessor')
+    
     def __init__(self):
         self.config = Config()
-        self.calibration_processor = CalibrationProcessor(self)
-        self.masters_processor = MastersProcessor(self)
         self.root = tk.Tk()
         self.main_window = MainWindow(self.root, self)
         
-        # Данные приложения
-        self.lights = []
-        self.darks = []
-        self.bias = []
-        self.flats = []
+        # Данные приложения: списки файлов хранятся в self.config
+        # (см. свойства lights/darks/bias/flats) и попадают в файл сессии
+        self.session_path = None
+        
+        # Калиброванные и выровненные кадры (пути к сохраненным файлам)
+        self.calibrated_lights = []
+        self.registered_lights = []
+        
+        # Имена light кадров, отбракованных по качеству
+        self.rejected_lights = set()
         
         # Текущее состояние
         self.current_image_index = 0
         self.current_image_type = "lights"
         self.current_image = None
+        self.roi_viewer = None
+        self.histogram_panel = None
+        
+        # Журнал запусков конвейера (создается при первой калибровке)
+        self._journal = None
         
-        # Мастер-кадры
-        self.master_bias = None
-        self.master_dark = None
-        self.master_flat = None
+        # Мастер-кадры (из сессии загружаются при первом обращении)
+        self._masters = {master_type: None for master_type in MASTER_TYPES}
+        self._flats = None
+        
+        # Сообщения лога из фоновых потоков (Tk можно трогать только из главного)
+        self._log_queue = queue.Queue()
+        self.root.after(100, self._drain_log_queue)
         
         # Инициализация статуса мастер-кадров
         self.update_master_frames_status()
@@ -59,6 +88,7 @@ class CCDProcessorApp:
         self.root.bind('<Left>', lambda e: self.previous_image())
         self.root.bind('<Right>', lambda e: self.next_image())
         self.root.focus_set()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         self.root.mainloop()
     
@@ -67,6 +97,205 @@ class CCDProcessorApp:
     def working_directory(self):
         return self.config.working_directory
     
+    @property
+    def lights(self):
+        return self.config.lights
+    
+    @lights.setter
+    def lights(self, files):
+        self.config.lights = files
+    
+    @property
+    def darks(self):
+        return self.config.darks
+    
+    @darks.setter
+    def darks(self, files):
+        self.config.darks = files
+    
+    @property
+    def bias(self):
+        return self.config.bias
+    
+    @bias.setter
+    def bias(self, files):
+        self.config.bias = files
+    
+    @property
+    def flats(self):
+        return self.config.flats
+    
+    @flats.setter
+    def flats(self, files):
+        self.config.flats = files
+    
+    @property
+    def master_bias(self):
+        return self._get_master("bias")
+    
+    @master_bias.setter
+    def master_bias(self, ccd_data):
+        self._masters["bias"] = ccd_data
+    
+    @property
+    def master_dark(self):
+        return self._get_master("dark")
+    
+    @master_dark.setter
+    def master_dark(self, ccd_data):
+        self._masters["dark"] = ccd_data
+    
+    @property
+    def master_flat(self):
+        return self._get_master("flat")
+    
+    @master_flat.setter
+    def master_flat(self, ccd_data):
+        self._masters["flat"] = ccd_data
+    
+    def _get_master(self, master_type):
+        """Мастер-кадр; файл из сессии читается при первом обращении"""
+        if self._masters[master_type] is None:
+            fingerprint = self.config.get_master(master_type)
+            if fingerprint is not None:
+                name = os.path.basename(fingerprint['path'])
+                if fingerprint_matches(fingerprint):
+                    self._masters[master_type] = self.read_fits_with_unit(fingerprint['path'])
+                    self.log_command(f"Загружен Master {master_type.capitalize()} из сессии: {name}")
+                else:
+                    self.log_command(f"Предупреждение: Master {master_type.capitalize()} {name} "
+                                     f"изменен или удален - нужно создать заново")
+                    self.config.set_master(master_type, None)
+        return self._masters[master_type]
+    
+    @property
+    def master_flats(self):
+        """
+        Мастер flat по фильтрам {фильтр: CCDData} для калибровки
+        
+        Файлы по фильтрам из сессии читаются при первом обращении (с
+        проверкой отпечатка); если их нет - единственный master_flat под
+        фильтром из его заголовка.
+        """
+        if self._flats is None:
+            self._flats = {}
+            for flat_filter, fingerprint in self.config.master_flats.items():
+                name = os.path.basename(fingerprint['path'])
+                if fingerprint_matches(fingerprint):
+                    self._flats[flat_filter] = self.read_fits_with_unit(fingerprint['path'])
+                else:
+                    self.log_command(f"Предупреждение: Master Flat [{flat_filter or 'без фильтра'}] {name} "
+                                     f"изменен или удален - нужно создать заново")
+        if self._flats:
+            return self._flats
+        if self.master_flat is None:
+            return {}
+        from utils.frame import parse_filter
+        return {parse_filter(self.master_flat.header): self.master_flat}
+    
+    def has_master(self, master_type):
+        """Мастер-кадр есть в памяти или в сессии (без чтения файла)"""
+        return self._masters[master_type] is not None or self.config.get_master(master_type) is not None
+    
+    # Сессия
+    def save_session(self):
+        """Сохранение сессии в файл"""
+        file = filedialog.asksaveasfilename(
+            title="Сохранить сессию",
+            initialdir=self.config.working_directory,
+            initialfile=os.path.basename(self.session_path or "session.json"),
+            defaultextension=".json",
+            filetypes=[("Session files", "*.json"), ("All files", "*.*")]
+        )
+        if not file:
+            return
+        try:
+            self.write_session(file)
+            self.log_command(f"Сессия сохранена: {file}")
+        except Exception as e:
+            self.log_command(f"Ошибка сохранения сессии: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось сохранить сессию: {str(e)}")
+    
+    def write_session(self, file_path):
+        """Запись текущего состояния в файл сессии"""
+        self.config.calibrated_lights = list(self.calibrated_lights)
+        self.config.registered_lights = list(self.registered_lights)
+        self.config.rejected_lights = sorted(self.rejected_lights)
+        self.config.calibration["remove_cosmic_rays"] = self.main_window.processing_panel.cosmic_rays_var.get()
+        self.config.current_image_type = self.current_image_type
+        self.config.current_image_index = self.current_image_index
+        self.config.update_products()
+        self.config.save_config(file_path)
+        self.session_path = file_path
+    
+    def open_session(self):
+        """Открытие сохраненной сессии"""
+        file = filedialog.askopenfilename(
+            title="Открыть сессию",
+            initialdir=self.config.working_directory,
+            filetypes=[("Session files", "*.json"), ("All files", "*.*")]
+        )
+        if not file:
+            return
+        try:
+            self.load_session(file)
+        except Exception as e:
+            self.log_command(f"Ошибка открытия сессии: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось открыть сессию: {str(e)}")
+    
+    def load_session(self, file_path):
+        """
+        Восстановление состояния из файла сессии
+        
+        Ничего не пересчитывается и не читается заранее: мастер-кадры
+        загружаются при первом обращении (с проверкой отпечатка), продукты
+        остаются файлами в рабочей директории.
+        """
+        self.config.load_config(file_path)
+        self.session_path = file_path
+        self._masters = {master_type: None for master_type in MASTER_TYPES}
+        self._flats = None
+        self.calibrated_lights = [p for p in self.config.calibrated_lights if os.path.exists(p)]
+        self.registered_lights = [p for p in self.config.registered_lights if os.path.exists(p)]
+        self.rejected_lights = set(self.config.rejected_lights)
+        
+        self.main_window.top_menu.dir_label.config(
+            text=f"Директория: {os.path.basename(self.config.working_directory)}"
+        )
+        self.main_window.processing_panel.cosmic_rays_var.set(
+            self.config.calibration.get("remove_cosmic_rays", False)
+        )
+        self.current_image_type = self.config.current_image_type
+        self.main_window.image_panel.image_type_var.set(self.current_image_type)
+        current_list = self.get_current_list()
+        self.current_image_index = min(self.config.current_image_index, max(len(current_list) - 1, 0))
+        self.update_stats()
+        self.update_master_frames_status()
+        self.update_navigation_info()
+        
+        self.log_command(f"Открыта сессия: {file_path}")
+        self.log_command(f"Lights: {len(self.lights)}, Darks: {len(self.darks)}, "
+                         f"Bias: {len(self.bias)}, Flats: {len(self.flats)}")
+        self.log_command(f"Калиброванных: {len(self.calibrated_lights)}, "
+                         f"выровненных: {len(self.registered_lights)}, "
+                         f"отбракованных: {len(self.rejected_lights)}")
+        for name, path in self.config.products.items():
+            self.log_command(f"  {name}: {path}")
+    
+    def on_close(self):
+        """Закрытие окна: остановка живого режима и автосохранение сессии"""
+        # Живой режим мог и не запускаться - тогда процессор не создаем
+        if 'live_processor' in self.__dict__ and self.live_processor.running:
+            self.live_processor.stop()
+        if self.distributed_running():
+            self.distributed_processor.stop()
+        if self.session_path:
+            try:
+                self.write_session(self.session_path)
+            except Exception as e:
+                print(f"Ошибка автосохранения сессии: {e}")
+        self.root.destroy()
+    
     # Методы для работы с файлами
     def add_lights(self):
         files = self.select_files("Выберите Light кадры")
@@ -111,6 +340,7 @@ class CCDProcessorApp:
         if file:
             try:
                 self.master_bias = self.read_fits_with_unit(file)
+                self.config.set_master("bias", file)
                 self.log_command(f"Загружен Master Bias: {os.path.basename(file)}")
                 self.update_master_frames_status()
                 messagebox.showinfo("Успех", "Master Bias успешно загружен")
@@ -124,6 +354,7 @@ class CCDProcessorApp:
         if file:
             try:
                 self.master_dark = self.read_fits_with_unit(file)
+                self.config.set_master("dark", file)
                 self.log_command(f"Загружен Master Dark: {os.path.basename(file)}")
                 self.update_master_frames_status()
                 messagebox.showinfo("Успех", "Master Dark успешно загружен")
@@ -137,6 +368,10 @@ class CCDProcessorApp:
         if file:
             try:
                 self.master_flat = self.read_fits_with_unit(file)
+                self.config.set_master("flat", file)
+                # Flat по фильтрам заменяется загруженным (фильтр - из его заголовка)
+                self.config.set_master_flats({})
+                self._flats = None
                 self.log_command(f"Загружен Master Flat: {os.path.basename(file)}")
                 self.update_master_frames_status()
                 messagebox.showinfo("Успех", "Master Flat успешно загружен")
@@ -203,6 +438,84 @@ class CCDProcessorApp:
         self.display_image(current_list[self.current_image_index], colormap="gray")
         self.update_navigation_info()
     
+    def show_contact_sheet(self):
+        """Обзорная сетка миниатюр текущего типа кадров"""
+        current_list = list(self.get_current_list())
+        if not current_list:
+            messagebox.showwarning("Предупреждение", f"Нет {self.current_image_type} кадров для обзора")
+            return
+        from gui.components.contact_sheet import ContactSheet
+        
+        cached = len(current_list) - len(self.thumbnail_processor.missing(current_list))
+        self.log_command(f"Обзор {self.current_image_type}: {len(current_list)} кадров, "
+                         f"в кэше миниатюр {cached}")
+        
+        def select(index):
+            self.current_image_index = index
+            self.display_image(current_list[index], colormap="gray")
+            self.update_navigation_info()
+        
+        ContactSheet(self.root, self, current_list,
+                     title=f"Обзор: {self.current_image_type}", on_select=select)
+    
+    def show_frame_stats(self):
+        """Таблица статистики всех загруженных кадров"""
+        files = [(image_type, path)
+                 for image_type, paths in (("lights", self.lights), ("darks", self.darks),
+                                           ("bias", self.bias), ("flats", self.flats))
+                 for path in paths]
+        if not files:
+            messagebox.showwarning("Предупреждение", "Нет загруженных кадров")
+            return
+        from gui.components.frame_stats_table import FrameStatsTable
+        
+        missing = len(self.frame_stats_processor.missing([path for _, path in files]))
+        self.log_command(f"Статистика кадров: {len(files)} файлов, к расчету {missing}")
+        
+        def select(image_type, path):
+            if image_type != self.current_image_type:
+                self.current_image_type = image_type
+                self.main_window.image_panel.image_type_var.set(image_type)
+            self.current_image_index = list(self.get_current_list()).index(path)
+            self.display_image(path, colormap="gray")
+            self.update_navigation_info()
+        
+        FrameStatsTable(self.root, self, files, on_select=select)
+    
+    def show_roi_viewer(self):
+        """Окно просмотра области текущего кадра в полном разрешении"""
+        current_list = self.get_current_list()
+        if not current_list:
+            messagebox.showwarning("Предупреждение", f"Нет {self.current_image_type} кадров для просмотра")
+            return
+        file_path = current_list[self.current_image_index]
+        if self.roi_viewer is not None:
+            self.roi_viewer.set_file(file_path)
+            self.roi_viewer.window.lift()
+            return
+        from gui.components.roi_viewer import RoiViewer
+        
+        self.roi_viewer = RoiViewer(self.root, self, file_path)
+        self.log_command(f"ROI: {os.path.basename(file_path)}")
+    
+    def on_image_click(self, x, y):
+        """Щелчок по основному изображению: центр окна ROI"""
+        if self.roi_viewer is not None:
+            self.roi_viewer.recenter(x, y)
+    
+    def show_histogram(self):
+        """Панель гистограммы текущего кадра (и мастер-кадров)"""
+        current_list = self.get_current_list()
+        file_path = current_list[self.current_image_index] if current_list else None
+        if self.histogram_panel is not None:
+            if file_path is not None:
+                self.histogram_panel.set_file(file_path)
+            self.histogram_panel.window.lift()
+            return
+        from gui.components.histogram_panel import HistogramPanel
+        
+        self.histogram_panel = HistogramPanel(self.root, self, file_path)
+    
     def on_image_type_changed(self, event):
         """Обработчик изменения типа изображения"""
         new_type = self.main_window.image_panel.image_type_var.get()
@@ -230,33 +543,40 @@ class CCDProcessorApp:
     # Методы отображения
     def display_image(self, file_path, colormap="gray"):
         """Отображение изображения"""
+        import numpy as np
+        from utils.frame import read_frame
         try:
-            self.current_image = self.read_fits_with_unit(file_path)
-            self.main_window.image_panel.ax.clear()
+            # Читается только первая плоскость (у MEF - первое расширение, у куба - первый срез)
+            self.current_image = read_frame(file_path).to_ccddata()
             
             data = self.current_image.data
-            vmin = np.percentile(data, 1)
-            vmax = np.percentile(data, 99)
+            # Растяжка по гистограмме файла (np.bincount, кэш) - та же, что в панели гистограммы
+            try:
+                vmin, vmax = self.histogram_processor.stretch(file_path, 1, 99)
+            except Exception:
+                vmin, vmax = np.nanpercentile(data, [1, 99])
             
-            # Используем переданную цветовую карту
-            self.main_window.image_panel.ax.imshow(
+            # Используем переданную цветовую карту; изображение обновляется на месте
+            self.main_window.image_panel.show_image(
                 data, 
-                cmap=colormap, 
+                os.path.basename(file_path), 
                 vmin=vmin, 
                 vmax=vmax, 
-                origin='lower', 
-                aspect="equal"
+                colormap=colormap
             )
             
-            self.main_window.image_panel.ax.set_title(f"{os.path.basename(file_path)}")
-            self.main_window.image_panel.canvas.draw()
-            
             # Обновление информации
             self.main_window.stats_panel.current_file_label.config(text=os.path.basename(file_path))
             self.main_window.stats_panel.image_size_label.config(text=f"{data.shape[1]} x {data.shape[0]}")
             
             self.log_command(f"Отображен {self.current_image_type}: {os.path.basename(file_path)}")
             
+            # Открытые окна ROI и гистограммы следуют за текущим кадром
+            if self.roi_viewer is not None:
+                self.roi_viewer.set_file(file_path)
+            if self.histogram_panel is not None:
+                self.histogram_panel.set_file(file_path)
+            
         except Exception as e:
             self.log_command(f"Ошибка загрузки: {str(e)}")
             messagebox.showerror("Ошибка", f"Не удалось загрузить файл: {str(e)}")
@@ -294,6 +614,7 @@ class CCDProcessorApp:
             self.master_bias = self.masters_processor.create_master_bias(self.bias)
             bias_path = os.path.join(self.config.working_directory, "master_bias.fits")
             self.master_bias.write(bias_path, overwrite=True)
+            self.config.set_master("bias", bias_path)
             
             self.log_command(f"Master Bias создан из {len(self.bias)} кадров")
             self.log_command(f"Master Bias сохранен как: {bias_path}")
@@ -317,6 +638,7 @@ class CCDProcessorApp:
             self.master_dark = self.masters_processor.create_master_dark(self.darks, self.master_bias)
             dark_path = os.path.join(self.config.working_directory, "master_dark.fits")
             self.master_dark.write(dark_path, overwrite=True)
+            self.config.set_master("dark", dark_path)
             
             self.log_command(f"Master Dark создан из {len(self.darks)} кадров")
             self.log_command(f"Master Dark сохранен как: {dark_path}")
@@ -337,9 +659,34 @@ class CCDProcessorApp:
             return
         
         try:
-            self.master_flat = self.masters_processor.create_master_flat(self.flats, self.master_bias)
+            from processing.masters import group_by_filter
+            groups = group_by_filter(self.flats)
             flat_path = os.path.join(self.config.working_directory, "master_flat.fits")
+            if len(groups) > 1:
+                # Несколько фильтров: все мастер-flat за один проход; при
+                # калибровке каждый light кадр получает flat своего фильтра,
+                # master_flat.fits - flat фильтра первого light кадра (для показа)
+                masters = self.masters_processor.create_master_flats(self.flats, self.master_bias,
+                                                                   groups=groups)
+                paths = {}
+                for flat_filter, master in masters.items():
+                    name = re.sub(r'[^\w.-]+', '_', flat_filter or 'none')
+                    paths[flat_filter] = os.path.join(self.config.working_directory, f"master_flat_{name}.fits")
+                    master.write(paths[flat_filter], overwrite=True)
+                    self.log_command(f"Master Flat [{flat_filter or 'без фильтра'}] сохранен как: {paths[flat_filter]}")
+                light_filter = group_by_filter(self.lights[:1]) if self.lights else {}
+                selected = next(iter(light_filter), None)
+                if selected not in masters:
+                    selected = next(iter(masters))
+                self.master_flat = masters[selected]
+            else:
+                self.master_flat = self.masters_processor.create_master_flat(self.flats, self.master_bias)
+                masters = {next(iter(groups)): self.master_flat}
+                paths = {next(iter(groups)): flat_path}
             self.master_flat.write(flat_path, overwrite=True)
+            self.config.set_master("flat", flat_path)
+            self.config.set_master_flats(paths)
+            self._flats = dict(masters)
             
             self.log_command(f"Master Flat создан из {len(self.flats)} кадров")
             self.log_command(f"Master Flat сохранен как: {flat_path}")
@@ -365,41 +712,83 @@ class CCDProcessorApp:
             self.log_command(f"Light кадров: {len(self.lights)}")
             self.log_command(f"Master Bias: {'✅ есть' if self.master_bias else '❌ нет'}")
             self.log_command(f"Master Dark: {'✅ есть' if self.master_dark else '❌ нет'}")
-            self.log_command(f"Master Flat: {'✅ есть' if self.master_flat else '❌ нет'}")
+            flat_filters = ', '.join(flat_filter or 'без фильтра' for flat_filter in self.master_flats)
+            self.log_command(f"Master Flat: {'✅ ' + flat_filters if flat_filters else '❌ нет'}")
+            
+            # Отбракованные по качеству кадры не калибруем
+            lights = self.filter_rejected(self.lights)
+            if len(lights) < len(self.lights):
+                self.log_command(f"Пропущено отбракованных кадров: {len(self.lights) - len(lights)}")
+            if not lights:
+                self.log_command("Ошибка: Все light кадры отбракованы")
+                messagebox.showwarning("Внимание", "Все light кадры отбракованы по качеству")
+                return
             
             # Выполняем калибровку
-            calibrated_lights = self.calibration_processor.calibrate_lights(
-                self.lights, self.master_bias, self.master_dark, self.master_flat
-            )
+            remove_cosmic_rays = self.main_window.processing_panel.cosmic_rays_var.get()
+            self.log_command(f"Космические лучи: {'✅ удалять' if remove_cosmic_rays else '❌ не удалять'}")
+            
+            # MEF (несколько усилителей) и кубы калибруются потоково по плоскостям
+            from utils.mef import is_multi_plane
+            multi_plane_lights = [path for path in lights if is_multi_plane(path)]
+            single_plane_lights = [path for path in lights if path not in multi_plane_lights]
+            if multi_plane_lights:
+                self.log_command(f"MEF/кубов: {len(multi_plane_lights)} (калибровка по плоскостям, float32)")
             
-            # Сохранение калиброванных файлов
             calibrated_dir = os.path.join(self.config.working_directory, "calibrated")
             os.makedirs(calibrated_dir, exist_ok=True)
-            
-            self.log_command(f"\n💾 Сохранение калиброванных файлов...")
             self.log_command(f"📁 Папка: {calibrated_dir}")
             
-            saved_count = 0
-            for i, calibrated in enumerate(calibrated_lights):
-                # Формируем имя файла
-                original_name = os.path.basename(self.lights[i])
-                output_filename = f"calibrated_{original_name}"
-                output_path = os.path.join(calibrated_dir, output_filename)
-                
-                try:
-                    # КОНВЕРТИРУЕМ ИЗ float64 В uint16
-                    self._save_as_uint16(calibrated, output_path)
-                    
-                    self.log_command(f"  ✅ Сохранен: {output_filename}")
-                    saved_count += 1
-                    
-                except Exception as e:
-                    self.log_command(f"  ❌ Ошибка сохранения {output_filename}: {str(e)}")
+            # Журнал запусков: после сбоя калибруется только остаток серии,
+            # кадры с ошибками уходят в карантин
+            journal = self.get_journal()
+            quarantined = journal.quarantined('calibrate') + journal.quarantined('calibrate_planes')
+            if quarantined and messagebox.askyesno(
+                    "Карантин",
+                    f"В карантине {len(quarantined)} кадров с ошибками прошлых запусков.\n"
+                    f"Попробовать откалибровать их снова?"):
+                journal.clear_quarantine('calibrate')
+                journal.clear_quarantine('calibrate_planes')
+            
+            # Каждому фильтру - свой мастер flat (по FILTER заголовков)
+            from processing.masters import assign_flats
+            groups = assign_flats(lights, self.master_flats)
+            for light_filter, master_flat, group in groups:
+                self.log_command(f"Фильтр {light_filter or 'не указан'}: {len(group)} кадров, "
+                                 f"Master Flat: {'✅ есть' if master_flat is not None else '❌ нет'}")
+            
+            outputs = []
+            quarantined = []
+            for light_filter, master_flat, group in groups:
+                group_outputs, group_quarantined = self._calibrate_group(
+                    [path for path in group if path in single_plane_lights],
+                    [path for path in group if path in multi_plane_lights],
+                    calibrated_dir, master_flat, remove_cosmic_rays, journal
+                )
+                outputs += group_outputs
+                quarantined += group_quarantined
+            # Порядок результатов - как у исходных light кадров
+            order = {f"calibrated_{os.path.basename(path)}": i for i, path in enumerate(lights)}
+            self.calibrated_lights = sorted(outputs, key=lambda path: order.get(os.path.basename(path), 0))
+            
+            saved_count = len(self.calibrated_lights)
+            if quarantined:
+                self.log_command(f"⚠️ В карантине {len(quarantined)} кадров (журнал: {journal.path}):")
+                for light_path in quarantined:
+                    self.log_command(f"  - {os.path.basename(light_path)}")
             
-            # Итог
+            # Итог: формат - по тому, что действительно записано
+            # (обычные кадры - uint16, MEF/кубы - float32 той же структуры)
+            plane_outputs = {f"calibrated_{os.path.basename(path)}" for path in multi_plane_lights}
+            plane_count = sum(os.path.basename(path) in plane_outputs for path in self.calibrated_lights)
+            formats = []
+            if saved_count > plane_count:
+                formats.append(f"uint16 (16-бит): {saved_count - plane_count}")
+            if plane_count:
+                formats.append(f"float32 MEF/куб: {plane_count}")
             if saved_count > 0:
                 self.log_command(f"✅ КАЛИБРОВКА УСПЕШНА!")
-                self.log_command(f"📊 Сохранено файлов: {saved_count}/{len(self.lights)}")
+                self.log_command(f"📊 Сохранено файлов: {saved_count}/{len(lights)}")
                 self.log_command(f"📁 Папка с результатами: {calibrated_dir}")
                 
                 messagebox.showinfo(
@@ -407,7 +796,7 @@ class CCDProcessorApp:
                     f"Калибровка завершена успешно!\n\n"
                     f"Сохранено: {saved_count} файлов\n"
                     f"Папка: {calibrated_dir}\n"
-                    f"Формат: uint16 (16-бит)\n"
+                    f"Формат: {', '.join(formats)}\n"
                     f"Совместимость: Siril, DSS, PixInsight"
                 )
             else:
@@ -424,63 +813,519 @@ class CCDProcessorApp:
             self.log_command(f"\n❌ ОШИБКА КАЛИБРОВКИ: {str(e)}")
             messagebox.showerror("Ошибка", f"Ошибка при калибровке:\n{str(e)}")
 
-    def _save_as_uint16(self, ccd_data, output_path):
-        """Сохранить CCDData как uint16 FITS файл"""
-        from astropy.io import fits
-        import numpy as np
+    def _calibrate_group(self, single_plane_lights, multi_plane_lights, calibrated_dir,
+                         master_flat, remove_cosmic_rays, journal):
+        """
+        Калибровка кадров одного фильтра с его мастер flat
+        
+        Returns:
+        --------
+        tuple
+            (пути калиброванных файлов, кадры в карантине)
+        """
+        outputs = []
+        quarantined = []
+        if single_plane_lights and self.distributed_running():
+            # В распределенном режиме рабочие калибруют и сразу пишут файлы
+            outputs, quarantined = self.distributed_processor.calibrate_files(
+                single_plane_lights, calibrated_dir,
+                self.master_bias, self.master_dark, master_flat,
+                remove_cosmic_rays=remove_cosmic_rays, journal=journal
+            )
+        elif single_plane_lights:
+            outputs, quarantined = self.calibration_processor.calibrate_to_directory(
+                single_plane_lights, calibrated_dir,
+                self.master_bias, self.master_dark, master_flat,
+                remove_cosmic_rays=remove_cosmic_rays, journal=journal
+            )
+        
+        plane_key = self.calibration_processor.run_key(
+            self.master_bias, self.master_dark, master_flat, remove_cosmic_rays
+        ) if multi_plane_lights else None
+        for light_path in multi_plane_lights:
+            output_filename = f"calibrated_{os.path.basename(light_path)}"
+            output_path = os.path.join(calibrated_dir, output_filename)
+            status = journal.status('calibrate_planes', light_path, plane_key)
+            if status == 'done':
+                outputs.append(output_path)
+                self.log_command(f"  ⏭ Уже калиброван: {output_filename}")
+                continue
+            if status == 'quarantined':
+                quarantined.append(light_path)
+                continue
+            try:
+                self.calibration_processor.calibrate_planes(
+                    light_path, output_path,
+                    self.master_bias, self.master_dark, master_flat,
+                    remove_cosmic_rays=remove_cosmic_rays
+                )
+                journal.record_done('calibrate_planes', light_path, plane_key, [output_path])
+                outputs.append(output_path)
+                self.log_command(f"  ✅ Сохранен: {output_filename}")
+            except Exception as e:
+                journal.record_failed('calibrate_planes', light_path, plane_key, e)
+                quarantined.append(light_path)
+                self.log_command(f"  ❌ Ошибка калибровки {output_filename}: {str(e)}")
+        return outputs, quarantined
+
+    def configure_cosmic_rays(self):
+        """
+        Диалог параметров L.A.Cosmic (сохраняются в сессии)
+
+        Пустые усиление и шум считывания - автоматически: из PTC сессии,
+        иначе из заголовка кадра (GAIN/RDNOISE), иначе значения по умолчанию.
+        """
+        defaults = self.calibration_processor.cosmic_ray_processor.params
+        settings = self.config.calibration.get('cosmic_rays') or {}
+        fields = [
+            ('sigclip', "Порог sigclip:"),
+            ('objlim', "Контраст objlim:"),
+            ('satlevel', "Насыщение, ADU:"),
+            ('niter', "Итераций:"),
+            ('gain', "Усиление, e-/ADU (пусто - авто):"),
+            ('readnoise', "Шум считывания, e- (пусто - авто):"),
+        ]
+        optional = ('gain', 'readnoise')
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Параметры L.A.Cosmic")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        variables = {}
+        for row, (name, label) in enumerate(fields):
+            ttk.Label(dialog, text=label).grid(row=row, column=0, sticky=tk.W, padx=10, pady=3)
+            value = settings.get(name, '' if name in optional else defaults[name])
+            variables[name] = tk.StringVar(value=str(value))
+            ttk.Entry(dialog, textvariable=variables[name], width=12).grid(
+                row=row, column=1, padx=10, pady=3
+            )
+
+        def apply():
+            values = {}
+            try:
+                for name, _ in fields:
+                    text = variables[name].get().strip()
+                    if not text and name in optional:
+                        continue
+                    values[name] = int(text) if name == 'niter' else float(text)
+            except ValueError:
+                messagebox.showerror("Ошибка", f"Неверное значение параметра {name}", parent=dialog)
+                return
+            self.config.calibration['cosmic_rays'] = values
+            self.log_command(
+                "Параметры L.A.Cosmic: " + ", ".join(f"{key}={value}" for key, value in values.items())
+            )
+            dialog.destroy()
+
+        buttons = ttk.Frame(dialog)
+        buttons.grid(row=len(fields), column=0, columnspan=2, pady=10)
+        ttk.Button(buttons, text="OK", command=apply).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Отмена", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+    def toggle_live_mode(self):
+        """Запуск/остановка живого режима (калибровка кадров по мере съемки)"""
+        processing_panel = self.main_window.processing_panel
+        if self.live_processor.running:
+            self.live_processor.stop()
+            processing_panel.live_button.config(text="Живой режим")
+            return
         
-        # 1. Получаем данные (float64)
-        data_float = ccd_data.data
+        watch_dir = filedialog.askdirectory(title="Папка, куда камера пишет кадры")
+        if not watch_dir:
+            return
         
-        # 2. Нормализуем к диапазону 0-65535
-        data_min = np.min(data_float)
-        data_max = np.max(data_float)
+        try:
+            self.log_command(f"Master Bias: {'✅ есть' if self.master_bias else '❌ нет'}")
+            self.log_command(f"Master Dark: {'✅ есть' if self.master_dark else '❌ нет'}")
+            flat_filters = ', '.join(flat_filter or 'без фильтра' for flat_filter in self.master_flats)
+            self.log_command(f"Master Flat: {'✅ ' + flat_filters if flat_filters else '❌ нет'}")
+            self.live_processor.start(
+                watch_dir, self.config.working_directory,
+                self.master_bias, self.master_dark, self.master_flat,
+                remove_cosmic_rays=processing_panel.cosmic_rays_var.get(),
+                master_flats=self.master_flats
+            )
+            processing_panel.live_button.config(text="Остановить живой режим")
+            self.root.after(500, self._poll_live_results)
+        except Exception as e:
+            self.log_command(f"Ошибка запуска живого режима: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось запустить живой режим: {str(e)}")
+    
+    def _poll_live_results(self):
+        """Новые кадры живого режима - в списки приложения"""
+        updated = False
+        try:
+            while True:
+                result = self.live_processor.results.get_nowait()
+                if result['light'] not in self.lights:
+                    self.lights.append(result['light'])
+                if result['calibrated'] not in self.calibrated_lights:
+                    self.calibrated_lights.append(result['calibrated'])
+                if result['rejected']:
+                    self.rejected_lights.add(os.path.basename(result['light']))
+                updated = True
+        except queue.Empty:
+            pass
         
-        if data_max > data_min:  # Избегаем деления на ноль
-            # Линейное масштабирование к 0-65535
-            data_scaled = (data_float - data_min) / (data_max - data_min) * 65535.0
-        else:
-            data_scaled = np.zeros_like(data_float)
+        if updated:
+            self.update_stats()
+        if self.live_processor.running or not self.live_processor.results.empty():
+            self.root.after(500, self._poll_live_results)
+    
+    def get_journal(self):
+        """Журнал запусков конвейера для текущей рабочей директории"""
+        from utils.journal import RunJournal
+        if self._journal is None or os.path.dirname(self._journal.path) != self.config.working_directory:
+            self._journal = RunJournal.for_directory(self.config.working_directory)
+        return self._journal
+    
+    def toggle_distributed_mode(self):
+        """Запуск/остановка координатора распределенного режима с локальными рабочими"""
+        from tkinter import simpledialog
+        processing_panel = self.main_window.processing_panel
+        if self.distributed_running():
+            self.distributed_processor.stop()
+            processing_panel.distributed_button.config(text="Распределенный режим")
+            return
+        
+        # По умолчанию только эта машина; 0.0.0.0:порт - слушать все интерфейсы,
+        # чтобы подключались рабочие с других машин (им сообщается адрес машины)
+        address = simpledialog.askstring(
+            "Распределенный режим",
+            "Адрес координатора (host:port или путь Unix-сокета):",
+            initialvalue="127.0.0.1:0"
+        )
+        if not address:
+            return
+        local_workers = simpledialog.askinteger(
+            "Распределенный режим", "Локальных рабочих процессов:",
+            initialvalue=os.cpu_count() or 1, minvalue=0
+        )
+        if local_workers is None:
+            return
+        
+        try:
+            self.distributed_processor.start(address, local_workers=local_workers)
+            processing_panel.distributed_button.config(text="Остановить распределенный режим")
+        except Exception as e:
+            self.log_command(f"Ошибка запуска распределенного режима: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось запустить координатор: {str(e)}")
+    
+    def distributed_running(self):
+        """Координатор запущен (процессор не создается ради проверки)"""
+        return 'distributed_processor' in self.__dict__ and self.distributed_processor.running
+    
+    def get_calibrated_files(self):
+        """Калиброванные кадры: из последней калибровки или из папки calibrated"""
+        if self.calibrated_lights:
+            return list(self.calibrated_lights)
+        
+        calibrated_dir = os.path.join(self.config.working_directory, "calibrated")
+        if not os.path.isdir(calibrated_dir):
+            return []
+        return sorted(
+            os.path.join(calibrated_dir, name)
+            for name in os.listdir(calibrated_dir)
+            if name.lower().endswith(('.fits', '.fit', '.fts'))
+        )
+    
+    def estimate_background(self):
+        """Построение моделей фона для калиброванных кадров"""
+        calibrated_files = self.get_calibrated_files()
+        if not calibrated_files:
+            self.log_command("Ошибка: Нет калиброванных кадров для оценки фона")
+            messagebox.showwarning("Внимание", "Сначала откалибруйте light кадры")
+            return
+        
+        try:
+            self.background_processor.process_files(calibrated_files)
+            cache_dir = self.background_processor.get_cache_dir()
+            self.log_command(f"Модели фона сохранены в: {cache_dir}")
+            
+            messagebox.showinfo(
+                "Готово",
+                f"Оценка фона завершена!\n\n"
+                f"Кадров: {len(calibrated_files)}\n"
+                f"Кэш: {cache_dir}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка оценки фона: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось оценить фон: {str(e)}")
+    
+    def detect_stars(self):
+        """Пакетный поиск звезд на калиброванных кадрах"""
+        calibrated_files = self.get_calibrated_files()
+        if not calibrated_files:
+            self.log_command("Ошибка: Нет калиброванных кадров для поиска звезд")
+            messagebox.showwarning("Внимание", "Сначала откалибруйте light кадры")
+            return
+        
+        try:
+            catalog_dir = os.path.join(self.config.working_directory, "catalogs")
+            os.makedirs(catalog_dir, exist_ok=True)
+            catalog_path = os.path.join(catalog_dir, "detections.fits")
+            
+            if self.distributed_running():
+                catalog = self.distributed_processor.detect_files(calibrated_files, catalog_path)
+            else:
+                catalog = self.detection_processor.detect_files(calibrated_files, catalog_path)
+            
+            messagebox.showinfo(
+                "Готово",
+                f"Поиск звезд завершен!\n\n"
+                f"Кадров: {len(calibrated_files)}\n"
+                f"Найдено звезд: {len(catalog)}\n"
+                f"Каталог: {catalog_path}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка поиска звезд: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось выполнить поиск звезд: {str(e)}")
+    
+    def register_lights(self):
+        """Выравнивание калиброванных кадров по первому кадру"""
+        calibrated_files = self.get_calibrated_files()
+        if not calibrated_files:
+            self.log_command("Ошибка: Нет калиброванных кадров для выравнивания")
+            messagebox.showwarning("Внимание", "Сначала откалибруйте light кадры")
+            return
+        
+        try:
+            registered_dir = os.path.join(self.config.working_directory, "registered")
+            self.registered_lights = self.registration_processor.register_files(
+                calibrated_files, registered_dir, journal=self.get_journal()
+            )
+            self.log_command(f"Выровненные кадры сохранены в: {registered_dir}")
+            
+            messagebox.showinfo(
+                "Готово",
+                f"Выравнивание завершено!\n\n"
+                f"Кадров: {len(self.registered_lights)}\n"
+                f"Папка: {registered_dir}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка выравнивания: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось выровнять кадры: {str(e)}")
+    
+    def get_registered_files(self):
+        """Выровненные кадры: из последнего выравнивания или из папки registered"""
+        if self.registered_lights:
+            return list(self.registered_lights)
+        
+        registered_dir = os.path.join(self.config.working_directory, "registered")
+        if not os.path.isdir(registered_dir):
+            return []
+        return sorted(
+            os.path.join(registered_dir, name)
+            for name in os.listdir(registered_dir)
+            if name.lower().endswith(('.fits', '.fit', '.fts')) and name.startswith("registered_")
+        )
+    
+    def assess_quality(self):
+        """Оценка качества light кадров и отбраковка"""
+        if not self.lights:
+            self.log_command("Ошибка: Нет light кадров для оценки качества")
+            messagebox.showwarning("Внимание", "Сначала добавьте light кадры")
+            return
         
-        # 3. Конвертируем в uint16
-        data_uint16 = data_scaled.astype(np.uint16)
+        try:
+            quality_dir = os.path.join(self.config.working_directory, "quality")
+            os.makedirs(quality_dir, exist_ok=True)
+            output_path = os.path.join(quality_dir, "quality.fits")
+            
+            # Кадры оцениваются калиброванными в памяти - как в живом режиме
+            table = self.quality_processor.process_files(
+                self.lights, output_path, self.master_bias, self.master_dark, self.master_flats
+            )
+            self.rejected_lights = {row['file'] for row in table if row['rejected']}
+            
+            messagebox.showinfo(
+                "Готово",
+                f"Оценка качества завершена!\n\n"
+                f"Кадров: {len(table)}\n"
+                f"Отбраковано: {len(self.rejected_lights)}\n"
+                f"Таблица: {output_path}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка оценки качества: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось оценить качество: {str(e)}")
+    
+    def photon_transfer(self):
+        """Усиление и шум считывания по парам bias и flat (PTC), результат - в сессию"""
+        if len(self.flats) < 2:
+            self.log_command("Ошибка: Для PTC нужны пары flat кадров")
+            messagebox.showwarning("Внимание", "Добавьте flat кадры (пары одной экспозиции)")
+            return
         
-        # 4. Создаем новый заголовок с правильным BITPIX и BZERO
-        new_header = ccd_data.header.copy()
+        try:
+            ptc_dir = os.path.join(self.config.working_directory, "ptc")
+            output_path = os.path.join(ptc_dir, "ptc.fits")
+            
+            result = self.ptc_processor.analyze(self.bias, self.flats)
+            self.ptc_processor.write(result, output_path)
+            # Модель шума сессии: ошибки фотометрии, порог поиска звезд, L.A.Cosmic
+            self.config.calibration["gain"] = result['gain']
+            self.config.calibration["read_noise"] = result['read_noise']
+            
+            messagebox.showinfo(
+                "Готово",
+                f"PTC построена!\n\n"
+                f"Усиление: {result['gain']:.3f} e-/ADU\n"
+                f"Шум считывания: {result['read_noise']:.2f} e-\n"
+                f"Точек: {result['n_points']}\n"
+                f"Таблица: {output_path}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка построения PTC: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось построить PTC: {str(e)}")
+    
+    def filter_rejected(self, file_paths):
+        """Исключение отбракованных кадров (и их калиброванных/выровненных копий)"""
+        if not self.rejected_lights:
+            return list(file_paths)
         
-        # Обновляем ключевые поля
-        new_header['BITPIX'] = 16
-        new_header['BZERO'] = 32768  # Важно! Для преобразования int16 → uint16
-        if 'BUNIT' in new_header:
-            new_header['BUNIT'] = 'adu'
-        if 'CALSTAT' in new_header:
-            new_header['CALSTAT'] = 'BD'  # Обрезаем до 2 символов
+        accepted = []
+        for path in file_paths:
+            # Имя исходного кадра: без префиксов registered_ и calibrated_
+            names = {os.path.basename(path)}
+            for prefix in ("registered_", "calibrated_"):
+                names |= {name[len(prefix):] for name in names if name.startswith(prefix)}
+            if names.isdisjoint(self.rejected_lights):
+                accepted.append(path)
+        return accepted
+    
+    def stack_lights(self):
+        """Сложение выровненных кадров"""
+        registered_files = self.filter_rejected(self.get_registered_files())
+        if not registered_files:
+            self.log_command("Ошибка: Нет выровненных кадров для сложения")
+            messagebox.showwarning("Внимание", "Сначала выровняйте калиброванные кадры")
+            return
         
-        # Убираем не-FITS поля ccdproc
-        for key in list(new_header.keys()):
-            if key.startswith('HIERARCH') or key in ['SUBBIAS', 'SUBDARK']:
-                del new_header[key]
+        try:
+            stacked_dir = os.path.join(self.config.working_directory, "stacked")
+            os.makedirs(stacked_dir, exist_ok=True)
+            output_path = os.path.join(stacked_dir, "master_light.fits")
+            
+            self.stacking_processor.stack_files(registered_files, output_path)
+            
+            messagebox.showinfo(
+                "Готово",
+                f"Сложение завершено!\n\n"
+                f"Кадров: {len(registered_files)}\n"
+                f"Файл: {output_path}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка сложения: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось сложить кадры: {str(e)}")
+    
+    def measure_photometry(self):
+        """
+        Апертурная фотометрия звезд опорного кадра по всем выровненным кадрам
         
-        # Добавляем информацию о конвертации
-        new_header['HISTORY'] = f'Converted from float64 to uint16'
-        new_header['HISTORY'] = f'Original range: min={data_min:.2f}, max={data_max:.2f}'
-        new_header['HISTORY'] = f'Scaled to: min=0, max=65535'
+        Позиции берутся из каталога для кадра 0 - первого калиброванного,
+        он же опорный при выравнивании, поэтому на выровненных кадрах
+        апертуры стоят на тех же звездах при любом дрейфе между кадрами.
+        """
+        registered_files = self.get_registered_files()
+        catalog_path = os.path.join(self.config.working_directory, "catalogs", "detections.fits")
+        if not registered_files:
+            self.log_command("Ошибка: Нет выровненных кадров для фотометрии")
+            messagebox.showwarning("Внимание", "Сначала выровняйте калиброванные кадры")
+            return
+        if not os.path.exists(catalog_path):
+            self.log_command("Ошибка: Нет каталога звезд для фотометрии")
+            messagebox.showwarning("Внимание", "Сначала выполните поиск звезд")
+            return
         
-        # 5. Создаем и сохраняем HDU
-        hdu = fits.PrimaryHDU(data=data_uint16, header=new_header)
-        hdu.writeto(output_path, overwrite=True, output_verify='fix')
+        try:
+            positions = self.photometry_processor.load_sources(catalog_path, frame=0)
+            self.log_command(f"Звезды опорного кадра: {len(positions)}")
+            
+            photometry_dir = os.path.join(self.config.working_directory, "photometry")
+            os.makedirs(photometry_dir, exist_ok=True)
+            output_path = os.path.join(photometry_dir, "photometry.npz")
+            
+            if self.distributed_running():
+                self.distributed_processor.measure_photometry(registered_files, positions, output_path)
+            else:
+                self.photometry_processor.process_files(registered_files, positions, output_path)
+            
+            messagebox.showinfo(
+                "Готово",
+                f"Фотометрия завершена!\n\n"
+                f"Звезд: {len(positions)}\n"
+                f"Кадров: {len(registered_files)}\n"
+                f"Файл: {output_path}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка фотометрии: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось выполнить фотометрию: {str(e)}")
+    
+    def write_manifest(self):
+        """Запись манифеста целостности для папки калиброванных кадров"""
+        calibrated_dir = os.path.join(self.config.working_directory, "calibrated")
+        if not os.path.isdir(calibrated_dir):
+            self.log_command("Ошибка: Нет папки калиброванных кадров для манифеста")
+            messagebox.showwarning("Внимание", "Сначала откалибруйте light кадры")
+            return
+
+        try:
+            manifest = self.manifest_processor.write(calibrated_dir)
+            messagebox.showinfo(
+                "Готово",
+                f"Манифест записан!\n\n"
+                f"Файлов: {len(manifest['files'])}\n"
+                f"Корень: {manifest['root'][:16]}...\n"
+                f"Файл: {self.manifest_processor.get_manifest_path(calibrated_dir)}"
+            )
+        except Exception as e:
+            self.log_command(f"Ошибка записи манифеста: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось записать манифест: {str(e)}")
+
+    def verify_manifest(self, mode='root'):
+        """Проверка папки калиброванных кадров по манифесту (весь набор или выборка)"""
+        calibrated_dir = os.path.join(self.config.working_directory, "calibrated")
+        if not os.path.exists(self.manifest_processor.get_manifest_path(calibrated_dir)):
+            self.log_command("Ошибка: Нет манифеста калиброванных кадров")
+            messagebox.showwarning("Внимание", "Сначала запишите манифест")
+            return
+
+        try:
+            result = self.manifest_processor.verify(calibrated_dir, mode=mode)
+            problems = len(result['changed']) + len(result['missing']) + len(result['extra'])
+            if result['is_valid']:
+                messagebox.showinfo(
+                    "Готово",
+                    f"Набор целостен\n\n"
+                    f"Проверено файлов: {result['checked']}\n"
+                    f"Перехэшировано: {result['rehashed']}"
+                )
+            else:
+                messagebox.showwarning(
+                    "Целостность нарушена",
+                    f"Изменено: {len(result['changed'])}\n"
+                    f"Отсутствует: {len(result['missing'])}\n"
+                    f"Лишних: {len(result['extra'])}\n\n"
+                    f"Всего проблем: {problems} (подробности в логе)"
+                )
+        except Exception as e:
+            self.log_command(f"Ошибка проверки набора: {str(e)}")
+            messagebox.showerror("Ошибка", f"Не удалось проверить набор: {str(e)}")
+
+    def _save_as_uint16(self, ccd_data, output_path):
+        """Сохранить CCDData как uint16 FITS файл"""
+        from processing.calibration import save_as_uint16
+        save_as_uint16(ccd_data, output_path)
         
     def display_master_frame(self, ccd_data, title):
         """Отображение мастер-кадра"""
-        self.main_window.image_panel.ax.clear()
-        
+        from processing.histogram import array_histogram
         data = ccd_data.data
-        vmin = np.percentile(data, 5)
-        vmax = np.percentile(data, 95)
+        vmin, vmax = array_histogram(data).percentile([5, 95])
         
-        self.main_window.image_panel.ax.imshow(data, cmap='gray', vmin=vmin, vmax=vmax, origin='lower')
-        self.main_window.image_panel.ax.set_title(title)
-        self.main_window.image_panel.canvas.draw()
+        self.main_window.image_panel.show_image(data, title, vmin=vmin, vmax=vmax)
         
         self.main_window.stats_panel.current_file_label.config(text=title)
         self.main_window.stats_panel.image_size_label.config(text=f"{data.shape[1]} x {data.shape[0]}")
@@ -490,9 +1335,9 @@ class CCDProcessorApp:
     def update_master_frames_status(self):
         """Обновление статуса мастер-кадров в статистике"""
         masters_status = {
-            "Bias": self.master_bias is not None,
-            "Dark": self.master_dark is not None,
-            "Flat": self.master_flat is not None
+            "Bias": self.has_master("bias"),
+            "Dark": self.has_master("dark"),
+            "Flat": self.has_master("flat")
         }
         if hasattr(self, 'main_window') and hasattr(self.main_window, 'stats_panel'):
             self.main_window.stats_panel.update_master_frames(masters_status)
@@ -522,6 +1367,7 @@ class CCDProcessorApp:
     # Вспомогательные методы
     def read_fits_with_unit(self, file_path, unit='adu'):
         """Чтение FITS файла"""
+        from astropy.nddata import CCDData
         try:
             ccd = CCDData.read(file_path, unit=unit)
             ccd.file_path = file_path
@@ -532,6 +1378,7 @@ class CCDProcessorApp:
     
     def get_exposure_time(self, ccd_data):
         """Извлечение времени экспозиции"""
+        import astropy.units as u
         try:
             header = ccd_data.header
             exposure_keys = ['EXPTIME', 'EXPOSURE', 'EXP TIME', 'EXPTIME1']
@@ -560,15 +1407,24 @@ class CCDProcessorApp:
     
     def log_command(self, message):
         """Логирование команды"""
-        self.main_window.command_panel.log_command(message)
+        if threading.current_thread() is threading.main_thread():
+            self.main_window.command_panel.log_command(message)
+        else:
+            self._log_queue.put(message)
+    
+    def _drain_log_queue(self):
+        """Вывод сообщений фоновых потоков в консоль"""
+        try:
+            while True:
+                self.main_window.command_panel.log_command(self._log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        self.root.after(100, self._drain_log_queue)
 
     def show_inverted(self, show):
         """Показать или скрыть инвертированную версию"""
         try:
-            ax = self.main_window.image_panel.ax
-            if ax.images:  # Если есть изображение
-                ax.images[0].set_cmap("gray_r" if show else "gray")
-                self.main_window.image_panel.canvas.draw()
+            self.main_window.image_panel.set_inverted(show)
         except:
             pass  # Просто игнорируем ошибки
     
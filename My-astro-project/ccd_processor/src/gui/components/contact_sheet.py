@@ -0,0 +1,187 @@
+"""
+Обзорная сетка миниатюр (contact sheet)
+"""
+
+import math
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+
+def _photo_image(thumbnail):
+    """tk.PhotoImage из uint8 массива через PGM (без Pillow)"""
+    height, width = thumbnail.shape
+    header = f"P5 {width} {height} 255 ".encode('ascii')
+    return tk.PhotoImage(data=header + thumbnail.tobytes(), format='PPM')
+
+
+class ContactSheet:
+    """
+    Окно с сеткой миниатюр кадров
+
+    Миниатюры рисуются только для видимых строк и читаются из кэша
+    ThumbnailProcessor при первом появлении на экране, поэтому окно
+    для тысячи кадров открывается сразу. Недостающие миниатюры
+    строятся в фоне и подставляются по мере готовности. Щелчок по
+    миниатюре показывает кадр в основной панели.
+    """
+
+    PADDING = 8
+    LABEL_HEIGHT = 16
+
+    def __init__(self, parent, app, file_paths, title="Обзор кадров", on_select=None):
+        self.app = app
+        self.file_paths = list(file_paths)
+        self.on_select = on_select
+        self.processor = app.thumbnail_processor
+        self.size = self.processor.size
+
+        self.thumbnails = {}     # индекс -> uint8 массив (None - нет в кэше)
+        self.images = {}         # индекс -> PhotoImage (держим ссылки для Tk)
+        self.rendered = set()
+        self.columns = 1
+        self._results = queue.Queue()
+        self._closed = threading.Event()
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"{title} ({len(self.file_paths)})")
+        self.window.geometry("1000x700")
+        self.window.configure(bg='#2b2b2b')
+
+        self.canvas = tk.Canvas(self.window, bg='#2b2b2b', highlightthickness=0)
+        scrollbar = ttk.Scrollbar(self.window, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar = scrollbar
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self._layout())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<MouseWheel>', self._on_mousewheel)
+        self.canvas.bind('<Button-4>', lambda e: self._scroll(-3))
+        self.canvas.bind('<Button-5>', lambda e: self._scroll(3))
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Построение недостающих миниатюр в фоновом потоке
+        threading.Thread(target=self._generate, name="thumbnails", daemon=True).start()
+        self.window.after(200, self._poll_results)
+
+    @property
+    def cell_width(self):
+        return self.size + 2 * self.PADDING
+
+    @property
+    def cell_height(self):
+        return self.size + 2 * self.PADDING + self.LABEL_HEIGHT
+
+    def _generate(self):
+        """Фоновая генерация: результаты передаются в окно через очередь"""
+        try:
+            for path, thumbnail in self.processor.generate(self.file_paths):
+                if self._closed.is_set():
+                    break
+                self._results.put((path, thumbnail))
+        except Exception as e:
+            self.app.log_command(f"Ошибка построения миниатюр: {str(e)}")
+
+    def _poll_results(self):
+        """Подстановка готовых миниатюр (главный поток)"""
+        if self._closed.is_set():
+            return
+        indices = {path: i for i, path in enumerate(self.file_paths)}
+        try:
+            while True:
+                path, thumbnail = self._results.get_nowait()
+                index = indices[path]
+                self.thumbnails[index] = thumbnail
+                if index in self.rendered:
+                    self._draw_cell(index)
+        except queue.Empty:
+            pass
+        self.window.after(200, self._poll_results)
+
+    def _layout(self):
+        """Пересчет сетки под ширину окна"""
+        columns = max(1, self.canvas.winfo_width() // self.cell_width)
+        rows = math.ceil(len(self.file_paths) / columns)
+        self.canvas.configure(scrollregion=(0, 0, columns * self.cell_width, rows * self.cell_height))
+        if columns != self.columns:
+            self.columns = columns
+            self.canvas.delete('all')
+            self.images.clear()
+            self.rendered.clear()
+        self._render_visible()
+
+    def _render_visible(self):
+        """Отрисовка ячеек видимых строк"""
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first_row = max(0, int(top // self.cell_height))
+        last_row = int(bottom // self.cell_height) + 1
+        start = first_row * self.columns
+        stop = min(len(self.file_paths), (last_row + 1) * self.columns)
+        for index in range(start, stop):
+            if index not in self.rendered:
+                if index not in self.thumbnails:
+                    self.thumbnails[index] = self.processor.load(self.file_paths[index])
+                self._draw_cell(index)
+                self.rendered.add(index)
+
+    def _draw_cell(self, index):
+        """Миниатюра (или заглушка) и подпись одной ячейки"""
+        tag = f"cell{index}"
+        self.canvas.delete(tag)
+        row, column = divmod(index, self.columns)
+        x = column * self.cell_width + self.PADDING
+        y = row * self.cell_height + self.PADDING
+        path = self.file_paths[index]
+        name = os.path.basename(path)
+
+        thumbnail = self.thumbnails.get(index)
+        if thumbnail is not None:
+            image = _photo_image(thumbnail)
+            self.images[index] = image
+            # Миниатюра по центру квадрата size x size
+            offset_x = (self.size - thumbnail.shape[1]) // 2
+            offset_y = (self.size - thumbnail.shape[0]) // 2
+            self.canvas.create_image(x + offset_x, y + offset_y, image=image, anchor=tk.NW, tags=tag)
+        else:
+            self.canvas.create_rectangle(x, y, x + self.size, y + self.size,
+                                         outline='#555555', tags=tag)
+            self.canvas.create_text(x + self.size // 2, y + self.size // 2, text="...",
+                                    fill='#888888', tags=tag)
+
+        # Отбракованные по качеству кадры обводятся красным
+        if name in self.app.rejected_lights:
+            self.canvas.create_rectangle(x - 2, y - 2, x + self.size + 2, y + self.size + 2,
+                                         outline='#d04040', width=2, tags=tag)
+
+        label = name if len(name) <= 20 else name[:9] + "…" + name[-10:]
+        self.canvas.create_text(x + self.size // 2, y + self.size + self.LABEL_HEIGHT // 2 + 2,
+                                text=label, fill='white', font=('Arial', 8), tags=tag)
+
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self._render_visible()
+
+    def _scroll(self, units):
+        self.canvas.yview_scroll(units, 'units')
+        self._render_visible()
+
+    def _on_mousewheel(self, event):
+        self._scroll(-1 if event.delta > 0 else 1)
+
+    def _on_click(self, event):
+        """Выбор кадра щелчком по миниатюре"""
+        column = int(self.canvas.canvasx(event.x) // self.cell_width)
+        row = int(self.canvas.canvasy(event.y) // self.cell_height)
+        index = row * self.columns + column
+        if column < self.columns and 0 <= index < len(self.file_paths) and self.on_select:
+            self.on_select(index)
+
+    def close(self):
+        """Закрытие окна (фоновая генерация останавливается)"""
+        self._closed.set()
+        self.window.destroy()
@@ -0,0 +1,212 @@
+"""
+Таблица статистики кадров
+"""
+
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+from processing.combine import MAD_TO_STD
+from processing.frame_stats import STATS_COLUMNS
+
+
+class FrameStatsTable:
+    """
+    Окно с сортируемой таблицей статистики всех загруженных кадров
+
+    Строки из кэша FrameStatsProcessor появляются сразу, остальные
+    считаются в фоне и дописываются по мере готовности. Щелчок по
+    заголовку сортирует столбец (повторный - в обратном порядке).
+    Кадры, чья медиана или MAD-std отклоняется от остальных кадров
+    того же типа больше чем на OUTLIER_SIGMA, подсвечиваются; двойной
+    щелчок показывает кадр в основной панели.
+    """
+
+    HEADINGS = {
+        'type': ("Тип", 60), 'file': ("Файл", 220), 'mean': ("Среднее", 90),
+        'median': ("Медиана", 90), 'mad_std': ("MAD-std", 80), 'min': ("Min", 80),
+        'max': ("Max", 80), 'saturated': ("Насыщ.", 70),
+    }
+    OUTLIER_SIGMA = 5.0
+
+    def __init__(self, parent, app, files, on_select=None):
+        """
+        Parameters:
+        -----------
+        files : list of tuple
+            (тип кадров, путь) - тип как в get_current_list ('lights', ...)
+        on_select : callable or None
+            on_select(тип, путь) при двойном щелчке по строке
+        """
+        self.app = app
+        self.files = list(files)
+        self.on_select = on_select
+        self.processor = app.frame_stats_processor
+        self.stats = {}          # путь -> статистика (None - ошибка расчета)
+        self.items = {}          # путь -> id строки Treeview
+        self.sort_column = None
+        self.sort_reverse = False
+        self._dirty = False
+        self._results = queue.Queue()
+        self._closed = threading.Event()
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"Статистика кадров ({len(self.files)})")
+        self.window.geometry("900x600")
+
+        self.status_label = ttk.Label(self.window, text="")
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=2)
+
+        columns = tuple(self.HEADINGS)
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings', selectmode='browse')
+        for column, (text, width) in self.HEADINGS.items():
+            self.tree.heading(column, text=text, command=lambda c=column: self.sort_by(c))
+            anchor = tk.W if column in ('type', 'file') else tk.E
+            self.tree.column(column, width=width, anchor=anchor, stretch=(column == 'file'))
+        self.tree.tag_configure('outlier', foreground='#d04040')
+        self.tree.tag_configure('failed', foreground='#888888')
+
+        scrollbar = ttk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree.bind('<Double-1>', self._on_activate)
+        self.tree.bind('<Return>', self._on_activate)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.types = {}
+        for image_type, path in self.files:
+            self.types[path] = image_type
+            stats = self.processor.cached(path)
+            if stats is not None:
+                self._add_row(path, stats)
+        self._refresh()
+
+        # Расчет недостающей статистики в фоновом потоке
+        threading.Thread(target=self._generate, name="frame-stats", daemon=True).start()
+        self.window.after(200, self._poll_results)
+
+    def _generate(self):
+        """Фоновый расчет: результаты передаются в окно через очередь"""
+        try:
+            paths = [path for _, path in self.files]
+            for path, stats in self.processor.generate(paths, cancelled=self._closed):
+                self._results.put((path, stats))
+        except Exception as e:
+            self.app.log_command(f"Ошибка расчета статистики кадров: {str(e)}")
+
+    def _poll_results(self):
+        """Добавление готовых строк (главный поток)"""
+        if self._closed.is_set():
+            return
+        try:
+            while True:
+                path, stats = self._results.get_nowait()
+                self._add_row(path, stats)
+        except queue.Empty:
+            pass
+        if self._dirty:
+            self._refresh()
+        self.window.after(200, self._poll_results)
+
+    @staticmethod
+    def _format(column, value):
+        if column == 'saturated':
+            return str(value)
+        return f"{value:.6g}" if abs(value) < 1e6 else f"{value:.4e}"
+
+    def _add_row(self, path, stats):
+        """Строка одного кадра (в конец; порядок восстанавливает _refresh)"""
+        self.stats[path] = stats
+        values = [self.types[path], os.path.basename(path)]
+        if stats is None:
+            values += ["-"] * len(STATS_COLUMNS)
+        else:
+            values += [self._format(column, stats[column]) for column in STATS_COLUMNS]
+        if path in self.items:
+            self.tree.item(self.items[path], values=values)
+        else:
+            self.items[path] = self.tree.insert('', tk.END, values=values,
+                                                tags=('failed',) if stats is None else ())
+        self._dirty = True
+
+    def _refresh(self):
+        """Сортировка, подсветка выбросов и строка состояния"""
+        self._dirty = False
+        if self.sort_column is not None:
+            self._apply_sort()
+        self._mark_outliers()
+        done = len(self.stats)
+        outliers = len(self.tree.tag_has('outlier'))
+        text = f"Готово {done} из {len(self.files)}"
+        if outliers:
+            text += f", выбросов: {outliers}"
+        self.status_label.config(text=text)
+
+    def _mark_outliers(self):
+        """
+        Выбросы по медиане и MAD-std внутри каждого типа кадров
+
+        Отклонение меряется устойчиво (медиана и MAD по кадрам серии),
+        так что один-два плохих кадра не сдвигают порог.
+        """
+        by_type = {}
+        for path, stats in self.stats.items():
+            if stats is not None:
+                by_type.setdefault(self.types[path], []).append(path)
+        for paths in by_type.values():
+            flagged = np.zeros(len(paths), dtype=bool)
+            if len(paths) >= 3:
+                for column in ('median', 'mad_std'):
+                    values = np.array([self.stats[path][column] for path in paths])
+                    center = np.median(values)
+                    spread = MAD_TO_STD * np.median(np.abs(values - center))
+                    if spread > 0:
+                        flagged |= np.abs(values - center) > self.OUTLIER_SIGMA * spread
+            for path, outlier in zip(paths, flagged):
+                self.tree.item(self.items[path], tags=('outlier',) if outlier else ())
+
+    def _sort_key(self, path):
+        """Ключ сортировки: числа по значению, строки без статистики - в конец"""
+        column = self.sort_column
+        if column == 'type':
+            return (0, self.types[path], os.path.basename(path))
+        if column == 'file':
+            return (0, os.path.basename(path))
+        stats = self.stats.get(path)
+        if stats is None:
+            return (1, 0.0)
+        return (0, stats[column])
+
+    def _apply_sort(self):
+        paths = sorted(self.items, key=self._sort_key, reverse=self.sort_reverse)
+        for position, path in enumerate(paths):
+            self.tree.move(self.items[path], '', position)
+
+    def sort_by(self, column):
+        """Сортировка по столбцу (повторный щелчок - обратный порядок)"""
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column, self.sort_reverse = column, column in STATS_COLUMNS
+        for name, (text, _) in self.HEADINGS.items():
+            arrow = (" ▼" if self.sort_reverse else " ▲") if name == column else ""
+            self.tree.heading(name, text=text + arrow)
+        self._apply_sort()
+
+    def _on_activate(self, event):
+        """Показ выбранного кадра в основной панели"""
+        selection = self.tree.selection()
+        if not selection or self.on_select is None:
+            return
+        path = next(p for p, item in self.items.items() if item == selection[0])
+        self.on_select(self.types[path], path)
+
+    def close(self):
+        """Закрытие окна (фоновый расчет останавливается, готовое остается в кэше)"""
+        self._closed.set()
+        self.window.destroy()
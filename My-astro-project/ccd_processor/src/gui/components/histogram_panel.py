@@ -0,0 +1,206 @@
+"""
+Панель гистограммы текущего кадра и мастер-кадров
+"""
+
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+
+class HistogramPanel:
+    """
+    Окно гистограммы кадра
+
+    Гистограмма берется из HistogramProcessor - той же, по которой
+    растягивается основное изображение, поэтому границы растяжки
+    (1% и 99%) отмечены на графике. Если гистограммы еще нет в кэше,
+    кадр читается порциями в фоне и график перерисовывается по мере
+    чтения. Рисуется на tk.Canvas: на отрисовку идет по одному
+    значению на пиксель ширины, так что размер кадра на отзывчивость
+    не влияет.
+    """
+
+    SOURCES = ("Текущий кадр", "Master bias", "Master dark", "Master flat")
+    RANGES = {"1-99%": (1.0, 99.0), "0.1-99.9%": (0.1, 99.9), "Весь": (0.0, 100.0)}
+    MARGIN = 30
+
+    def __init__(self, parent, app, file_path=None):
+        self.app = app
+        self.processor = app.histogram_processor
+        self.file_path = None
+        self.histogram = None
+        self._token = 0
+        self._results = queue.Queue()
+        self._closed = threading.Event()
+
+        self.window = tk.Toplevel(parent)
+        self.window.title("Гистограмма")
+        self.window.geometry("640x360")
+        self.window.configure(bg='#2b2b2b')
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self._create_controls()
+        self.canvas = tk.Canvas(self.window, bg='#2b2b2b', highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.canvas.bind('<Configure>', lambda e: self.redraw())
+        self.status_label = ttk.Label(self.window, text="", font=('Consolas', 9))
+        self.status_label.pack(fill=tk.X, padx=5, pady=2)
+
+        self.window.after(100, self._poll_results)
+        if file_path is not None:
+            self.set_file(file_path)
+
+    def _create_controls(self):
+        """Источник, диапазон и логарифмическая шкала"""
+        controls = ttk.Frame(self.window)
+        controls.pack(fill=tk.X, padx=5, pady=5)
+
+        self.source_var = tk.StringVar(value=self.SOURCES[0])
+        source_combo = ttk.Combobox(controls, textvariable=self.source_var, values=self.SOURCES,
+                                    state="readonly", width=14)
+        source_combo.pack(side=tk.LEFT)
+        source_combo.bind('<<ComboboxSelected>>', self._on_source_changed)
+
+        ttk.Label(controls, text="Диапазон:").pack(side=tk.LEFT, padx=(10, 0))
+        self.range_var = tk.StringVar(value="0.1-99.9%")
+        range_combo = ttk.Combobox(controls, textvariable=self.range_var, values=list(self.RANGES),
+                                   state="readonly", width=9)
+        range_combo.pack(side=tk.LEFT, padx=5)
+        range_combo.bind('<<ComboboxSelected>>', lambda e: self.redraw())
+
+        self.log_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls, text="log", variable=self.log_var,
+                        command=self.redraw).pack(side=tk.LEFT, padx=5)
+
+    def _on_source_changed(self, event=None):
+        """Переключение между текущим кадром и мастер-кадрами"""
+        source = self.source_var.get()
+        if source == self.SOURCES[0]:
+            current_list = self.app.get_current_list()
+            if current_list:
+                self.set_file(current_list[self.app.current_image_index], follow=True)
+            return
+        fingerprint = self.app.config.get_master(source.split()[-1])
+        if fingerprint is None or not os.path.exists(fingerprint['path']):
+            self.status_label.config(text=f"{source}: файл не создан")
+            return
+        self.set_file(fingerprint['path'], follow=True)
+
+    def set_file(self, file_path, follow=False):
+        """
+        Гистограмма другого файла
+
+        Вызов из основного окна (follow=False) меняет файл, только если
+        выбран источник "Текущий кадр".
+        """
+        if not follow and self.source_var.get() != self.SOURCES[0]:
+            return
+        self.file_path = file_path
+        self.window.title(f"Гистограмма: {os.path.basename(file_path)}")
+        self._token += 1
+        histogram = self.processor.load(file_path)
+        if histogram is not None:
+            self.histogram = histogram
+            self.redraw()
+            return
+        # Построение в фоне; результаты устаревших запросов отбрасываются по token
+        self.histogram = None
+        self.redraw()
+        threading.Thread(target=self._build, args=(file_path, self._token),
+                         name="histogram", daemon=True).start()
+
+    def _build(self, file_path, token):
+        """Фоновое чтение кадра: снимки гистограммы передаются в окно через очередь"""
+        try:
+            for histogram in self.processor.iter_build(file_path):
+                if self._closed.is_set() or token != self._token:
+                    return
+                self._results.put((token, histogram.snapshot()))
+        except Exception as e:
+            self.app.log_command(f"Ошибка гистограммы {os.path.basename(file_path)}: {str(e)}")
+
+    def _poll_results(self):
+        """Перерисовка по последнему снимку (главный поток)"""
+        if self._closed.is_set():
+            return
+        latest = None
+        try:
+            while True:
+                token, histogram = self._results.get_nowait()
+                if token == self._token:
+                    latest = histogram
+        except queue.Empty:
+            pass
+        if latest is not None:
+            self.histogram = latest
+            self.redraw()
+        self.window.after(100, self._poll_results)
+
+    @staticmethod
+    def _display_counts(histogram, first, last, width):
+        """Счетчики корзин [first, last], сведенные к не более чем width столбцам"""
+        n = min(width, last - first + 1)
+        edges = np.linspace(first, last + 1, n + 1).astype(np.int64)
+        cumulative = np.concatenate(([0], np.cumsum(histogram.counts[first:last + 1])))
+        return edges, np.diff(cumulative[edges - first])
+
+    def redraw(self):
+        """Отрисовка гистограммы, границ растяжки и подписей"""
+        self.canvas.delete('all')
+        histogram = self.histogram
+        width = self.canvas.winfo_width() - 2 * self.MARGIN
+        height = self.canvas.winfo_height() - 2 * self.MARGIN
+        if histogram is None or histogram.total == 0 or width < 10 or height < 10:
+            self.status_label.config(text="Чтение..." if self.file_path else "")
+            return
+
+        low, high = self.RANGES[self.range_var.get()]
+        if high - low >= 100.0:
+            nonzero = np.flatnonzero(histogram.counts)
+            first, last = int(nonzero[0]), int(nonzero[-1])
+        else:
+            first, last = (int(round(v)) for v in
+                           (histogram.percentile([low, high]) - histogram.zero) / histogram.scale)
+        edges, counts = self._display_counts(histogram, first, last, width)
+        values = np.log10(counts + 1.0) if self.log_var.get() else counts.astype(np.float64)
+        peak = values.max() or 1.0
+
+        x0, y0 = self.MARGIN, self.MARGIN + height
+        span = edges[-1] - edges[0]
+        points = []
+        for left, right, value in zip(edges[:-1], edges[1:], values):
+            y = y0 - height * value / peak
+            points += [x0 + width * (left - edges[0]) / span, y,
+                       x0 + width * (right - edges[0]) / span, y]
+        self.canvas.create_line(*points, fill='#80c0ff')
+        self.canvas.create_line(x0, y0, x0 + width, y0, fill='white')
+
+        # Границы растяжки основного изображения
+        for value in histogram.percentile([1.0, 99.0]):
+            position = (value - histogram.zero) / histogram.scale
+            if first <= position <= last + 1:
+                x = x0 + width * (position - edges[0]) / span
+                self.canvas.create_line(x, self.MARGIN, x, y0, fill='#ffa040', dash=(4, 2))
+
+        for x, anchor, index in ((x0, tk.NW, first), (x0 + width, tk.NE, last)):
+            self.canvas.create_text(x, y0 + 4, text=f"{histogram.value(index):.6g}",
+                                    anchor=anchor, fill='white', font=('Arial', 8))
+
+        p1, median, p99 = histogram.percentile([1.0, 50.0, 99.0])
+        status = (f"Медиана {median:.6g}  среднее {histogram.mean():.6g}  "
+                  f"1%: {p1:.6g}  99%: {p99:.6g}")
+        if histogram.blank:
+            status += f"  пропуски: {histogram.blank}"
+        if not histogram.complete:
+            status += f"  (строк {histogram.rows_done} из {histogram.shape[0]})"
+        self.status_label.config(text=status)
+
+    def close(self):
+        """Закрытие окна (фоновое чтение останавливается)"""
+        self._closed.set()
+        self.app.histogram_panel = None
+        self.window.destroy()
@@ -4,15 +4,21 @@
 
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib import rcParams
-import numpy as np
 
 class ImagePanel:
     def __init__(self, parent, app):
         self.parent = parent
         self.app = app
+        self._fig = None
+        self._ax = None
+        self._canvas = None
+        # Постоянные артисты: изображение обновляется через set_data/set_clim
+        self._image = None
+        self._colorbar = None
+        self._title = None
+        self._message = None
+        self._colormap = "gray"
+        self._drawn = False
         self.setup_ui()
         
     def setup_ui(self):
@@ -20,45 +26,87 @@ class ImagePanel:
         self.frame = ttk.LabelFrame(self.parent, text="Изображение")
         self.frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        self._create_matplotlib_canvas()
+        # Место под холст; сам холст (и импорт matplotlib) - после показа окна
+        self.canvas_frame = ttk.Frame(self.frame)
+        self.canvas_frame.pack(fill=tk.BOTH, expand=True)
+        self.frame.after_idle(self._ensure_canvas)
+        
         self._create_navigation_panel()
         self._create_image_controls()
         
+    # Фигура, оси и холст создаются при первом обращении
+    @property
+    def fig(self):
+        self._ensure_canvas()
+        return self._fig
+    
+    @property
+    def ax(self):
+        self._ensure_canvas()
+        return self._ax
+    
+    @property
+    def canvas(self):
+        self._ensure_canvas()
+        return self._canvas
+        
+    def _ensure_canvas(self):
+        """Создание холста, если его еще нет"""
+        if self._canvas is None:
+            self._create_matplotlib_canvas()
+        
     def _create_matplotlib_canvas(self):
         """Создание холста matplotlib с темной темой"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
         # Настраиваем matplotlib для темной темы
         self._configure_matplotlib_dark_theme()
         
         # Создаем фигуру с темным фоном
-        self.fig = plt.Figure(figsize=(8, 6), dpi=100, facecolor='#2b2b2b')
-        self.ax = self.fig.add_subplot(111, facecolor='#2b2b2b')
+        self._fig = Figure(figsize=(8, 6), dpi=100, facecolor='#2b2b2b')
+        self._ax = self._fig.add_subplot(111, facecolor='#2b2b2b')
+        fig, ax = self._fig, self._ax
         
         # Настраиваем оси для темной темы
-        self.ax.set_title("Загрузите изображение", color='white', fontsize=12)
+        self._title = ax.set_title("Загрузите изображение", color='white', fontsize=12)
         
         # Устанавливаем цвет текста и линий
-        self.ax.tick_params(colors='white')
-        for spine in self.ax.spines.values():
+        ax.tick_params(colors='white')
+        for spine in ax.spines.values():
             spine.set_color('white')
         
         # Текст "Нет изображения"
-        self.ax.text(0.5, 0.5, "Нет изображения", 
-                    ha='center', va='center', 
-                    transform=self.ax.transAxes,
-                    color='white',
-                    fontsize=14)
+        self._message = ax.text(0.5, 0.5, "Нет изображения", 
+                ha='center', va='center', 
+                transform=ax.transAxes,
+                color='white',
+                fontsize=14)
         
         # Убираем оси
-        self.ax.set_xticks([])
-        self.ax.set_yticks([])
+        ax.set_xticks([])
+        ax.set_yticks([])
+        
+        self._canvas = FigureCanvasTkAgg(fig, self.canvas_frame)
+        self._canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # После полной отрисовки можно перерисовывать только область осей (blit)
+        self._canvas.mpl_connect('draw_event', self._on_draw)
+        self._canvas.mpl_connect('button_press_event', self._on_click)
+        self._canvas.draw_idle()
+        
+    def _on_draw(self, event):
+        self._drawn = True
         
-        self.canvas = FigureCanvasTkAgg(self.fig, self.frame)
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    def _on_click(self, event):
+        """Щелчок по изображению передается приложению (центр окна ROI)"""
+        if event.inaxes is self._ax and self._image is not None and self._image.get_visible():
+            self.app.on_image_click(event.xdata, event.ydata)
         
     def _configure_matplotlib_dark_theme(self):
         """Настройка темной темы для matplotlib"""
         # Настройки для темной темы matplotlib
-        plt.rcParams.update({
+        import matplotlib
+        matplotlib.rcParams.update({
             'figure.facecolor': '#2b2b2b',
             'axes.facecolor': '#2b2b2b',
             'axes.edgecolor': 'white',
@@ -80,6 +128,12 @@ class ImagePanel:
         ttk.Button(self.nav_frame, text="← Предыдущий", 
                   command=self.app.previous_image).pack(side=tk.LEFT, padx=2)
         
+        ttk.Button(self.nav_frame, text="Обзор", 
+                  command=self.app.show_contact_sheet).pack(side=tk.LEFT, padx=2)
+        
+        ttk.Button(self.nav_frame, text="Гистограмма", 
+                  command=self.app.show_histogram).pack(side=tk.LEFT, padx=2)
+        
         self.nav_info = ttk.Label(self.nav_frame, text="Нет изображений")
         self.nav_info.pack(side=tk.LEFT, padx=10, expand=True)
         
@@ -114,86 +168,126 @@ class ImagePanel:
         btn.bind("<ButtonPress-1>", lambda e: self.app.show_inverted(True))
         btn.bind("<ButtonRelease-1>", lambda e: self.app.show_inverted(False))
         
+        # Область кадра в полном разрешении (читается только окно)
+        ttk.Button(controls_frame, text="ROI", 
+                  command=self.app.show_roi_viewer).pack(side=tk.LEFT, padx=2)
+        
     def get_colormap(self):
         """Получить цветовую карту (фиксированная - gray)"""
         # Всегда возвращаем 'gray' для консистентной оценки калибровки
         return "gray"
         
-    def update_display(self, image_data=None, title=None, colormap="gray"):
-        """Обновление отображения изображения"""
-        self.ax.clear()
-        
-        # Настройки для темной темы
-        self.ax.set_facecolor('#2b2b2b')
-        
-        if image_data is None:
-            # Отображаем текст "Нет изображения"
-            self.ax.text(0.5, 0.5, "Нет изображения", 
-                        ha='center', va='center', 
-                        transform=self.ax.transAxes,
-                        color='white',
-                        fontsize=14)
-            self.ax.set_xticks([])
-            self.ax.set_yticks([])
-            display_title = "Загрузите изображение"
+    def show_image(self, data, title, vmin=None, vmax=None, colormap="gray",
+                   aspect="equal", colorbar=False):
+        """
+        Показ изображения без пересоздания артистов matplotlib
+        
+        Первый вызов создает AxesImage, следующие только подменяют данные,
+        пределы яркости и цветовую карту; перерисовка - через draw_idle.
+        
+        Parameters:
+        -----------
+        data : numpy.ndarray
+            Данные изображения (2D)
+        title : str
+            Заголовок
+        vmin, vmax : float, optional
+            Пределы яркости (по умолчанию минимум и максимум данных)
+        colorbar : bool
+            Показывать цветовую шкалу (создается один раз)
+        """
+        import numpy as np
+        
+        ax = self.ax
+        if vmin is None or vmax is None:
+            vmin, vmax = float(np.nanmin(data)), float(np.nanmax(data))
+        height, width = data.shape[:2]
+        extent = (-0.5, width - 0.5, -0.5, height - 0.5)
+        
+        if self._image is None:
+            self._image = ax.imshow(data, cmap=colormap, vmin=vmin, vmax=vmax,
+                                    origin='lower', aspect=aspect)
         else:
-            # Отображаем изображение с указанной цветовой картой
-            im = self.ax.imshow(image_data, cmap=colormap, 
-                               aspect='auto', origin='lower')
-            
-            # Добавляем цветовую шкалу
-            if hasattr(self, 'colorbar'):
-                self.colorbar.remove()
-            self.colorbar = self.fig.colorbar(im, ax=self.ax)
-            
-            # Настраиваем цветовую шкалу для темной темы
-            self.colorbar.ax.yaxis.set_tick_params(color='white')
-            plt.setp(self.colorbar.ax.yaxis.get_ticklabels(), color='white')
-            self.colorbar.outline.set_edgecolor('white')
-            
-            display_title = title if title else "Изображение"
-        
-        # Обновляем заголовок
-        self.ax.set_title(display_title, color='white', fontsize=12)
-        
-        # Настраиваем цвета
-        self.ax.tick_params(colors='white')
-        for spine in self.ax.spines.values():
-            spine.set_color('white')
+            self._image.set_data(data)
+            self._image.set_cmap(colormap)
+            self._image.set_clim(vmin, vmax)
+            if tuple(self._image.get_extent()) != extent:
+                self._image.set_extent(extent)
+                ax.set_xlim(extent[0], extent[1])
+                ax.set_ylim(extent[2], extent[3])
+            ax.set_aspect(aspect)
+        self._colormap = colormap
+        
+        if not self._image.get_visible() or self._message.get_visible():
+            self._set_placeholder(False)
+        
+        if colorbar:
+            if self._colorbar is None:
+                self._create_colorbar()
+            else:
+                self._colorbar.ax.set_visible(True)
+        elif self._colorbar is not None:
+            self._colorbar.ax.set_visible(False)
+        
+        self._title.set_text(title)
+        self.canvas.draw_idle()
+        
+    def _create_colorbar(self):
+        """Цветовая шкала для темной темы (следит за set_clim изображения)"""
+        self._colorbar = self.fig.colorbar(self._image, ax=self.ax)
+        self._colorbar.ax.yaxis.set_tick_params(color='white')
+        for label in self._colorbar.ax.yaxis.get_ticklabels():
+            label.set_color('white')
+        self._colorbar.outline.set_edgecolor('white')
+        
+    def _set_placeholder(self, visible, text="Нет изображения"):
+        """Переключение между изображением и текстом-заглушкой"""
+        from matplotlib.ticker import AutoLocator
+        
+        ax = self.ax
+        self._message.set_text(text)
+        self._message.set_visible(visible)
+        if self._image is not None:
+            self._image.set_visible(not visible)
+        if visible:
+            if self._colorbar is not None:
+                self._colorbar.ax.set_visible(False)
+            ax.set_xticks([])
+            ax.set_yticks([])
+        else:
+            ax.xaxis.set_major_locator(AutoLocator())
+            ax.yaxis.set_major_locator(AutoLocator())
+        
+    def set_inverted(self, inverted):
+        """
+        Инвертированная цветовая карта (кнопка по удержанию)
+        
+        Перерисовывается только область осей: фон осей и изображение
+        рисуются поверх последнего полного кадра и копируются на экран.
+        """
+        if self._image is None or not self._image.get_visible():
+            return
+        self._image.set_cmap(self._colormap + "_r" if inverted else self._colormap)
+        colorbar_visible = self._colorbar is not None and self._colorbar.ax.get_visible()
+        if self._drawn and not colorbar_visible:
+            self.ax.draw_artist(self.ax.patch)
+            self.ax.draw_artist(self._image)
+            self.canvas.blit(self.ax.bbox)
+        else:
+            self.canvas.draw_idle()
         
-        # Убираем подписи осей если нет изображения
+    def update_display(self, image_data=None, title=None, colormap="gray"):
+        """Обновление отображения изображения"""
         if image_data is None:
-            self.ax.set_xlabel('')
-            self.ax.set_ylabel('')
-        
-        self.canvas.draw()
+            self._set_placeholder(True)
+            self._title.set_text("Загрузите изображение")
+            self.canvas.draw_idle()
+            return
+        self.show_image(image_data, title if title else "Изображение",
+                        colormap=colormap, aspect='auto', colorbar=True)
     
     def show_empty_message(self, image_type="изображений"):
         """Показать сообщение об отсутствии изображений"""
-        self.ax.clear()
-        
-        # Настраиваем темную тему
-        self.ax.set_facecolor('#2b2b2b')
-        
-        # Убираем оси
-        self.ax.set_xticks([])
-        self.ax.set_yticks([])
-        
-        # Настраиваем цвета
-        self.ax.tick_params(colors='white')
-        for spine in self.ax.spines.values():
-            spine.set_color('white')
-        
-        # Заголовок
-        self.ax.set_title(f"{image_type.capitalize()} - нет изображений", 
-                        color='white', fontsize=12)
-        
-        # Текст
-        self.ax.text(0.5, 0.5, f"Нет {image_type} изображений", 
-                    ha='center', va='center', 
-                    transform=self.ax.transAxes,
-                    color='white',
-                    fontsize=14)
-        
-        # Обновляем холст
-        self.canvas.draw()
\ No newline at end of file
+        self._set_placeholder(True, f"Нет {image_type} изображений")
+        self._title.set_text(f"{image_type.capitalize()} - нет изображений")
+        self.canvas.draw_idle()
@@ -31,4 +31,55 @@ class ProcessingPanel:
         
         # Кнопка калибровки
         ttk.Button(master_frame, text="Калибровать Lights", 
-                  command=self.app.calibrate_lights).pack(side=tk.LEFT, padx=5)
\ No newline at end of file
+                  command=self.app.calibrate_lights).pack(side=tk.LEFT, padx=5)
+        
+        # Опциональное удаление космических лучей при калибровке
+        self.cosmic_rays_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(master_frame, text="Удалять космические лучи",
+                       variable=self.cosmic_rays_var).pack(side=tk.LEFT, padx=5)
+        ttk.Button(master_frame, text="Параметры L.A.Cosmic",
+                  command=self.app.configure_cosmic_rays).pack(side=tk.LEFT, padx=5)
+        
+        # Живой режим: калибровка кадров по мере их записи камерой
+        self.live_button = ttk.Button(master_frame, text="Живой режим",
+                                      command=self.app.toggle_live_mode)
+        self.live_button.pack(side=tk.LEFT, padx=5)
+        
+        # Распределенный режим: калибровка, поиск звезд и фотометрия на рабочих процессах
+        self.distributed_button = ttk.Button(master_frame, text="Распределенный режим",
+                                             command=self.app.toggle_distributed_mode)
+        self.distributed_button.pack(side=tk.LEFT, padx=5)
+        
+        # Анализ калиброванных кадров
+        analysis_frame = ttk.Frame(processing_frame)
+        analysis_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Label(analysis_frame, text="Анализ кадров:", font=('Arial', 10, 'bold')).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(analysis_frame, text="Качество", 
+                  command=self.app.assess_quality).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_frame, text="Фон", 
+                  command=self.app.estimate_background).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_frame, text="Поиск звезд", 
+                  command=self.app.detect_stars).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_frame, text="Выравнивание", 
+                  command=self.app.register_lights).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_frame, text="Сложение", 
+                  command=self.app.stack_lights).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_frame, text="Фотометрия", 
+                  command=self.app.measure_photometry).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_frame, text="PTC (усиление, шум)", 
+                  command=self.app.photon_transfer).pack(side=tk.LEFT, padx=5)
+        
+        # Целостность набора калиброванных кадров
+        integrity_frame = ttk.Frame(processing_frame)
+        integrity_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Label(integrity_frame, text="Целостность набора:", font=('Arial', 10, 'bold')).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(integrity_frame, text="Записать манифест", 
+                  command=self.app.write_manifest).pack(side=tk.LEFT, padx=5)
+        ttk.Button(integrity_frame, text="Проверить набор", 
+                  command=lambda: self.app.verify_manifest('root')).pack(side=tk.LEFT, padx=5)
+        ttk.Button(integrity_frame, text="Выборочная проверка", 
+                  command=lambda: self.app.verify_manifest('sample')).pack(side=tk.LEFT, padx=5)
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Окно просмотра области кадра (ROI) в полном разрешении
+"""
+
+import os
+import tkinter as tk
+from tkinter import ttk
+
+
+class RoiViewer:
+    """
+    Просмотр окна кадра пиксель в пиксель
+
+    Данные читаются TiledFrameReader только для видимого окна, соседние
+    тайлы подгружаются в фоне, поэтому просмотр угла 100-мегапиксельного
+    кадра стоит столько же, сколько 1-мегапиксельного. Окно сдвигается
+    перетаскиванием мышью и стрелками, щелчок по основному изображению
+    переносит центр окна в эту точку.
+    """
+
+    WINDOW_SIZES = (64, 128, 256, 512)
+
+    def __init__(self, parent, app, file_path, center=None, size=128):
+        self.app = app
+        self.reader = None
+        self.size = size
+        self.center = center
+        self._image = None
+        self._drag = None
+
+        self.window = tk.Toplevel(parent)
+        self.window.geometry("640x720")
+        self.window.configure(bg='#2b2b2b')
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self._create_controls()
+        self._create_canvas()
+        self.set_file(file_path, center)
+
+    def _create_controls(self):
+        """Размер окна и статистика области"""
+        controls = ttk.Frame(self.window)
+        controls.pack(fill=tk.X, padx=5, pady=5)
+
+        ttk.Label(controls, text="Окно:").pack(side=tk.LEFT)
+        self.size_var = tk.StringVar(value=str(self.size))
+        size_combo = ttk.Combobox(controls, textvariable=self.size_var,
+                                  values=[str(s) for s in self.WINDOW_SIZES],
+                                  state="readonly", width=5)
+        size_combo.pack(side=tk.LEFT, padx=5)
+        size_combo.bind('<<ComboboxSelected>>', self._on_size_changed)
+
+        self.position_label = ttk.Label(controls, text="")
+        self.position_label.pack(side=tk.LEFT, padx=10)
+
+        self.stats_label = ttk.Label(self.window, text="", font=('Consolas', 9))
+        self.stats_label.pack(fill=tk.X, padx=5)
+
+    def _create_canvas(self):
+        """Холст matplotlib с одним постоянным AxesImage"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.fig = Figure(figsize=(6, 6), dpi=100, facecolor='#2b2b2b')
+        self.ax = self.fig.add_subplot(111, facecolor='#2b2b2b')
+        self.ax.tick_params(colors='white')
+        for spine in self.ax.spines.values():
+            spine.set_color('white')
+        self._title = self.ax.set_title("", color='white', fontsize=11)
+
+        self.canvas = FigureCanvasTkAgg(self.fig, self.window)
+        widget = self.canvas.get_tk_widget()
+        widget.pack(fill=tk.BOTH, expand=True)
+        self.canvas.mpl_connect('button_press_event', self._on_press)
+        self.canvas.mpl_connect('motion_notify_event', self._on_motion)
+        self.canvas.mpl_connect('button_release_event', self._on_release)
+
+        for key, (dx, dy) in {'<Left>': (-1, 0), '<Right>': (1, 0),
+                              '<Up>': (0, 1), '<Down>': (0, -1)}.items():
+            self.window.bind(key, lambda e, dx=dx, dy=dy: self.pan(dx * self.size // 4,
+                                                                   dy * self.size // 4))
+
+    def set_file(self, file_path, center=None):
+        """Открытие другого кадра (центр окна сохраняется, если не задан)"""
+        from utils.roi import TiledFrameReader
+
+        try:
+            reader = TiledFrameReader(file_path)
+        except Exception as e:
+            self.app.log_command(f"Ошибка открытия ROI {os.path.basename(file_path)}: {str(e)}")
+            return
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = reader
+        self.file_path = file_path
+        self.window.title(f"ROI: {os.path.basename(file_path)}")
+
+        ny, nx = reader.shape
+        if center is not None:
+            self.center = center
+        elif self.center is None:
+            self.center = (nx / 2, ny / 2)
+        self.render()
+
+    def recenter(self, x, y):
+        """Перенос центра окна в точку (x, y) кадра"""
+        self.center = (x, y)
+        self.render()
+
+    def pan(self, dx, dy):
+        """Сдвиг окна на (dx, dy) пикселей"""
+        x, y = self.center
+        self.recenter(x + dx, y + dy)
+
+    def render(self):
+        """Чтение окна и обновление изображения и статистики"""
+        import numpy as np
+        from utils.roi import roi_statistics
+
+        if self.reader is None:
+            return
+        ny, nx = self.reader.shape
+        half = self.size // 2
+        # Центр ограничивается так, чтобы окно не выходило за кадр
+        cx = int(round(min(max(self.center[0], half), max(nx - half, half))))
+        cy = int(round(min(max(self.center[1], half), max(ny - half, half))))
+        self.center = (cx, cy)
+
+        data, (y0, y1, x0, x1) = self.reader.read(cy - half, cy + half, cx - half, cx + half)
+        extent = (x0 - 0.5, x1 - 0.5, y0 - 0.5, y1 - 0.5)
+        finite = data[np.isfinite(data)]
+        vmin, vmax = np.percentile(finite, [1, 99.5]) if finite.size else (0, 1)
+
+        if self._image is None:
+            self._image = self.ax.imshow(data, cmap='gray', vmin=vmin, vmax=vmax, origin='lower',
+                                         interpolation='nearest', extent=extent)
+        else:
+            self._image.set_data(data)
+            self._image.set_clim(vmin, vmax)
+            self._image.set_extent(extent)
+        self.ax.set_xlim(extent[0], extent[1])
+        self.ax.set_ylim(extent[2], extent[3])
+        self._title.set_text(f"x {x0}-{x1}, y {y0}-{y1}")
+        self.canvas.draw_idle()
+
+        stats = roi_statistics(data)
+        self.position_label.config(text=f"Центр: ({cx}, {cy})  Кадр: {nx} x {ny}")
+        self.stats_label.config(
+            text=f"Среднее {stats['mean']:.2f}  Медиана {stats['median']:.2f}  "
+                 f"σ {stats['std']:.2f}  Мин {stats['min']:.2f}  Макс {stats['max']:.2f}"
+        )
+
+    def _on_size_changed(self, event):
+        self.size = int(self.size_var.get())
+        self.render()
+
+    def _on_press(self, event):
+        if event.inaxes is self.ax and event.button == 1:
+            self._drag = (event.x, event.y, self.center)
+
+    def _on_motion(self, event):
+        """Панорамирование перетаскиванием: экранные пиксели -> пиксели кадра"""
+        if self._drag is None:
+            return
+        start_x, start_y, (cx, cy) = self._drag
+        bbox = self.ax.bbox
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        dx = (event.x - start_x) * (x1 - x0) / bbox.width
+        dy = (event.y - start_y) * (y1 - y0) / bbox.height
+        self.center = (cx - dx, cy - dy)
+        self.render()
+
+    def _on_release(self, event):
+        self._drag = None
+
+    def close(self):
+        """Закрытие окна и файла"""
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.app.roi_viewer = None
+        self.window.destroy()
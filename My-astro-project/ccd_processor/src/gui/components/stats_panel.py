@@ -59,6 +59,10 @@ class StatsPanel:
         self.flats_count = ttk.Label(flats_frame, text="0", font=('Arial', 10))
         self.flats_count.pack(side=tk.LEFT)
         
+        # Таблица статистики всех кадров
+        ttk.Button(self.counters_frame, text="Статистика кадров",
+                   command=self.app.show_frame_stats).pack(fill=tk.X, pady=(8, 2))
+        
         # Разделитель
         ttk.Separator(self.stats_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, padx=5, pady=10)
         
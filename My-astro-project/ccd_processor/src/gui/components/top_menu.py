@@ -27,7 +27,9 @@ class TopMenu:
             ("Добавить Darks", self.app.add_darks),
             ("Добавить Bias", self.app.add_bias),
             ("Добавить Flats", self.app.add_flats),
-            ("Авто Flats", self.app.auto_flats)
+            ("Авто Flats", self.app.auto_flats),
+            ("Открыть сессию", self.app.open_session),
+            ("Сохранить сессию", self.app.save_session)
         ]
         
         for text, command in buttons:
@@ -2,8 +2,33 @@
 Image Processing Modules
 """
 
-from .calibration import CalibrationProcessor
-from .masters import MastersProcessor
-from .integrity_checker import IntegrityChecker
+from utils.lazy import lazy_exports
 
-__all__ = ['CalibrationProcessor', 'MastersProcessor', 'IntegrityChecker']
\ No newline at end of file
+# Модули обработки импортируются при первом обращении к классу:
+# каждый из них тянет numpy/astropy/scipy, а запуску интерфейса они не нужны
+_EXPORTS = {
+    'CalibrationProcessor': 'calibration',
+    'MastersProcessor': 'masters',
+    'IntegrityChecker': 'integrity_checker',
+    'CosmicRayProcessor': 'cosmic_rays',
+    'StarDetectionProcessor': 'detection',
+    'BackgroundProcessor': 'background',
+    'BackgroundMesh': 'background',
+    'PhotometryProcessor': 'photometry',
+    'CentroidProcessor': 'centroids',
+    'RegistrationProcessor': 'registration',
+    'StackingProcessor': 'stacking',
+    'QualityProcessor': 'quality',
+    'LiveProcessor': 'live',
+    'ThumbnailProcessor': 'thumbnails',
+    'ManifestProcessor': 'manifest',
+    'DistributedProcessor': 'distributed',
+    'DetectorGeometry': 'overscan',
+    'PhotonTransferProcessor': 'ptc',
+    'FrameStatsProcessor': 'frame_stats',
+    'HistogramProcessor': 'histogram',
+}
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
+
+__all__ = list(_EXPORTS)
@@ -0,0 +1,278 @@
+"""
+Оценка фона Background2D: грубая сетка, кэш и вычитание "на лету"
+"""
+
+import hashlib
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.stats import SigmaClip
+from scipy.interpolate import RectBivariateSpline
+from scipy.ndimage import median_filter
+
+from utils.frame import read_frame
+from utils.tiling import get_worker_count
+
+
+class BackgroundMesh:
+    """
+    Низкоразрешающая модель фона кадра
+
+    Хранит только значения фона и шума в узлах сетки (по одному на
+    ячейку box_size), полноразмерный фон интерполируется по запросу
+    полосами строк, поэтому память на кадр - единицы килобайт.
+    """
+
+    def __init__(self, mesh, rms_mesh, box_size, shape, source=None, mtime=None):
+        self.mesh = np.asarray(mesh, dtype=np.float32)
+        self.rms_mesh = np.asarray(rms_mesh, dtype=np.float32)
+        self.box_size = tuple(int(b) for b in box_size)
+        self.shape = tuple(int(s) for s in shape)
+        self.source = source
+        self.mtime = mtime
+        self._splines = {}
+
+    @property
+    def background_median(self):
+        """Медиана фона по сетке"""
+        return float(np.median(self.mesh))
+
+    @property
+    def background_rms_median(self):
+        """Медиана шума фона по сетке"""
+        return float(np.median(self.rms_mesh))
+
+    def _node_coordinates(self):
+        """Координаты узлов сетки (центры ячеек) в пикселях кадра"""
+        coordinates = []
+        for length, box, count in zip(self.shape, self.box_size, self.mesh.shape):
+            starts = np.arange(count) * box
+            stops = np.minimum(starts + box, length)
+            # Для неполных ячеек у края - центр фактической ячейки
+            coordinates.append((starts + stops - 1) / 2.0)
+        return coordinates[0], coordinates[1]
+
+    def _spline(self, name):
+        """Сплайн по сетке (кэшируется, строится один раз)"""
+        if name not in self._splines:
+            values = self.mesh if name == 'background' else self.rms_mesh
+            ys, xs = self._node_coordinates()
+            # Бикубический сплайн, если узлов хватает (как BkgZoomInterpolator)
+            ky = min(3, len(ys) - 1)
+            kx = min(3, len(xs) - 1)
+            if ky < 1 or kx < 1:
+                self._splines[name] = float(values.mean())
+            else:
+                self._splines[name] = RectBivariateSpline(ys, xs, values, kx=kx, ky=ky)
+        return self._splines[name]
+
+    def interpolate(self, rows=None, name='background'):
+        """
+        Полноразмерный фон (или его полоса строк)
+
+        Parameters:
+        -----------
+        rows : slice or None
+            Диапазон строк кадра; None - весь кадр
+        name : str
+            'background' или 'rms'
+        """
+        ny, nx = self.shape
+        rows = rows or slice(0, ny)
+        start, stop, _ = rows.indices(ny)
+        spline = self._spline(name)
+        if isinstance(spline, float):
+            return np.full((stop - start, nx), spline, dtype=np.float32)
+        return spline(np.arange(start, stop), np.arange(nx)).astype(np.float32)
+
+    def subtract(self, data, band_rows=512, out=None):
+        """
+        Вычитание фона полосами строк без полноразмерной модели в памяти
+
+        out=data - вычитание на месте (data должен быть float)
+        """
+        if data.shape != self.shape:
+            raise ValueError(f"Размер кадра {data.shape} не совпадает с моделью фона {self.shape}")
+        if out is None:
+            out = np.array(data, dtype=np.float32)
+        ny = self.shape[0]
+        for start in range(0, ny, band_rows):
+            band = slice(start, min(start + band_rows, ny))
+            out[band] -= self.interpolate(band)
+        return out
+
+    def save(self, path):
+        """Сохранение сетки в .npz"""
+        np.savez(
+            path,
+            mesh=self.mesh,
+            rms_mesh=self.rms_mesh,
+            box_size=np.array(self.box_size),
+            shape=np.array(self.shape),
+            source=np.array(self.source or ''),
+            mtime=np.array(self.mtime if self.mtime is not None else -1.0)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка сетки из .npz"""
+        with np.load(path) as f:
+            mtime = float(f['mtime'])
+            return cls(
+                f['mesh'], f['rms_mesh'], f['box_size'], f['shape'],
+                source=str(f['source']) or None,
+                mtime=None if mtime < 0 else mtime
+            )
+
+
+class BackgroundProcessor:
+    """
+    Построение и кэширование моделей фона для калиброванных кадров
+
+    Повторяет Background2D(data, (60, 60), filter_size=(3, 3),
+    sigma_clip=SigmaClip(sigma=3.0), bkg_estimator=MedianBackground())
+    из 07-stars-detection.ipynb, но считает ячейки сетки параллельно
+    по строкам сетки и хранит на диске только саму сетку.
+    """
+
+    def __init__(self, app, box_size=(60, 60), filter_size=(3, 3), sigma=3.0,
+                 exclude_percentile=10.0, max_workers=None):
+        self.app = app
+        self.box_size = tuple(box_size)
+        self.filter_size = tuple(filter_size)
+        self.sigma_clip = SigmaClip(sigma=sigma)
+        self.exclude_percentile = exclude_percentile
+        self.max_workers = get_worker_count(max_workers)
+
+    def get_cache_dir(self):
+        """Папка кэша моделей фона"""
+        return os.path.join(self.app.config.working_directory, "background")
+
+    def get_cache_path(self, file_path):
+        """
+        Путь к кэшу модели фона для файла
+
+        Ключ - хэш абсолютного пути: одноименные кадры из разных папок
+        не перезаписывают кэш друг друга (изменение файла проверяет
+        load_mesh по mtime).
+        """
+        name = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.get_cache_dir(), f"{name}.bkg.npz")
+
+    def _mesh_row(self, data, row):
+        """Фон и шум для одной строки ячеек сетки"""
+        by, bx = self.box_size
+        band = data[row * by:(row + 1) * by]
+        ny, nx = band.shape
+        n_boxes = -(-nx // bx)
+
+        # Дополняем NaN до целого числа ячеек и раскладываем на (ячейка, пиксели)
+        padded = np.full((by, n_boxes * bx), np.nan, dtype=np.float32)
+        padded[:ny, :nx] = band
+        boxes = padded.reshape(by, n_boxes, bx).transpose(1, 0, 2).reshape(n_boxes, -1)
+
+        # Доля пикселей ячейки внутри кадра (у правого края ячейки неполные)
+        widths = np.minimum(bx, nx - np.arange(n_boxes) * bx)
+        in_frame = ny * widths
+        finite = np.count_nonzero(np.isfinite(boxes), axis=1)
+
+        # NaN дополнения - ожидаемое значение, предупреждение astropy не нужно
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            clipped = self.sigma_clip(boxes, axis=1, masked=False)
+        background = np.nanmedian(clipped, axis=1)
+        rms = np.nanstd(clipped, axis=1)
+
+        # Ячейки, где замаскировано больше exclude_percentile %, заполняются позже
+        bad = finite < in_frame * (1.0 - self.exclude_percentile / 100.0)
+        background[bad] = np.nan
+        rms[bad] = np.nan
+        return background, rms
+
+    def estimate_mesh(self, data, source=None, mtime=None):
+        """
+        Построение сетки фона для одного кадра
+
+        Returns:
+        --------
+        BackgroundMesh
+            Сетка фона и шума после медианного фильтра filter_size
+        """
+        data = np.asarray(data, dtype=np.float32)
+        n_rows = -(-data.shape[0] // self.box_size[0])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            rows = list(executor.map(lambda r: self._mesh_row(data, r), range(n_rows)))
+
+        mesh = np.vstack([r[0] for r in rows])
+        rms_mesh = np.vstack([r[1] for r in rows])
+
+        # Пустые ячейки заменяем медианой по сетке
+        for grid in (mesh, rms_mesh):
+            bad = ~np.isfinite(grid)
+            if np.all(bad):
+                raise ValueError("Не удалось оценить фон: все ячейки сетки отброшены")
+            grid[bad] = np.nanmedian(grid)
+
+        if self.filter_size != (1, 1):
+            mesh = median_filter(mesh, size=self.filter_size, mode='nearest')
+            rms_mesh = median_filter(rms_mesh, size=self.filter_size, mode='nearest')
+
+        return BackgroundMesh(mesh, rms_mesh, self.box_size, data.shape, source=source, mtime=mtime)
+
+    def load_mesh(self, file_path):
+        """Сетка фона из кэша (None, если кэша нет или файл изменился)"""
+        cache_path = self.get_cache_path(file_path)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            mesh = BackgroundMesh.load(cache_path)
+        except Exception:
+            return None
+        if mesh.mtime is not None and mesh.mtime != os.path.getmtime(file_path):
+            return None
+        if mesh.box_size != tuple(self.box_size):
+            return None
+        return mesh
+
+    def get_mesh(self, file_path, data=None):
+        """Сетка фона для файла: из кэша или построенная заново"""
+        mesh = self.load_mesh(file_path)
+        if mesh is not None:
+            return mesh
+        return self._build_mesh(file_path, data)
+
+    def _build_mesh(self, file_path, data=None):
+        """Построение сетки фона и запись ее в кэш"""
+        if data is None:
+            data = read_frame(file_path).data
+        mesh = self.estimate_mesh(data, source=file_path, mtime=os.path.getmtime(file_path))
+
+        os.makedirs(self.get_cache_dir(), exist_ok=True)
+        mesh.save(self.get_cache_path(file_path))
+        return mesh
+
+    def process_files(self, file_paths):
+        """Построение (или проверка кэша) моделей фона для списка файлов"""
+        if not file_paths:
+            raise ValueError("Нет кадров для оценки фона")
+
+        self.app.log_command(f"Оценка фона: {len(file_paths)} кадров, "
+                             f"ячейка {self.box_size[0]}x{self.box_size[1]}, "
+                             f"{self.max_workers} потоков")
+        meshes = []
+        for i, path in enumerate(file_paths):
+            filename = os.path.basename(path)
+            mesh = self.load_mesh(path)
+            source = "кэш"
+            if mesh is None:
+                mesh = self._build_mesh(path)
+                source = "расчет"
+            meshes.append(mesh)
+            self.app.log_command(
+                f"  [{i+1}/{len(file_paths)}] {filename}: фон {mesh.background_median:.1f}, "
+                f"шум {mesh.background_rms_median:.2f} ({source})"
+            )
+        return meshes
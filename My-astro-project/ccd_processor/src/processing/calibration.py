@@ -2,25 +2,140 @@
 Функции калибровки изображений
 """
 
-import ccdproc
 import astropy.units as u
 import numpy as np
 import os
-from astropy.io import fits
-from astropy.nddata import CCDData
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from importlib.util import find_spec
 
-# Импортируем модуль проверки целостности
-try:
-    from .integrity_checker import IntegrityChecker
-    INTEGRITY_CHECKER_AVAILABLE = True
-except ImportError:
+# Модуль проверки целостности: наличие проверяется сразу, а импортируется
+# он при первой калибровке (см. _integrity_checker)
+INTEGRITY_CHECKER_AVAILABLE = find_spec('.integrity_checker', __package__) is not None
+if not INTEGRITY_CHECKER_AVAILABLE:
     # Если модуль не найден, работаем без проверки целостности
-    INTEGRITY_CHECKER_AVAILABLE = False
     print("Предупреждение: модуль integrity_checker не найден. Проверка целостности отключена.")
 
+
+def _integrity_checker():
+    """Класс IntegrityChecker (импорт при первом обращении)"""
+    from .integrity_checker import IntegrityChecker
+    return IntegrityChecker
+
+from utils.frame import read_frame
+from utils.journal import params_key
+from utils.mef import list_hdus, plane_indices, read_plane, PlaneWriter
+from utils.tiling import get_worker_count
+from .cosmic_rays import CosmicRayProcessor
+from .overscan import APPLIED_KEYS, geometry_for, mark_applied, subtract_overscan
+
+
+def apply_masters(data, exposure, bias, dark, dark_exposure, flat):
+    """
+    Калибровка одной плоскости на месте (та же арифметика, что в цикле
+    calibrate_lights): bias, dark с масштабом по экспозиции, flat, обрезка
+    отрицательных значений. Экспозиции - в секундах.
+    """
+    if bias is not None:
+        data -= bias
+    if dark is not None:
+        scale_factor = exposure / dark_exposure if exposure > 0 and dark_exposure > 0 else 1.0
+        data -= dark * scale_factor if scale_factor != 1.0 else dark
+    if flat is not None:
+        data /= flat
+    return np.clip(data, 0, None, out=data)
+
+
+def save_as_uint16(ccd_data, output_path):
+    """
+    Запись калиброванного CCDData в uint16 FITS (линейное растяжение
+    диапазона кадра на 0-65535; маска космических лучей - расширением CRMASK)
+    """
+    from astropy.io import fits
+
+    # 1. Получаем данные (float64)
+    data_float = ccd_data.data
+
+    # 2. Нормализуем к диапазону 0-65535
+    data_min = np.min(data_float)
+    data_max = np.max(data_float)
+
+    if data_max > data_min:  # Избегаем деления на ноль
+        # Линейное масштабирование к 0-65535
+        data_scaled = (data_float - data_min) / (data_max - data_min) * 65535.0
+    else:
+        data_scaled = np.zeros_like(data_float)
+
+    # 3. Конвертируем в uint16
+    data_uint16 = data_scaled.astype(np.uint16)
+
+    # 4. Создаем новый заголовок с правильным BITPIX и BZERO
+    new_header = ccd_data.header.copy()
+
+    # Обновляем ключевые поля
+    new_header['BITPIX'] = 16
+    new_header['BZERO'] = 32768  # Важно! Для преобразования int16 → uint16
+    if 'BUNIT' in new_header:
+        new_header['BUNIT'] = 'adu'
+    if 'CALSTAT' in new_header:
+        new_header['CALSTAT'] = 'BD'  # Обрезаем до 2 символов
+
+    # Убираем не-FITS поля ccdproc
+    for key in list(new_header.keys()):
+        if key.startswith('HIERARCH') or key in ['SUBBIAS', 'SUBDARK']:
+            del new_header[key]
+
+    # Добавляем информацию о конвертации
+    new_header['HISTORY'] = f'Converted from float64 to uint16'
+    new_header['HISTORY'] = f'Original range: min={data_min:.2f}, max={data_max:.2f}'
+    new_header['HISTORY'] = f'Scaled to: min=0, max=65535'
+    # Обратный перевод в ADU (шумовая модель PTC): adu = value * CALSCALE + CALZERO
+    scale = (data_max - data_min) / 65535.0 if data_max > data_min else 1.0
+    new_header['CALSCALE'] = (float(scale), 'ADU per stored unit')
+    new_header['CALZERO'] = (float(data_min), 'ADU at stored zero')
+
+    # 5. Создаем и сохраняем HDU
+    hdu = fits.PrimaryHDU(data=data_uint16, header=new_header)
+    hdul = fits.HDUList([hdu])
+
+    # 6. Маска космических лучей - отдельным расширением
+    if ccd_data.mask is not None:
+        mask_hdu = fits.ImageHDU(data=ccd_data.mask.astype(np.uint8), name='CRMASK')
+        mask_hdu.header['COMMENT'] = '1 = pixel replaced by cosmic ray rejection'
+        hdul.append(mask_hdu)
+
+    hdul.writeto(output_path, overwrite=True, output_verify='fix')
+
+
+# Мастер-кадры рабочего процесса: передаются один раз при запуске пула
+_PLANE_MASTERS = None
+
+
+def _init_plane_worker(masters):
+    global _PLANE_MASTERS
+    _PLANE_MASTERS = masters
+
+
+def calibrate_plane_data(frame, geometry, bias, dark, dark_exposure, flat):
+    """Overscan и обрезка по геометрии HDU (если есть), затем мастер-кадры"""
+    data = frame.data
+    if geometry is not None:
+        level = geometry.model(data[geometry.bias])
+        data = data[geometry.trim] - geometry.correction(level)
+    return apply_masters(data, frame.exposure_time.value, bias, dark, dark_exposure, flat)
+
+
+def _calibrate_plane(path, hdu_index, plane):
+    """Калибровка одной плоскости файла (выполняется в рабочем процессе)"""
+    frame = read_plane(path, hdu_index, plane)
+    return calibrate_plane_data(frame, *_PLANE_MASTERS[hdu_index])
+
 class CalibrationProcessor:
     def __init__(self, app):
         self.app = app  # Сохраняем ссылку на приложение
+        self.cosmic_ray_processor = CosmicRayProcessor(app)
+        # Overscan по BIASSEC/TRIMSEC: None - медиана на строку, число - порядок полинома
+        self.overscan_order = None
     
     def _get_exposure_time(self, ccd_data):
         """Извлечение времени экспозиции из CCDData"""
@@ -51,39 +166,116 @@ class CalibrationProcessor:
             except Exception:
                 return 1.0 * u.second
     
-    def calibrate_lights(self, lights, master_bias, master_dark, master_flat):
-        """Калибровка light кадров (только вычитание мастер-кадров)"""
+    def calibrate_lights(self, lights, master_bias, master_dark, master_flat,
+                         remove_cosmic_rays=False):
+        """Калибровка light кадров (вычитание мастер-кадров и, опционально, удаление космических лучей)"""
+        # Пул процессов для космических лучей живет всю серию кадров
+        if remove_cosmic_rays:
+            with self.cosmic_ray_processor:
+                return self._calibrate_lights(lights, master_bias, master_dark, master_flat, True)
+        return self._calibrate_lights(lights, master_bias, master_dark, master_flat, False)
+    
+    def prepare_masters(self, master_bias, master_dark, master_flat):
+        """
+        Массивы мастер-кадров для цикла калибровки
+        
+        Flat нормируется так же, как в ccdproc.flat_correct: деление на
+        среднее, замаскированные пиксели - 1. Неположительные пиксели flat
+        заменяются на 1% медианы.
+        
+        Returns:
+        --------
+        tuple
+            (bias, dark, экспозиция dark, нормированный flat, flat исправлен)
+        """
+        bias = np.asarray(master_bias.data, dtype=np.float64) if master_bias is not None else None
+        
+        dark = dark_exposure = None
+        if master_dark is not None:
+            dark = np.asarray(master_dark.data, dtype=np.float64)
+            dark_exposure = self._get_exposure_time(master_dark)
+        
+        flat = None
+        flat_fixed = False
+        if master_flat is not None:
+            flat_data = np.asarray(master_flat.data, dtype=np.float64)
+            mask = master_flat.mask
+            if np.any(flat_data <= 0):
+                flat_data = flat_data.copy()
+                flat_median = np.median(flat_data)
+                flat_data[flat_data <= 0] = flat_median * 0.01
+                flat_fixed = True
+                mask = None
+            flat = flat_data / flat_data.mean()
+            if mask is not None and np.any(mask):
+                flat[mask] = 1.0
+        
+        return bias, dark, dark_exposure, flat, flat_fixed
+    
+    def _calibrate_lights(self, lights, master_bias, master_dark, master_flat, remove_cosmic_rays):
+        """Калибровка серии light кадров (первая ошибка прерывает серию)"""
         calibrated_lights = []
+        for light_path, clean_ccd, error in self._iter_calibrated(
+                lights, master_bias, master_dark, master_flat, remove_cosmic_rays):
+            if error is not None:
+                raise Exception(error)
+            calibrated_lights.append(clean_ccd)
+        
+        self.app.log_command(f"Калибровка завершена: {len(calibrated_lights)} из {len(lights)} кадров")
+                
+        return calibrated_lights
+    
+    def _iter_calibrated(self, lights, master_bias, master_dark, master_flat, remove_cosmic_rays):
+        """
+        Калибровка серии light кадров по одному
         
+        Yields:
+        -------
+        tuple
+            (путь, CCDData, None) или (путь, None, сообщение об ошибке)
+        """
         # Логируем в интерфейс
         self.app.log_command(f"Начало калибровки: {len(lights)} кадров")
         if INTEGRITY_CHECKER_AVAILABLE:
             self.app.log_command("Проверка целостности: включена")
         else:
             self.app.log_command("Проверка целостности: отключена (модуль не найден)")
+        if remove_cosmic_rays:
+            self.app.log_command(
+                f"Удаление космических лучей: включено "
+                f"({self.cosmic_ray_processor.max_workers} процессов)"
+            )
         self.app.log_command("")
         
+        # Данные мастер-кадров готовятся один раз на серию, а не на каждый кадр
+        bias, dark, dark_exposure, flat, flat_fixed = self.prepare_masters(
+            master_bias, master_dark, master_flat
+        )
+        
         for i, light_path in enumerate(lights):
             try:
                 filename = os.path.basename(light_path)
                 self.app.log_command(f"Калибровка [{i+1}/{len(lights)}]: {filename}")
                 
-                # 1. Загружаем light
-                light = self.app.read_fits_with_unit(light_path)
-                calibrated = light.copy()
+                # 1. Загружаем light (легкий Frame: буфер float64 и заголовок без копий)
+                light = read_frame(light_path)
+                
+                # 1a. Overscan и обрезка (если в заголовке есть BIASSEC) - до всех этапов
+                if subtract_overscan(light, self.overscan_order):
+                    self.app.log_command(f"  - Вычтен overscan, обрезка до {light.shape}")
+                data = light.data
                 
                 # 2. Вычитаем bias (если есть)
-                if master_bias is not None:
-                    calibrated = ccdproc.subtract_bias(calibrated, master_bias)
+                if bias is not None:
+                    data -= bias
                     self.app.log_command(f"  - Вычтен Master Bias")
                 else:
                     self.app.log_command(f"  - Master Bias: нет")
                 
                 # 3. Вычитаем dark (если есть) - ВАЖНО: с масштабированием по экспозиции
-                if master_dark is not None:
+                if dark is not None:
                     # Получаем время экспозиции для light и dark
-                    light_exposure = self._get_exposure_time(light)
-                    dark_exposure = self._get_exposure_time(master_dark)
+                    light_exposure = light.exposure_time
                     
                     self.app.log_command(f"  - Время экспозиции light: {light_exposure}")
                     self.app.log_command(f"  - Время экспозиции dark: {dark_exposure}")
@@ -95,66 +287,50 @@ class CalibrationProcessor:
                         
                         if scale_factor != 1.0:
                             self.app.log_command(f"  - Масштабируем dark в {scale_factor:.2f} раз")
-                            # Масштабируем master_dark
-                            scaled_dark_data = master_dark.data * scale_factor
-                            scaled_dark = CCDData(scaled_dark_data, unit=master_dark.unit, header=master_dark.header)
-                            
-                            # Вычитаем масштабированный dark
-                            calibrated.data = calibrated.data - scaled_dark.data
+                            data -= dark * scale_factor
                         else:
                             # Если времена равны, просто вычитаем
-                            calibrated.data = calibrated.data - master_dark.data
+                            data -= dark
                     else:
                         # Если не удалось определить время, просто вычитаем без масштабирования
                         self.app.log_command(f"  - Предупреждение: не удалось определить время экспозиции, вычитаем без масштабирования")
-                        calibrated.data = calibrated.data - master_dark.data
+                        data -= dark
                     
                     self.app.log_command(f"  - Вычтен Master Dark")
                 else:
                     self.app.log_command(f"  - Master Dark: нет")
                 
-                # 4. Делим на flat (если есть)
-                if master_flat is not None:
-                    # Проверяем что flat не содержит нулей
-                    if np.any(master_flat.data <= 0):
-                        # Корректируем чтобы избежать деления на ноль
-                        flat_data = master_flat.data.copy()
-                        flat_median = np.median(flat_data)
-                        flat_data[flat_data <= 0] = flat_median * 0.01
-                        master_flat_corrected = ccdproc.CCDData(
-                            flat_data, 
-                            unit=master_flat.unit,
-                            header=master_flat.header
-                        )
-                        calibrated = ccdproc.flat_correct(calibrated, master_flat_corrected)
+                # 4. Делим на нормированный flat (если есть)
+                if flat is not None:
+                    data /= flat
+                    if flat_fixed:
                         self.app.log_command(f"  - Предупреждение: Flat содержит нули, исправлено")
-                    else:
-                        calibrated = ccdproc.flat_correct(calibrated, master_flat)
-                    
                     self.app.log_command(f"  - Применен Master Flat")
                 else:
                     self.app.log_command(f"  - Master Flat: нет")
                 
-                # 5. Убираем отрицательные значения (после вычитаний могут появиться)
-                calibrated.data = np.clip(calibrated.data, 0, None)
+                # 5. Удаляем космические лучи (если включено)
+                cr_mask = None
+                if remove_cosmic_rays:
+                    data, cr_mask = self.cosmic_ray_processor.clean_frame(data, light.header)
+                    self.app.log_command(f"  - Удалены космические лучи: {int(cr_mask.sum())} пикселей")
                 
-                # 6. Создаем чистый CCDData без маски и неопределенности
-                clean_data = calibrated.data
+                # 6. Убираем отрицательные значения (после вычитаний могут появиться)
+                light.data = np.clip(data, 0, None)
                 
-                # Создаем новый CCDData только с данными и заголовком
-                clean_ccd = CCDData(
-                    data=clean_data,
-                    unit=calibrated.unit,
-                    header=calibrated.header.copy()  # Копируем заголовок
-                )
+                # 7. CCDData создается один раз - на выходе из цикла калибровки
+                clean_ccd = light.to_ccddata(mask=cr_mask)
                 
-                # 7. Добавляем информацию о калибровке
-                self._add_calibration_metadata(clean_ccd, master_bias, master_dark, master_flat)
+                # 8. Добавляем информацию о калибровке
+                self._add_calibration_metadata(clean_ccd.header, master_bias, master_dark, master_flat)
+                if cr_mask is not None:
+                    clean_ccd.header['HISTORY'] = 'Cosmic rays removed: L.A.Cosmic (tiled)'
+                    clean_ccd.header['CRPIXELS'] = (int(cr_mask.sum()), 'Pixels flagged as cosmic rays')
                 
-                # 8. Добавляем проверку целостности (если модуль доступен)
+                # 9. Добавляем проверку целостности (если модуль доступен)
                 if INTEGRITY_CHECKER_AVAILABLE:
                     try:
-                        IntegrityChecker.add_integrity_info(
+                        _integrity_checker().add_integrity_info(
                             clean_ccd.header,
                             clean_ccd.data,
                             software_name="AstroCalibratorCH",
@@ -173,32 +349,237 @@ class CalibrationProcessor:
                     clean_ccd.header['CREATED'] = (creation_time, 'UTC time of file creation')
                     clean_ccd.header['SOFTWARE'] = ('AstroCalibratorCH', 'Software used for calibration')
                 
-                calibrated_lights.append(clean_ccd)
                 self.app.log_command(f"  Успешно калиброван")
                 self.app.log_command("")
                 
             except Exception as e:
                 error_msg = f"Ошибка калибровки {os.path.basename(light_path)}: {str(e)}"
                 self.app.log_command(f"  ОШИБКА: {error_msg}")
-                raise Exception(error_msg)
+                yield light_path, None, error_msg
+                continue
+            
+            yield light_path, clean_ccd, None
+    
+    def run_key(self, master_bias, master_dark, master_flat, remove_cosmic_rays=False):
+        """
+        Ключ параметров калибровки для журнала запусков
         
-        self.app.log_command(f"Калибровка завершена: {len(calibrated_lights)} из {len(lights)} кадров")
-                
-        return calibrated_lights
+        Мастер-кадры входят в ключ хэшем данных: с другим мастер-кадром
+        кадр калибруется заново, даже если сам light не изменился.
+        """
+        import hashlib
+        
+        masters = {}
+        for name, master in (("bias", master_bias), ("dark", master_dark), ("flat", master_flat)):
+            masters[name] = (hashlib.sha256(np.ascontiguousarray(master.data).tobytes()).hexdigest()
+                             if master is not None else None)
+        return params_key({'masters': masters, 'remove_cosmic_rays': bool(remove_cosmic_rays),
+                           'overscan_order': self.overscan_order})
+    
+    def calibrate_to_directory(self, lights, output_dir, master_bias, master_dark, master_flat,
+                               remove_cosmic_rays=False, journal=None):
+        """
+        Возобновляемая калибровка с записью в output_dir (uint16, calibrated_<имя>)
+        
+        Ошибка на кадре не прерывает серию: кадр попадает в карантин журнала.
+        С журналом кадры, уже откалиброванные с теми же мастер-кадрами (и
+        не измененные с тех пор), не пересчитываются, а кадры в карантине
+        пропускаются - повторный запуск после сбоя делает только остаток.
+        Каждый кадр пишется через временный файл и отмечается в журнале
+        сразу после записи.
+        
+        Returns:
+        --------
+        tuple
+            (пути калиброванных файлов в порядке lights, пути в карантине)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        key = self.run_key(master_bias, master_dark, master_flat, remove_cosmic_rays)
+        outputs = {}
+        quarantined = []
+        todo = []
+        for light_path in lights:
+            output_path = os.path.join(output_dir, f"calibrated_{os.path.basename(light_path)}")
+            status = journal.status('calibrate', light_path, key) if journal is not None else None
+            if status == 'done':
+                outputs[light_path] = output_path
+            elif status == 'quarantined':
+                quarantined.append(light_path)
+            else:
+                todo.append(light_path)
+        
+        if journal is not None and (outputs or quarantined):
+            self.app.log_command(f"Журнал: уже калибровано {len(outputs)}, в карантине {len(quarantined)}, "
+                                 f"осталось {len(todo)}")
+        
+        with self.cosmic_ray_processor if remove_cosmic_rays and todo else nullcontext():
+            calibrated = self._iter_calibrated(
+                todo, master_bias, master_dark, master_flat, remove_cosmic_rays
+            ) if todo else ()
+            for light_path, clean_ccd, error in calibrated:
+                output_path = os.path.join(output_dir, f"calibrated_{os.path.basename(light_path)}")
+                if error is None:
+                    try:
+                        temp_path = output_path + ".part"
+                        save_as_uint16(clean_ccd, temp_path)
+                        os.replace(temp_path, output_path)
+                    except Exception as e:
+                        error = f"Ошибка сохранения {os.path.basename(output_path)}: {str(e)}"
+                        self.app.log_command(f"  ОШИБКА: {error}")
+                if error is not None:
+                    quarantined.append(light_path)
+                    if journal is not None:
+                        journal.record_failed('calibrate', light_path, key, error)
+                    continue
+                outputs[light_path] = output_path
+                if journal is not None:
+                    journal.record_done('calibrate', light_path, key, [output_path])
+        
+        self.app.log_command(f"Калибровка завершена: {len(outputs)} из {len(lights)} кадров, "
+                             f"в карантине {len(quarantined)}")
+        return [outputs[path] for path in lights if path in outputs], quarantined
+    
+    def calibrate_planes(self, light_path, output_path, master_bias, master_dark, master_flat,
+                         remove_cosmic_rays=False, max_workers=None):
+        """
+        Потоковая калибровка MEF файла или куба плоскость за плоскостью
+        
+        Плоскости читаются по одной (memmap/HDU.section) и сразу пишутся
+        в выходной файл той же структуры (PlaneWriter, float32), поэтому
+        в памяти не бывает всего файла. Без удаления космических лучей
+        плоскости считаются параллельно в пуле процессов - по одной на
+        процесс, с ограниченным числом плоскостей в работе. Overscan
+        вычитается и плоскости обрезаются по BIASSEC/TRIMSEC своего HDU
+        (как в calibrate_lights), в выходном файле HDU уже обрезанной
+        формы. Мастер-кадр применяется к плоскостям своей формы (мастер
+        одного усилителя к расширениям другого размера не применяется);
+        мастер-кадр, не подходящий ни к одному HDU, - ошибка (ValueError).
+        Хэш целостности записывается в каждый HDU.
+        
+        Returns:
+        --------
+        int
+            Число откалиброванных плоскостей
+        """
+        filename = os.path.basename(light_path)
+        hdus = list_hdus(light_path)
+        total = sum(hdu['planes'] for hdu in hdus)
+        self.app.log_command(f"Калибровка по плоскостям: {filename} "
+                             f"({len([h for h in hdus if h['planes']])} HDU, {total} плоскостей)")
+        
+        bias, dark, dark_exposure, flat, flat_fixed = self.prepare_masters(
+            master_bias, master_dark, master_flat
+        )
+        if flat_fixed:
+            self.app.log_command(f"  - Предупреждение: Flat содержит нули, исправлено")
+        dark_seconds = dark_exposure.value if dark_exposure is not None else None
+        
+        # Геометрия overscan и мастер-кадры для каждого HDU: только совпадающие
+        # по форме (после обрезки) плоскости
+        masters = {}
+        output_hdus = []
+        used = set()
+        for hdu in hdus:
+            if not hdu['planes']:
+                output_hdus.append(hdu)
+                continue
+            # Заголовок плоскости как у read_plane: первичный + расширение
+            header = hdu['header'] if hdu['index'] == 0 else hdus[0]['header'] + hdu['header']
+            geometry = geometry_for(header, hdu['shape'][-2:], self.overscan_order)
+            plane_shape = geometry.trimmed_shape if geometry is not None else hdu['shape'][-2:]
+            matched = [m if m is not None and m.shape == plane_shape else None
+                       for m in (bias, dark, flat)]
+            used.update(name for name, m in zip(("Bias", "Dark", "Flat"), matched) if m is not None)
+            skipped = [name for name, m, applied in zip(("Bias", "Dark", "Flat"), (bias, dark, flat), matched)
+                       if m is not None and applied is None]
+            if skipped:
+                self.app.log_command(f"  - HDU {hdu['name'] or hdu['index']}: размер {plane_shape} "
+                                     f"не совпадает с мастер-кадрами ({', '.join(skipped)}), они не применяются")
+            masters[hdu['index']] = (geometry, matched[0], matched[1], dark_seconds, matched[2])
+            output_hdus.append(self._trimmed_hdu(hdu, geometry))
+        
+        unused = [name for name, m in zip(("Bias", "Dark", "Flat"), (bias, dark, flat))
+                  if m is not None and name not in used]
+        if unused:
+            shapes = sorted({h['shape'][-2:] if masters[h['index']][0] is None
+                             else masters[h['index']][0].trimmed_shape for h in hdus if h['planes']})
+            raise ValueError(f"{filename}: мастер-кадры ({', '.join(unused)}) не совпадают по размеру "
+                             f"ни с одним HDU (плоскости {shapes})")
+        if any(m[0] is not None for m in masters.values()):
+            self.app.log_command("  - Вычтен overscan, обрезка по TRIMSEC")
+            if not output_hdus[0]['planes']:
+                # Секции, унаследованные расширениями от первичного заголовка, уже применены
+                output_hdus[0] = dict(output_hdus[0], header=output_hdus[0]['header'].copy())
+                self._rename_applied(output_hdus[0]['header'])
+        
+        tasks = [(hdu['index'], plane) for hdu in hdus for plane in plane_indices(hdu['shape'])]
+        
+        def update_header(header):
+            import datetime
+            self._add_calibration_metadata(header, master_bias, master_dark, master_flat)
+            creation_time = datetime.datetime.utcnow().isoformat(timespec='seconds')
+            header['CREATED'] = (creation_time, 'UTC time of file creation')
+            header['SOFTWARE'] = ('AstroCalibratorCH', 'Software used for calibration')
+        
+        workers = 1 if remove_cosmic_rays else min(get_worker_count(max_workers), max(len(tasks), 1))
+        with PlaneWriter(output_path, output_hdus, update_header=update_header) as writer:
+            if workers > 1:
+                self._calibrate_planes_parallel(light_path, tasks, masters, writer, workers)
+            else:
+                with self.cosmic_ray_processor if remove_cosmic_rays else nullcontext():
+                    for hdu_index, plane in tasks:
+                        frame = read_plane(light_path, hdu_index, plane)
+                        data = calibrate_plane_data(frame, *masters[hdu_index])
+                        if remove_cosmic_rays:
+                            data, _ = self.cosmic_ray_processor.clean_frame(data, frame.header)
+                        writer.write(data)
+        
+        self.app.log_command(f"  Успешно калиброван: {len(tasks)} плоскостей -> {os.path.basename(output_path)}")
+        return len(tasks)
+    
+    @staticmethod
+    def _trimmed_hdu(hdu, geometry):
+        """Описание выходного HDU после обрезки (форма и заголовок с примененными секциями)"""
+        if geometry is None:
+            return hdu
+        header = hdu['header'].copy()
+        mark_applied(header, geometry)
+        return dict(hdu, shape=tuple(hdu['shape'][:-2]) + geometry.trimmed_shape, header=header)
+    
+    @staticmethod
+    def _rename_applied(header):
+        """BIASSEC/TRIMSEC -> OVSCSEC/TRIMMED без сдвига WCS (для первичного HDU без данных)"""
+        for key, applied in APPLIED_KEYS.items():
+            if key in header:
+                header[applied] = (header[key], f'{key} applied by overscan stage')
+                del header[key]
+    
+    def _calibrate_planes_parallel(self, light_path, tasks, masters, writer, workers):
+        """Плоскости в пуле процессов; запись строго по порядку"""
+        window = 2 * workers
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_plane_worker,
+                                 initargs=(masters,)) as executor:
+            pending = []
+            for hdu_index, plane in tasks:
+                pending.append(executor.submit(_calibrate_plane, light_path, hdu_index, plane))
+                if len(pending) >= window:
+                    writer.write(pending.pop(0).result())
+            for future in pending:
+                writer.write(future.result())
     
-    def _add_calibration_metadata(self, ccd_data, master_bias, master_dark, master_flat):
+    def _add_calibration_metadata(self, header, master_bias, master_dark, master_flat):
         """Добавляет метаданные о калибровке в заголовок"""
         # Добавляем ASCII-совместимые комментарии в заголовок
-        ccd_data.header['HISTORY'] = 'Calibration: bias, dark, flat correction'
+        header['HISTORY'] = 'Calibration: bias, dark, flat correction'
         if master_bias is not None:
             bias_count = len(self.app.bias) if hasattr(self.app, 'bias') else '?'
-            ccd_data.header['HISTORY'] = f'Master Bias: {bias_count} frames'
+            header['HISTORY'] = f'Master Bias: {bias_count} frames'
         if master_dark is not None:
             dark_count = len(self.app.darks) if hasattr(self.app, 'darks') else '?'
-            ccd_data.header['HISTORY'] = f'Master Dark: {dark_count} frames'
+            header['HISTORY'] = f'Master Dark: {dark_count} frames'
         if master_flat is not None:
             flat_count = len(self.app.flats) if hasattr(self.app, 'flats') else '?'
-            ccd_data.header['HISTORY'] = f'Master Flat: {flat_count} frames'
+            header['HISTORY'] = f'Master Flat: {flat_count} frames'
         
         # Добавляем информацию о калибровке в ASCII-формате
         cal_status = ""
@@ -208,7 +589,7 @@ class CalibrationProcessor:
             cal_status += "D"
         if master_flat is not None:
             cal_status += "F"
-        ccd_data.header['CALSTAT'] = (cal_status, 'Calibration applied')
+        header['CALSTAT'] = (cal_status, 'Calibration applied')
     
     def verify_calibrated_image(self, filepath):
         """Проверяет целостность калиброванного изображения"""
@@ -217,7 +598,7 @@ class CalibrationProcessor:
             return None
         
         try:
-            result = IntegrityChecker.verify_file_integrity(filepath, verbose=False)
+            result = _integrity_checker().verify_file_integrity(filepath, verbose=False)
             
             if result['error']:
                 self.app.log_command(f"Ошибка проверки: {result['error']}")
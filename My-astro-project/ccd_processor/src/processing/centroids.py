@@ -0,0 +1,273 @@
+"""
+Пакетное уточнение центроидов звезд (векторизованные centroid_* из photutils)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.tiling import get_worker_count
+
+# Доступные методы: векторизованные и параллельный 2D гаусс
+CENTROID_METHODS = ('com', 'quadratic', '1dg', '2dg')
+
+
+def extract_cutouts(data, positions, box_size):
+    """
+    Вырезки вокруг звезд одним стеком
+
+    Окна кадра берутся как strided-представление (без копирования
+    кадра), из него одним индексированием собирается стек (N, k, k).
+    Вырезки у края кадра сдвигаются внутрь кадра.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray
+        Двумерный кадр (фон должен быть вычтен)
+    positions : numpy.ndarray
+        Приближенные позиции (N, 2) как (x, y)
+    box_size : int
+        Размер вырезки (нечетный)
+
+    Returns:
+    --------
+    tuple
+        (стек вырезок (N, k, k), начала вырезок в кадре (N, 2) как (x0, y0))
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    half = box_size // 2
+    ny, nx = data.shape
+    if ny < box_size or nx < box_size:
+        raise ValueError(f"Кадр {data.shape} меньше вырезки {box_size}x{box_size}")
+
+    x0 = np.clip(np.rint(positions[:, 0]).astype(np.int64) - half, 0, nx - box_size)
+    y0 = np.clip(np.rint(positions[:, 1]).astype(np.int64) - half, 0, ny - box_size)
+
+    windows = sliding_window_view(data, (box_size, box_size))
+    cutouts = windows[y0, x0]
+    return cutouts, np.column_stack((x0, y0))
+
+
+def centroid_com_batch(cutouts):
+    """Центр масс для стека вырезок, (N, 2) как (x, y)"""
+    cutouts = np.asarray(cutouts, dtype=np.float64)
+    n, ky, kx = cutouts.shape
+    total = cutouts.sum(axis=(1, 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = cutouts.sum(axis=1) @ np.arange(kx) / total
+        y = cutouts.sum(axis=2) @ np.arange(ky) / total
+    return np.column_stack((x, y))
+
+
+def centroid_quadratic_batch(cutouts, fit_boxsize=5):
+    """
+    Вершина 2D квадратичной поверхности вокруг максимума (как centroid_quadratic)
+
+    Матрица МНК одинакова для всех звезд, поэтому ее псевдообратная
+    считается один раз, а коэффициенты для всего стека - одним умножением.
+    """
+    cutouts = np.asarray(cutouts, dtype=np.float64)
+    n, ky, kx = cutouts.shape
+    half = fit_boxsize // 2
+
+    # Положение максимума, сдвинутое так, чтобы окно фита было внутри вырезки
+    peak = np.argmax(cutouts.reshape(n, -1), axis=1)
+    py = np.clip(peak // kx, half, ky - half - 1)
+    px = np.clip(peak % kx, half, kx - half - 1)
+
+    offsets = np.arange(-half, half + 1)
+    rows = py[:, None, None] + offsets[None, :, None]
+    cols = px[:, None, None] + offsets[None, None, :]
+    boxes = cutouts[np.arange(n)[:, None, None], rows, cols].reshape(n, -1)
+
+    # f(x, y) = c0 + c1 x + c2 y + c3 x^2 + c4 xy + c5 y^2 в локальных координатах окна
+    yy, xx = np.meshgrid(offsets, offsets, indexing='ij')
+    xx, yy = xx.ravel(), yy.ravel()
+    design = np.column_stack((np.ones_like(xx), xx, yy, xx ** 2, xx * yy, yy ** 2))
+    c = boxes @ np.linalg.pinv(design).T
+
+    det = 4 * c[:, 3] * c[:, 5] - c[:, 4] ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = (c[:, 4] * c[:, 2] - 2 * c[:, 5] * c[:, 1]) / det
+        dy = (c[:, 4] * c[:, 1] - 2 * c[:, 3] * c[:, 2]) / det
+
+    # Седловая точка, минимум или вершина за пределами окна - фит не удался
+    bad = (det <= 0) | (c[:, 3] >= 0) | (np.abs(dx) > half) | (np.abs(dy) > half)
+    dx[bad] = np.nan
+    dy[bad] = np.nan
+    return np.column_stack((px + dx, py + dy))
+
+
+def _solve_batch(lhs, rhs):
+    """
+    Решение стека систем (N, 4, 4) x = (N, 4)
+
+    Если хотя бы одна система вырождена, np.linalg.solve бросает
+    LinAlgError на весь стек - тогда системы решаются по одной,
+    и NaN получает только шаг вырожденной системы.
+    """
+    try:
+        return np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        steps = np.full(rhs.shape, np.nan)
+        for i in range(len(lhs)):
+            try:
+                steps[i] = np.linalg.solve(lhs[i], rhs[i])
+            except np.linalg.LinAlgError:
+                pass
+        return steps
+
+
+def _gaussian_1d_batch(profiles, iterations=20):
+    """
+    Подгонка c + A exp(-(x - mu)^2 / (2 s^2)) ко всем профилям сразу
+
+    Модель - Const1D + Gaussian1D, как в photutils centroid_1dg:
+    постоянная составляющая поглощает остаток фона в маргинальном
+    распределении (сумма по строкам или столбцам вырезки), который
+    иначе тянет центр к середине вырезки. Пакетный метод
+    Левенберга-Марквардта: якобианы и нормальные уравнения 4x4
+    формируются для всех профилей одновременно и решаются одним
+    вызовом np.linalg.solve. Начальное приближение - минимум профиля
+    и моменты профиля над ним, как в photutils. Профиль с вырожденной
+    системой или без пика (амплитуда <= 0) дает NaN.
+    """
+    profiles = np.asarray(profiles, dtype=np.float64)
+    n, size = profiles.shape
+    x = np.arange(size, dtype=np.float64)
+
+    offset = profiles.min(axis=1)
+    above = profiles - offset[:, None]
+    total = above.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu = above @ x / total
+        sigma = np.sqrt(np.abs((above * (x[None, :] - mu[:, None]) ** 2).sum(axis=1) / total))
+    amplitude = above.max(axis=1)
+    params = np.column_stack((amplitude, mu, np.clip(np.nan_to_num(sigma, nan=1.0), 0.3, size), offset))
+    params[:, 1] = np.clip(np.nan_to_num(params[:, 1], nan=size / 2.0), 0, size - 1)
+    damping = np.full(n, 1e-3)
+    failed = np.zeros(n, dtype=bool)
+
+    def residuals(p):
+        z = (x[None, :] - p[:, 1:2]) / p[:, 2:3]
+        gauss = np.exp(-0.5 * z ** 2)
+        return profiles - (p[:, 0:1] * gauss + p[:, 3:4]), gauss, z
+
+    r, gauss, z = residuals(params)
+    cost = (r ** 2).sum(axis=1)
+    for _ in range(iterations):
+        peak = params[:, 0:1] * gauss
+        jac = np.stack((
+            gauss,
+            peak * z / params[:, 2:3],
+            peak * z ** 2 / params[:, 2:3],
+            np.ones_like(gauss),
+        ), axis=2)
+        jtj = jac.transpose(0, 2, 1) @ jac
+        jtr = (jac.transpose(0, 2, 1) @ r[:, :, None])[:, :, 0]
+        lhs = jtj + damping[:, None, None] * (jtj * np.eye(4))
+        step = _solve_batch(lhs + 1e-12 * np.eye(4), jtr)
+        failed |= ~np.all(np.isfinite(step), axis=1)
+        step[failed] = 0.0
+        trial = params + step
+        trial[:, 2] = np.abs(trial[:, 2]) + 1e-6
+        r_new, gauss_new, z_new = residuals(trial)
+        cost_new = (r_new ** 2).sum(axis=1)
+
+        better = (cost_new < cost) & ~failed
+        params[better] = trial[better]
+        r[better], gauss[better], z[better] = r_new[better], gauss_new[better], z_new[better]
+        cost[better] = cost_new[better]
+        damping = np.where(better, damping * 0.3, damping * 10.0)
+
+    return np.where(failed | ~(params[:, 0] > 0), np.nan, params[:, 1])
+
+
+def centroid_1dg_batch(cutouts):
+    """Гауссианы по маргинальным распределениям x и y (как centroid_1dg)"""
+    cutouts = np.asarray(cutouts, dtype=np.float64)
+    x = _gaussian_1d_batch(cutouts.sum(axis=1))
+    y = _gaussian_1d_batch(cutouts.sum(axis=2))
+    n, ky, kx = cutouts.shape
+    bad = (x < 0) | (x > kx - 1) | (y < 0) | (y > ky - 1)
+    x[bad] = np.nan
+    y[bad] = np.nan
+    return np.column_stack((x, y))
+
+
+def _centroid_2dg(cutout):
+    """2D гаусс для одной вырезки (выполняется в рабочем процессе)"""
+    from photutils.centroids import centroid_2dg
+    try:
+        return np.asarray(centroid_2dg(cutout), dtype=np.float64)
+    except Exception:
+        return np.array([np.nan, np.nan])
+
+
+class CentroidProcessor:
+    """
+    Уточнение позиций тысяч звезд на кадре
+
+    Вырезки всех звезд собираются в один стек, центр масс, квадратичный
+    фит и 1D гауссианы считаются векторно по всему стеку. Подгонка 2D
+    гауссианы (centroid_2dg) не векторизуется и выполняется в пуле
+    процессов - как отдельный метод и как запасной вариант для звезд,
+    на которых векторный фит не сошелся.
+    """
+
+    def __init__(self, app, box_size=11, max_workers=None):
+        self.app = app
+        self.box_size = box_size | 1  # размер вырезки всегда нечетный
+        self.max_workers = get_worker_count(max_workers)
+
+    def _centroid_2dg_parallel(self, cutouts):
+        """2D гауссианы для стека вырезок в пуле процессов"""
+        if len(cutouts) == 0:
+            return np.empty((0, 2))
+        if len(cutouts) < 2 * self.max_workers:
+            return np.array([_centroid_2dg(c) for c in cutouts]).reshape(-1, 2)
+        chunksize = max(1, len(cutouts) // (4 * self.max_workers))
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(_centroid_2dg, list(cutouts), chunksize=chunksize))
+        return np.array(results).reshape(-1, 2)
+
+    def centroids(self, data, positions, method='com', fallback=True):
+        """
+        Уточненные позиции звезд в координатах кадра
+
+        Parameters:
+        -----------
+        data : numpy.ndarray
+            Кадр с вычтенным фоном
+        positions : numpy.ndarray
+            Приближенные позиции (N, 2) как (x, y)
+        method : str
+            'com', 'quadratic', '1dg' или '2dg'
+        fallback : bool
+            Уточнять 2D гауссианой звезды, где векторный фит не сошелся
+
+        Returns:
+        --------
+        numpy.ndarray
+            Позиции (N, 2); NaN - центроид найти не удалось
+        """
+        if method not in CENTROID_METHODS:
+            raise ValueError(f"Неизвестный метод центроида: {method}")
+
+        cutouts, origins = extract_cutouts(data, positions, self.box_size)
+        if method == 'com':
+            local = centroid_com_batch(cutouts)
+        elif method == 'quadratic':
+            local = centroid_quadratic_batch(cutouts)
+        elif method == '1dg':
+            local = centroid_1dg_batch(cutouts)
+        else:
+            local = self._centroid_2dg_parallel(cutouts)
+
+        if fallback and method != '2dg':
+            failed = ~np.all(np.isfinite(local), axis=1)
+            if np.any(failed):
+                local[failed] = self._centroid_2dg_parallel(cutouts[failed])
+
+        return local + origins
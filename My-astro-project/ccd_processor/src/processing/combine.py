@@ -0,0 +1,416 @@
+"""
+Комбинирование стека кадров полосами строк с ограничением памяти
+"""
+
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.nddata import CCDData, StdDevUncertainty
+
+from utils.mef import merged_header
+from utils.tiling import get_worker_count
+
+COMBINE_METHODS = ('average', 'median')
+CLIP_METHODS = (None, 'sigma', 'winsorize')
+
+
+class ArrayBandSource:
+    """Источник полос из кадров, уже загруженных в память"""
+
+    def __init__(self, arrays):
+        self.arrays = [np.asarray(a) for a in arrays]
+        if not self.arrays:
+            raise ValueError("Нет кадров для комбинирования")
+        self.shape = self.arrays[0].shape
+        for array in self.arrays:
+            if array.shape != self.shape:
+                raise ValueError(f"Размеры кадров не совпадают: {array.shape} и {self.shape}")
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def read(self, rows, out=None):
+        """Стек (n, h, nx) для диапазона строк rows"""
+        if out is None:
+            out = np.empty((len(self), rows.stop - rows.start, self.shape[1]), dtype=np.float32)
+        for i, array in enumerate(self.arrays):
+            out[i] = array[rows]
+        return out
+
+    def close(self):
+        pass
+
+
+class FitsBandSource:
+    """
+    Источник полос из FITS файлов через memmap
+
+    Масштабирование BZERO/BSCALE применяется к каждой полосе отдельно,
+    поэтому ни один кадр целиком в память не читается. hdu=None -
+    первый HDU с 2D изображением (для MEF с пустым первичным HDU).
+    to_adu=True - значения дополнительно переводятся в ADU по
+    CALSCALE/CALZERO кадра (ptc.data_scale): калиброванные кадры
+    save_as_uint16 растянуты каждый по своему диапазону, и без перевода
+    стек смешивал бы кадры в разных единицах.
+    """
+
+    def __init__(self, file_paths, hdu=0, to_adu=False):
+        if not file_paths:
+            raise ValueError("Нет кадров для комбинирования")
+        self.file_paths = list(file_paths)
+        self._hduls = []
+        self._indices = []
+        self._arrays = []
+        self._scaling = []
+        try:
+            for path in self.file_paths:
+                hdul = fits.open(path, memmap=True, do_not_scale_image_data=True)
+                self._hduls.append(hdul)
+                index = hdu
+                if index is None:
+                    index = next((i for i, h in enumerate(hdul)
+                                  if h.is_image and h.header.get('NAXIS', 0) == 2), 0)
+                header = hdul[index].header
+                self._indices.append(index)
+                self._arrays.append(hdul[index].data)
+                bscale, bzero = header.get('BSCALE', 1.0), header.get('BZERO', 0.0)
+                if to_adu:
+                    # adu = (raw * BSCALE + BZERO) * CALSCALE + CALZERO - одно линейное преобразование
+                    from .ptc import data_scale
+                    scale, zero = data_scale(merged_header(hdul, hdul[index]))
+                    bscale, bzero = bscale * scale, bzero * scale + zero
+                self._scaling.append((bscale, bzero))
+        except Exception:
+            self.close()
+            raise
+        self.shape = self._arrays[0].shape
+        for path, array in zip(self.file_paths, self._arrays):
+            if array is None or array.shape != self.shape:
+                self.close()
+                raise ValueError(f"Размер кадра {path} не совпадает с {self.shape}")
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def header(self, index=0):
+        """
+        Заголовок кадра (копия) - того HDU, из которого читаются данные
+
+        Для расширения MEF - первичный заголовок плюс заголовок
+        расширения (как read_frame), так что BIASSEC, SATURATE и т.п.
+        берутся у данных, а общие ключи - из первичного.
+        """
+        hdul = self._hduls[index]
+        return merged_header(hdul, hdul[self._indices[index]]).copy()
+
+    def read(self, rows, out=None):
+        """Стек (n, h, nx) для диапазона строк rows"""
+        if out is None:
+            out = np.empty((len(self), rows.stop - rows.start, self.shape[1]), dtype=np.float32)
+        for i, (array, (bscale, bzero)) in enumerate(zip(self._arrays, self._scaling)):
+            out[i] = array[rows]
+            if bscale != 1.0:
+                out[i] *= bscale
+            if bzero != 0.0:
+                out[i] += bzero
+        return out
+
+    def read_window(self, index, window):
+        """Окно кадра index (кортеж срезов, можно с шагом) в float64 с масштабированием"""
+        data = np.array(self._arrays[index][window], dtype=np.float64)
+        bscale, bzero = self._scaling[index]
+        if bscale != 1.0:
+            data *= bscale
+        if bzero != 0.0:
+            data += bzero
+        return data
+
+    def close(self):
+        for hdul in self._hduls:
+            hdul.close()
+        self._hduls = []
+        self._arrays = []
+
+
+def band_height(n_frames, width, mem_limit, dtype=np.float32, memory_factor=3.0):
+    """Число строк в полосе, чтобы стек с рабочими копиями уложился в mem_limit"""
+    bytes_per_row = n_frames * width * np.dtype(dtype).itemsize * memory_factor
+    return max(1, int(mem_limit // bytes_per_row))
+
+
+# mad_std = MAD / Phi^-1(3/4), как astropy.stats.mad_std
+MAD_TO_STD = 1.482602218505602
+
+
+def to_pixels(stack):
+    """
+    Стек (n, h, nx) в порядке пикселей (h, nx, n)
+
+    Ядро работает вдоль последней непрерывной оси: partition и sort по
+    ней в несколько раз быстрее, чем с шагом через весь кадр по оси 0.
+    """
+    return np.ascontiguousarray(np.moveaxis(stack, 0, -1))
+
+
+def nan_median(pixels, overwrite_input=False):
+    """
+    Медиана вдоль последней оси, NaN - замаскированное значение
+
+    Без NaN - np.partition по верхней средней позиции (нижняя - максимум
+    левой части), с NaN - сортировка (NaN уходят в конец) и выбор
+    средних элементов по числу конечных значений каждого пикселя. Для
+    пикселя без данных - NaN. Совпадает с np.nanmedian без его
+    медленного пути для массивов с NaN. overwrite_input=True -
+    переупорядочить временный массив на месте, без копии.
+    """
+    n = pixels.shape[-1]
+    nan = np.isnan(pixels)
+    if not nan.any():
+        hi = n // 2
+        part = pixels if overwrite_input else pixels.copy()
+        part.partition(hi, axis=-1)
+        if n % 2:
+            return part[..., hi].copy()
+        return (part[..., :hi].max(axis=-1) + part[..., hi]) / 2
+
+    ordered = pixels if overwrite_input else pixels.copy()
+    ordered.sort(axis=-1)
+    count = n - np.count_nonzero(nan, axis=-1)
+    lo = np.maximum((count - 1) // 2, 0)[..., None]
+    hi = (count // 2)[..., None]
+    median = (np.take_along_axis(ordered, lo, axis=-1)[..., 0] +
+              np.take_along_axis(ordered, np.minimum(hi, n - 1), axis=-1)[..., 0]) / 2
+    median[count == 0] = np.nan
+    return median
+
+
+def _center(pixels, center):
+    if center == 'median':
+        return nan_median(pixels)
+    if center == 'mean':
+        return np.mean(pixels, axis=-1, where=np.isfinite(pixels))
+    raise ValueError(f"Неизвестная функция центра: {center}")
+
+
+def _deviation(pixels, center_values, dev):
+    if dev == 'mad_std':
+        return MAD_TO_STD * nan_median(np.abs(pixels - center_values[..., None]), True)
+    if dev == 'std':
+        return np.std(pixels, axis=-1, where=np.isfinite(pixels))
+    raise ValueError(f"Неизвестная функция разброса: {dev}")
+
+
+def clip_pixels(pixels, clip='sigma', low=3.0, high=3.0, center='median', dev='mad_std', maxiters=1):
+    """
+    Отбраковка выбросов на месте в порядке пикселей (кадры - последняя ось)
+
+    Границы те же, что у astropy sigma_clip: center - low*dev и
+    center + high*dev (строго), но без маскированных массивов: медиана и
+    MAD считаются через partition, отброшенные значения сразу
+    становятся NaN. maxiters > 1 (или None - до сходимости) повторяет
+    отбраковку по оставшимся значениям.
+    """
+    if clip is None:
+        return pixels
+    if clip not in CLIP_METHODS:
+        raise ValueError(f"Неизвестный метод отбраковки: {clip}")
+
+    below = above = None
+    iteration = 0
+    with warnings.catch_warnings():
+        # Пиксели без данных (все NaN) дают NaN без предупреждений
+        warnings.simplefilter('ignore')
+        while maxiters is None or iteration < maxiters:
+            iteration += 1
+            center_values = _center(pixels, center)
+            deviation = _deviation(pixels, center_values, dev)
+            new_below = pixels < (center_values - low * deviation)[..., None]
+            new_above = pixels > (center_values + high * deviation)[..., None]
+            outliers = new_below | new_above
+            if not outliers.any():
+                break
+            pixels[outliers] = np.nan
+            if clip == 'winsorize':
+                below = new_below if below is None else below | new_below
+                above = new_above if above is None else above | new_above
+
+    if below is not None:
+        # Выброс снизу меньше всех оставшихся значений пикселя, сверху - больше
+        lower = np.fmin.reduce(pixels, axis=-1)[..., None]
+        upper = np.fmax.reduce(pixels, axis=-1)[..., None]
+        np.copyto(pixels, np.broadcast_to(lower, pixels.shape), where=below)
+        np.copyto(pixels, np.broadcast_to(upper, pixels.shape), where=above)
+    return pixels
+
+
+def combine_pixels(pixels, method='average', with_uncertainty=False):
+    """
+    Комбинирование вдоль последней оси с игнорированием NaN
+
+    Returns:
+    --------
+    tuple
+        (комбинированная полоса, неопределенность или None, число кадров на пиксель)
+    """
+    if method not in COMBINE_METHODS:
+        raise ValueError(f"Неизвестный метод комбинирования: {method}")
+
+    finite = np.isfinite(pixels)
+    count = np.count_nonzero(finite, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if method == 'average':
+            # where= вместо nanmean: без копии стека с нулями вместо NaN
+            combined = np.mean(pixels, axis=-1, dtype=np.float64, where=finite)
+        else:
+            combined = nan_median(pixels)
+
+        uncertainty = None
+        if with_uncertainty:
+            if method == 'average':
+                deviation = np.std(pixels, axis=-1, dtype=np.float64, where=finite)
+            else:
+                # sigma_func ccdproc: 1.4826 * MAD
+                deviation = 1.4826 * nan_median(np.abs(pixels - combined[..., None]), True)
+            uncertainty = deviation / np.sqrt(count)
+    return combined, uncertainty, count
+
+
+def clip_stack(stack, clip='sigma', low=3.0, high=3.0, center='median', dev='mad_std', maxiters=1):
+    """
+    Отбраковка выбросов вдоль оси 0 стека на месте (NaN - замаскированный пиксель)
+
+    clip='sigma' заменяет выбросы на NaN (как sigma_clipping в
+    ccdproc.Combiner, одна итерация), clip='winsorize' - на крайние
+    не отброшенные значения того же пикселя.
+    """
+    if clip is None:
+        return stack
+    pixels = clip_pixels(to_pixels(stack), clip, low, high, center, dev, maxiters)
+    stack[...] = np.moveaxis(pixels, -1, 0)
+    return stack
+
+
+def combine_stack(stack, method='average', with_uncertainty=False):
+    """
+    Комбинирование стека вдоль оси 0 с игнорированием NaN
+
+    Returns:
+    --------
+    tuple
+        (комбинированная полоса, неопределенность или None, число кадров на пиксель)
+    """
+    return combine_pixels(to_pixels(stack), method, with_uncertainty)
+
+
+def _combine_rows(stack, method, clip, low, high, center, dev, maxiters, with_uncertainty):
+    """Отбраковка и комбинирование части полосы (выполняется в потоке)"""
+    pixels = clip_pixels(to_pixels(stack), clip, low, high, center, dev, maxiters)
+    return combine_pixels(pixels, method, with_uncertainty)
+
+
+def iter_combined_bands(source, method='average', clip='sigma', low=3.0, high=3.0,
+                        center='median', dev='mad_std', mem_limit=360e6,
+                        with_uncertainty=False, prepare=None, dtype=np.float32,
+                        maxiters=1, max_workers=None):
+    """
+    Генератор комбинированных полос строк
+
+    Parameters:
+    -----------
+    source : ArrayBandSource or FitsBandSource
+        Источник полос стека
+    prepare : callable or None
+        prepare(stack, rows) - обработка стека полосы на месте перед
+        отбраковкой (например, нормировка)
+    dtype : numpy.dtype
+        Тип буфера стека (float64 - для точного совпадения с ccdproc)
+    maxiters : int or None
+        Число итераций отбраковки (1 - как ccdproc.combine)
+    max_workers : int or None
+        Потоков на полосу: полоса делится на части по строкам, NumPy
+        (partition, sort, арифметика) отпускает GIL; каждая часть
+        переставляется в порядок пикселей (to_pixels)
+
+    Yields:
+    -------
+    tuple
+        (rows, комбинированная полоса, неопределенность или None, число кадров)
+    """
+    ny, nx = source.shape
+    height = min(ny, band_height(len(source), nx, mem_limit, dtype))
+    buffer = np.empty((len(source), height, nx), dtype=dtype)
+    workers = get_worker_count(max_workers)
+    options = (method, clip, low, high, center, dev, maxiters, with_uncertainty)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, ny, height):
+            rows = slice(start, min(start + height, ny))
+            stack = source.read(rows, out=buffer[:, :rows.stop - rows.start])
+            if prepare is not None:
+                prepare(stack, rows)
+
+            step = max(1, -(-stack.shape[1] // workers))
+            parts = list(executor.map(
+                lambda r0: _combine_rows(stack[:, r0:r0 + step], *options),
+                range(0, stack.shape[1], step)
+            ))
+            combined = np.concatenate([p[0] for p in parts])
+            uncertainty = np.concatenate([p[1] for p in parts]) if with_uncertainty else None
+            count = np.concatenate([p[2] for p in parts])
+            yield rows, combined, uncertainty, count
+
+
+def combine_to_ccd(source, header=None, unit='adu', dtype=np.float64, **kwargs):
+    """
+    Комбинирование в CCDData в памяти (для мастер-кадров)
+
+    Результат совпадает по структуре с ccdproc.combine: float64 данные,
+    StdDevUncertainty, маска пикселей без данных, NCOMBINE в заголовке.
+    """
+    data = np.empty(source.shape, dtype=np.float64)
+    uncertainty = np.empty(source.shape, dtype=np.float64)
+    mask = np.empty(source.shape, dtype=bool)
+
+    for rows, combined, band_uncertainty, count in iter_combined_bands(
+            source, with_uncertainty=True, dtype=dtype, **kwargs):
+        data[rows] = combined
+        uncertainty[rows] = band_uncertainty
+        mask[rows] = count == 0
+
+    ccd = CCDData(data, unit=unit, header=header.copy() if header is not None else None,
+                  uncertainty=StdDevUncertainty(uncertainty), mask=mask)
+    ccd.meta['NCOMBINE'] = len(source)
+    return ccd
+
+
+def combine_to_file(source, output_path, header=None, **kwargs):
+    """
+    Комбинирование с записью результата в FITS полосами (float32)
+
+    Полный результат в памяти не собирается: каждая полоса
+    дописывается в файл через StreamingHDU сразу после расчета.
+    """
+    ny, nx = source.shape
+    out_header = fits.Header()
+    out_header['SIMPLE'] = True
+    out_header['BITPIX'] = -32
+    out_header['NAXIS'] = 2
+    out_header['NAXIS1'] = nx
+    out_header['NAXIS2'] = ny
+    if header is not None:
+        for card in header.cards:
+            if card.keyword in ('SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2',
+                                'EXTEND', 'BZERO', 'BSCALE', ''):
+                continue
+            out_header.append(card)
+    out_header['NCOMBINE'] = (len(source), 'Number of combined frames')
+
+    stream = fits.StreamingHDU(output_path, out_header)
+    try:
+        for rows, combined, _, _ in iter_combined_bands(source, **kwargs):
+            stream.write(combined.astype(np.float32))
+    finally:
+        stream.close()
@@ -0,0 +1,153 @@
+"""
+Удаление космических лучей (L.A.Cosmic) по тайлам на нескольких ядрах
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.tiling import iter_tiles, get_worker_count
+
+from .ptc import noise_model
+
+
+# Ключевые слова заголовка с усилением (e-/ADU) и шумом считывания (e-)
+HEADER_KEYS = {
+    'gain': ('GAIN', 'EGAIN'),
+    'readnoise': ('RDNOISE', 'READNOIS', 'RON'),
+}
+
+
+def _header_value(header, keys):
+    """Первое положительное число среди ключевых слов заголовка"""
+    for key in keys:
+        try:
+            value = float(header[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if value > 0:
+            return value
+    return None
+
+
+def _lacosmic_tile(tile_data, params):
+    """Обработка одного тайла в рабочем процессе"""
+    # ccdproc импортируется только там, где он нужен - в рабочем процессе
+    import ccdproc
+    cleaned, mask = ccdproc.cosmicray_lacosmic(tile_data, **params)
+    return np.asarray(cleaned, dtype=np.float32), np.asarray(mask, dtype=bool)
+
+
+class CosmicRayProcessor:
+    """
+    Параллельное удаление космических лучей
+
+    Кадр режется на тайлы с перекрытием, тайлы обрабатываются
+    ccdproc.cosmicray_lacosmic в пуле процессов, из каждого тайла
+    обратно в кадр копируется только его чистая часть. Перекрытие
+    должно быть больше области влияния L.A.Cosmic (медианные фильтры
+    до 7 px и расширение маски на каждой из niter итераций), тогда
+    на границах тайлов не появляется швов.
+    """
+
+    def __init__(self, app, tile_size=1024, overlap=32, max_workers=None):
+        self.app = app
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_workers = get_worker_count(max_workers)
+        # Параметры L.A.Cosmic
+        self.params = {
+            'sigclip': 4.5,
+            'objlim': 5.0,
+            'gain': 1.0,
+            'readnoise': 6.5,
+            'satlevel': 65535.0,
+            'niter': 4,
+        }
+        self._executor = None
+        # Глубина вложенных with: пул закрывается на выходе из внешнего
+        self._depth = 0
+
+    def __enter__(self):
+        """Запуск пула процессов на всю серию кадров"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0 and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def frame_params(self, header=None):
+        """
+        Параметры L.A.Cosmic для очередного кадра
+
+        Усиление и шум считывания берутся из PTC сессии (noise_model),
+        без нее - из заголовка кадра (GAIN/EGAIN, RDNOISE/READNOIS),
+        и только если нет ни того, ни другого - из self.params.
+        Параметры, заданные в сессии (calibration['cosmic_rays']),
+        переопределяют все остальные. self.params при этом не меняется,
+        поэтому прошлые серии не влияют на следующие.
+        """
+        config = getattr(self.app, 'config', None)
+        params = dict(self.params)
+        model = noise_model(config)
+        if model is not None:
+            params.update(gain=model[0], readnoise=model[1])
+        elif header is not None:
+            for name, keys in HEADER_KEYS.items():
+                value = _header_value(header, keys)
+                if value is not None:
+                    params[name] = value
+        calibration = getattr(config, 'calibration', None) or {}
+        params.update(calibration.get('cosmic_rays') or {})
+        return params
+
+    def clean_frame(self, data, header=None, **params):
+        """
+        Удаление космических лучей из одного кадра
+
+        Parameters:
+        -----------
+        data : numpy.ndarray
+            Двумерный массив калиброванного кадра
+        header : astropy.io.fits.Header, optional
+            Заголовок кадра - источник GAIN/RDNOISE без PTC сессии
+        **params
+            Параметры cosmicray_lacosmic, переопределяющие frame_params()
+
+        Returns:
+        --------
+        tuple
+            (очищенные данные float32, булева маска космических лучей)
+        """
+        lacosmic_params = {**self.frame_params(header), **params}
+        data = np.asarray(data, dtype=np.float32)
+        tiles = list(iter_tiles(data.shape, self.tile_size, self.overlap))
+
+        cleaned = np.empty_like(data)
+        mask = np.zeros(data.shape, dtype=bool)
+
+        # Маленький кадр - обрабатываем без пула
+        if len(tiles) == 1:
+            cleaned[...], mask[...] = _lacosmic_tile(data, lacosmic_params)
+            return cleaned, mask
+
+        if self._executor is None:
+            with self:
+                return self.clean_frame(data, header, **params)
+
+        windows = [data[tile.window] for tile in tiles]
+        results = self._executor.map(
+            _lacosmic_tile, windows, [lacosmic_params] * len(windows)
+        )
+
+        # Сшиваем: из каждого тайла берем только чистую часть
+        for tile, (tile_cleaned, tile_mask) in zip(tiles, results):
+            cleaned[tile.core] = tile_cleaned[tile.inner]
+            mask[tile.core] = tile_mask[tile.inner]
+
+        return cleaned, mask
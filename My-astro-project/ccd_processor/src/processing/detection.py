@@ -0,0 +1,215 @@
+"""
+Пакетный поиск звезд (DAOStarFinder) по калиброванным кадрам
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.stats import sigma_clipped_stats
+from astropy.table import Table
+
+from utils.frame import read_frame
+from utils.tiling import iter_tiles, get_worker_count
+from .ptc import data_scale, noise_model, pixel_sigma
+
+# Колонки каталога, которые берутся из результата DAOStarFinder
+CATALOG_COLUMNS = ['sharpness', 'roundness1', 'roundness2', 'peak', 'flux', 'mag']
+
+
+def _centroid_columns(sources):
+    """Имена колонок центроида (в photutils >= 2.0 они переименованы)"""
+    if 'x_centroid' in sources.colnames:
+        return 'x_centroid', 'y_centroid'
+    return 'xcentroid', 'ycentroid'
+
+
+def _find_stars_tile(tile_data, threshold, fwhm, origin, core_shape):
+    """
+    Поиск звезд в одном тайле (выполняется в рабочем процессе)
+
+    Возвращает словарь колонок только для звезд, центроид которых лежит
+    в чистой части тайла - так звезды из зоны перекрытия не дублируются.
+    """
+    from photutils.detection import DAOStarFinder
+
+    daofind = DAOStarFinder(fwhm=fwhm, threshold=threshold)
+    sources = daofind(tile_data)
+    if sources is None or len(sources) == 0:
+        return None
+
+    x_col, y_col = _centroid_columns(sources)
+    (win_y0, win_x0), (core_y0, core_x0) = origin
+    x = np.asarray(sources[x_col], dtype=np.float64) + win_x0
+    y = np.asarray(sources[y_col], dtype=np.float64) + win_y0
+
+    # Дедупликация перекрытий: каждый пиксель принадлежит ровно одному тайлу
+    inside = ((x >= core_x0 - 0.5) & (x < core_x0 + core_shape[1] - 0.5) &
+              (y >= core_y0 - 0.5) & (y < core_y0 + core_shape[0] - 0.5))
+    if not np.any(inside):
+        return None
+
+    columns = {'x': x[inside], 'y': y[inside]}
+    for name in CATALOG_COLUMNS:
+        columns[name] = np.asarray(sources[name], dtype=np.float64)[inside]
+    return columns
+
+
+class StarDetectionProcessor:
+    """
+    Поиск звезд на всех калиброванных кадрах
+
+    Порог оценивается один раз на кадр по прореженной копии
+    (sigma_clipped_stats), затем кадр режется на тайлы с перекрытием,
+    которые обрабатываются DAOStarFinder в пуле процессов. Результаты
+    всех кадров собираются в один каталог (FITS binary table).
+
+    Если в сессии есть усиление и шум считывания (PTC), шум для порога
+    берется из модели детектора при уровне фона кадра, а не из разброса
+    прореженной копии.
+    """
+
+    def __init__(self, app, fwhm=3.0, threshold_sigma=5.0, tile_size=1024,
+                 sample_step=4, max_workers=None):
+        self.app = app
+        self.fwhm = fwhm
+        self.threshold_sigma = threshold_sigma
+        self.tile_size = tile_size
+        self.sample_step = sample_step
+        self.max_workers = get_worker_count(max_workers)
+
+    @property
+    def overlap(self):
+        """Перекрытие тайлов: больше полуширины ядра DAOStarFinder"""
+        return max(8, int(math.ceil(4 * self.fwhm)))
+
+    def estimate_background(self, data):
+        """Оценка фона и шума по прореженной копии кадра"""
+        sample = data[::self.sample_step, ::self.sample_step]
+        mean, median, std = sigma_clipped_stats(sample, sigma=3.0)
+        return float(median), float(std)
+
+    def detect_frame(self, data, executor=None, background=None, scale=(1.0, 0.0)):
+        """
+        Поиск звезд на одном кадре
+
+        Parameters:
+        -----------
+        data : numpy.ndarray
+            Двумерный массив кадра
+        executor : concurrent.futures.Executor or None
+            Пул для обработки тайлов; без него тайлы обрабатываются последовательно
+        background : BackgroundMesh or None
+            Кэшированная модель фона; без нее вычитается медиана кадра
+        scale : tuple
+            Перевод значений кадра в ADU (data_scale) для модели шума
+
+        Returns:
+        --------
+        tuple
+            (словарь колонок, медиана фона, шум)
+        """
+        data = np.asarray(data, dtype=np.float32)
+        if background is not None:
+            # Модель фона вычитается полосами, шум - по остатку
+            median = background.background_median
+            data = background.subtract(data)
+            _, std = self.estimate_background(data)
+        else:
+            median, std = self.estimate_background(data)
+            data = data - median
+        model = noise_model(getattr(self.app, 'config', None))
+        if model is not None:
+            std = float(pixel_sigma(median * scale[0] + scale[1], *model)) / scale[0]
+        threshold = self.threshold_sigma * std
+
+        tiles = list(iter_tiles(data.shape, self.tile_size, self.overlap))
+        args = []
+        for tile in tiles:
+            origin = ((tile.window[0].start, tile.window[1].start),
+                      (tile.core[0].start, tile.core[1].start))
+            core_shape = (tile.core[0].stop - tile.core[0].start,
+                          tile.core[1].stop - tile.core[1].start)
+            args.append((data[tile.window], threshold, self.fwhm, origin, core_shape))
+
+        if executor is None or len(tiles) == 1:
+            results = [_find_stars_tile(*a) for a in args]
+        else:
+            results = executor.map(_find_stars_tile, *zip(*args))
+
+        results = [r for r in results if r is not None]
+        names = ['x', 'y'] + CATALOG_COLUMNS
+        if results:
+            columns = {name: np.concatenate([r[name] for r in results]) for name in names}
+        else:
+            columns = {name: np.empty(0, dtype=np.float64) for name in names}
+        return columns, median, std
+
+    def _cached_background(self, file_path):
+        """Модель фона из кэша этапа оценки фона (если он запускался)"""
+        background_processor = getattr(self.app, 'background_processor', None)
+        if background_processor is None:
+            return None
+        return background_processor.load_mesh(file_path)
+
+    def detect_files(self, file_paths, output_path):
+        """Пакетный поиск звезд по списку файлов с записью общего каталога"""
+        if not file_paths:
+            raise ValueError("Нет калиброванных кадров для поиска звезд")
+
+        self.app.log_command(f"Поиск звезд: {len(file_paths)} кадров, "
+                             f"{self.max_workers} процессов")
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            results = []
+            for i, path in enumerate(file_paths):
+                frame = read_frame(path)
+                background = self._cached_background(path)
+                results.append(self.detect_frame(frame.data, executor, background,
+                                                 data_scale(frame.header)))
+                self.app.log_command(f"  [{i+1}/{len(file_paths)}] {os.path.basename(path)}: "
+                                     f"{len(results[-1][0]['x'])} звезд")
+
+        return self.write_catalog(file_paths, results, output_path)
+
+    def write_catalog(self, file_paths, results, output_path):
+        """
+        Запись общего каталога по результатам detect_frame для каждого кадра
+
+        Каталог содержит HDU DETECTIONS (по строке на звезду, колонка
+        frame - индекс кадра) и HDU FRAMES (по строке на кадр).
+        """
+        detections = []
+        frames = {'frame': [], 'file': [], 'n_sources': [],
+                  'background': [], 'noise': []}
+
+        for i, (path, (columns, median, std)) in enumerate(zip(file_paths, results)):
+            count = len(columns['x'])
+            columns['frame'] = np.full(count, i, dtype=np.int32)
+            detections.append(columns)
+
+            frames['frame'].append(i)
+            frames['file'].append(os.path.basename(path))
+            frames['n_sources'].append(count)
+            frames['background'].append(median)
+            frames['noise'].append(std)
+
+        names = ['frame', 'x', 'y'] + CATALOG_COLUMNS
+        catalog = Table({name: np.concatenate([d[name] for d in detections]) for name in names})
+        frames_table = Table(frames)
+
+        hdul = fits.HDUList([fits.PrimaryHDU()])
+        detections_hdu = fits.table_to_hdu(catalog)
+        detections_hdu.name = 'DETECTIONS'
+        detections_hdu.header['FWHM'] = (self.fwhm, 'DAOStarFinder FWHM, pixels')
+        detections_hdu.header['THRSIG'] = (self.threshold_sigma, 'Detection threshold, sigma')
+        hdul.append(detections_hdu)
+        frames_hdu = fits.table_to_hdu(frames_table)
+        frames_hdu.name = 'FRAMES'
+        hdul.append(frames_hdu)
+        hdul.writeto(output_path, overwrite=True)
+
+        self.app.log_command(f"Каталог: {len(catalog)} звезд сохранен в {output_path}")
+        return catalog
@@ -0,0 +1,657 @@
+"""
+Распределенный режим: координатор раздает задачи рабочим процессам
+"""
+
+import os
+import queue
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+from multiprocessing.connection import Client, Listener
+
+from utils.config import Config, MASTER_TYPES
+from utils.lazy import LazyProcessor
+
+# Ключ аутентификации рабочих (HMAC в multiprocessing.connection)
+AUTHKEY_ENV = "CCD_WORKER_AUTHKEY"
+# Скрипт запуска приложения: рабочий процесс - `main.py --worker АДРЕС`
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "main.py")
+
+
+def parse_address(address):
+    """
+    Адрес сокета: 'host:port' - TCP, путь (или 'unix:путь') - Unix-сокет
+
+    Returns:
+    --------
+    tuple
+        (адрес для multiprocessing.connection, семейство)
+    """
+    if address.startswith("unix:"):
+        return address[len("unix:"):], 'AF_UNIX'
+    if os.sep in address or ':' not in address:
+        return address, 'AF_UNIX'
+    host, port = address.rsplit(':', 1)
+    return (host or '127.0.0.1', int(port)), 'AF_INET'
+
+
+def format_address(address):
+    """Адрес слушающего сокета в виде строки для `main.py --worker`"""
+    if isinstance(address, tuple):
+        return f"{address[0]}:{address[1]}"
+    return f"unix:{address}"
+
+
+def advertised_host(host):
+    """
+    Адрес этой машины для рабочих вместо 0.0.0.0 (все интерфейсы)
+
+    Берется адрес интерфейса исходящего маршрута: connect() для UDP
+    ничего не отправляет, только выбирает интерфейс.
+    """
+    if host != '0.0.0.0':
+        return host
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.connect(('192.0.2.1', 9))
+            return probe.getsockname()[0]
+    except OSError:
+        return socket.gethostbyname(socket.gethostname())
+
+
+# Задачи рабочего процесса: имя -> функция(context, *args)
+
+def _calibrate_task(context, light_path, output_path):
+    """Калибровка одного кадра и запись uint16 FITS (через временный файл)"""
+    from .calibration import save_as_uint16
+
+    master_bias, master_dark, master_flat = context.masters
+    context.calibration_processor.overscan_order = context.options.get('overscan_order')
+    remove_cosmic_rays = context.options.get('remove_cosmic_rays', False)
+    if remove_cosmic_rays:
+        context.keep_cosmic_ray_pool()
+    calibrated = context.calibration_processor.calibrate_lights(
+        [light_path], master_bias, master_dark, master_flat,
+        remove_cosmic_rays=remove_cosmic_rays
+    )[0]
+    temp_path = output_path + ".part"
+    save_as_uint16(calibrated, temp_path)
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+def _detect_task(context, path, params):
+    """Поиск звезд на одном кадре: (колонки, фон, шум)"""
+    from utils.frame import read_frame
+
+    processor = context.detection_processor
+    for name, value in params.items():
+        setattr(processor, name, value)
+    from .ptc import data_scale
+
+    frame = read_frame(path)
+    return processor.detect_frame(frame.data, None, processor._cached_background(path),
+                                  data_scale(frame.header))
+
+
+def _photometry_task(context, path, plan_key, positions, shape, params):
+    """Фотометрия звезд на одном кадре: (суммы в апертурах, фон, экспозиция)"""
+    processor = context.photometry_processor
+    plan = context.plans.get(plan_key)
+    if plan is None:
+        for name, value in params.items():
+            setattr(processor, name, value)
+        # План (индексы и веса апертур) строится один раз на серию
+        context.plans = {plan_key: processor.prepare(positions, shape)}
+        plan = context.plans[plan_key]
+    data, exptime, scale = processor._read_frame(path)
+    aperture_sum, bkg_mean = processor.measure_frame(data, plan)
+    return aperture_sum, bkg_mean, exptime, scale
+
+
+TASKS = {
+    'calibrate': _calibrate_task,
+    'detect': _detect_task,
+    'photometry': _photometry_task,
+}
+
+
+class WorkerContext:
+    """
+    Окружение рабочего процесса вместо CCDProcessorApp
+
+    Процессоры те же, что у приложения, и создаются при первой задаче
+    своего типа. Мастер-кадры загружаются один раз при подключении
+    (и заново, только если координатор сменил их), а пул процессов
+    для космических лучей открывается при первой задаче с ними и живет
+    до отключения (как в живом режиме), поэтому рабочий остается
+    "прогретым" между задачами и между запусками этапов.
+    """
+
+    calibration_processor = LazyProcessor('processing.calibration', 'CalibrationProcessor')
+    detection_processor = LazyProcessor('processing.detection', 'StarDetectionProcessor')
+    background_processor = LazyProcessor('processing.background', 'BackgroundProcessor')
+    photometry_processor = LazyProcessor('processing.photometry', 'PhotometryProcessor')
+
+    def __init__(self, verbose=False):
+        self.config = Config()
+        self.verbose = verbose
+        self.masters = (None, None, None)
+        self.options = {}
+        self.plans = {}
+        self._resources = ExitStack()
+        self._cosmic_ray_pool = False
+
+    @property
+    def bias(self):
+        return self.config.bias
+
+    @property
+    def darks(self):
+        return self.config.darks
+
+    @property
+    def flats(self):
+        return self.config.flats
+
+    def log_command(self, message):
+        if self.verbose:
+            print(message, flush=True)
+
+    def keep_cosmic_ray_pool(self):
+        """Пул процессов для космических лучей на все задачи рабочего"""
+        if not self._cosmic_ray_pool:
+            self._resources.enter_context(self.calibration_processor.cosmic_ray_processor)
+            self._cosmic_ray_pool = True
+
+    def close(self):
+        """Закрытие пулов процессов рабочего"""
+        self._resources.close()
+        self._cosmic_ray_pool = False
+
+    def initialize(self, masters, options):
+        """Мастер-кадры (пути на общей файловой системе или сами CCDData) и параметры"""
+        from astropy.nddata import CCDData
+
+        loaded = []
+        for master_type in MASTER_TYPES:
+            master = masters.get(master_type)
+            if isinstance(master, str):
+                master = CCDData.read(master, unit='adu')
+            loaded.append(master)
+        self.masters = tuple(loaded)
+        self.options = dict(options)
+        self.config.set_working_directory(options.get('working_directory', os.getcwd()))
+        for file_type in ("bias", "darks", "flats"):
+            setattr(self.config, file_type, list(options.get(file_type, [])))
+        # Параметры калибровки сессии (в том числе модель шума PTC)
+        self.config.calibration.update(options.get('calibration', {}))
+
+
+def run_worker(address, authkey=None, verbose=False):
+    """
+    Рабочий процесс: подключение к координатору и выполнение задач до команды stop
+
+    Parameters:
+    -----------
+    address : str
+        Адрес координатора ('host:port' или путь Unix-сокета)
+    authkey : bytes or None
+        Общий ключ (по умолчанию - из переменной окружения CCD_WORKER_AUTHKEY)
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV, "").encode('ascii')
+    connection_address, family = parse_address(address)
+    conn = Client(connection_address, family=family, authkey=authkey)
+    context = WorkerContext(verbose=verbose)
+    try:
+        conn.send({'type': 'hello', 'host': socket.gethostname(), 'pid': os.getpid()})
+        while True:
+            message = conn.recv()
+            if message['type'] == 'stop':
+                break
+            try:
+                if message['type'] == 'init':
+                    context.initialize(message['masters'], message['options'])
+                    conn.send({'type': 'ready'})
+                else:
+                    result = TASKS[message['kind']](context, *message['args'])
+                    conn.send({'type': 'result', 'result': result})
+            except Exception as e:
+                conn.send({'type': 'error', 'error': f"{type(e).__name__}: {e}",
+                           'traceback': traceback.format_exc()})
+    except EOFError:
+        # Координатор закрыл соединение
+        pass
+    finally:
+        context.close()
+        conn.close()
+
+
+class _Job:
+    """Задачи одного этапа: результаты по индексам и ошибки после всех повторов"""
+
+    def __init__(self, count):
+        self.results = {}
+        self.errors = {}
+        self.remaining = count
+        self.done = threading.Event()
+        if count == 0:
+            self.done.set()
+
+
+class _Task:
+    __slots__ = ('job', 'index', 'kind', 'args', 'attempts')
+
+    def __init__(self, job, index, kind, args):
+        self.job = job
+        self.index = index
+        self.kind = kind
+        self.args = args
+        self.attempts = 0
+
+
+class DistributedProcessor:
+    """
+    Координатор распределенного режима
+
+    Слушает TCP или Unix-сокет (multiprocessing.connection с общим
+    ключом), к нему подключаются рабочие процессы этой машины или
+    других машин с той же файловой системой. Этапы (калибровка, поиск
+    звезд, фотометрия) режутся на задачи по кадрам; каждый подключенный
+    рабочий берет следующую задачу из общей очереди, как только
+    освободился. Задача, завершившаяся ошибкой или потерянная вместе с
+    рабочим, возвращается в очередь до max_retries раз. Тяжелые данные
+    (мастер-кадры) передаются рабочему один раз при подключении.
+    """
+
+    def __init__(self, app, max_retries=2, task_timeout=None, connect_timeout=60.0):
+        self.app = app
+        self.max_retries = max_retries
+        self.task_timeout = task_timeout
+        self.connect_timeout = connect_timeout
+        self.address = None
+        self._local_address = None
+        self.authkey = None
+        self._listener = None
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._local_workers = []
+        self._init = {'masters': {}, 'options': {}}
+        self._init_version = 0
+
+    @property
+    def running(self):
+        return self._listener is not None
+
+    @property
+    def worker_count(self):
+        with self._lock:
+            return len(self._workers)
+
+    def start(self, address="127.0.0.1:0", local_workers=0, authkey=None):
+        """
+        Запуск координатора и (опционально) локальных рабочих
+
+        Parameters:
+        -----------
+        address : str
+            'host:port' (порт 0 - любой свободный) или путь Unix-сокета;
+            '0.0.0.0:port' - все интерфейсы, рабочим сообщается адрес машины
+        local_workers : int
+            Сколько рабочих процессов запустить на этой машине
+        authkey : bytes or None
+            Общий ключ; по умолчанию - из CCD_WORKER_AUTHKEY или случайный
+        """
+        if self.running:
+            raise RuntimeError("Координатор уже запущен")
+        if authkey is None:
+            authkey = os.environ.get(AUTHKEY_ENV, "").encode('ascii') or secrets.token_hex(16).encode('ascii')
+        self.authkey = authkey
+        listen_address, family = parse_address(address)
+        self._listener = Listener(listen_address, family=family, authkey=authkey)
+        bound = self._listener.address
+        if family == 'AF_INET':
+            # Локальные рабочие и пробуждение accept() идут через loopback
+            self._local_address = format_address(('127.0.0.1' if bound[0] == '0.0.0.0' else bound[0],
+                                                  bound[1]))
+            self.address = format_address((advertised_host(bound[0]), bound[1]))
+        else:
+            self.address = self._local_address = format_address(bound)
+        threading.Thread(target=self._accept_loop, name="coordinator-accept", daemon=True).start()
+
+        self.app.log_command(f"Распределенный режим: координатор {self.address}")
+        self.app.log_command(f"  Рабочий на другой машине: {AUTHKEY_ENV}={self.authkey.decode('ascii')} "
+                             f"python main.py --worker {self.address}")
+        if local_workers:
+            self.spawn_local_workers(local_workers)
+
+    def spawn_local_workers(self, count):
+        """Рабочие процессы на этой машине (`main.py --worker`)"""
+        env = {**os.environ, AUTHKEY_ENV: self.authkey.decode('ascii')}
+        for _ in range(count):
+            self._local_workers.append(subprocess.Popen(
+                [sys.executable, MAIN_SCRIPT, "--worker", self._local_address], env=env
+            ))
+        self.app.log_command(f"  Запущено локальных рабочих: {count}")
+
+    def stop(self):
+        """Остановка: рабочие получают stop, локальные процессы завершаются"""
+        if not self.running:
+            return
+        listener, self._listener = self._listener, None
+        # accept() в потоке приема не прерывается закрытием сокета - будим его подключением
+        connection_address, family = parse_address(self._local_address)
+        try:
+            Client(connection_address, family=family, authkey=self.authkey).close()
+        except OSError:
+            pass
+        listener.close()
+        for _ in range(self.worker_count):
+            self._tasks.put(None)
+        for process in self._local_workers:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._local_workers = []
+        self.app.log_command("Распределенный режим остановлен")
+
+    def set_masters(self, master_bias=None, master_dark=None, master_flat=None, **options):
+        """
+        Мастер-кадры и параметры для рабочих
+
+        Мастер-кадр, сохраненный в сессии и не измененный, передается
+        путем - рабочий читает его с общей файловой системы; иначе
+        передается сам CCDData. Рабочие получают новые мастер-кадры
+        перед следующей задачей, только если они изменились.
+        """
+        masters = {}
+        for master_type, master in zip(MASTER_TYPES, (master_bias, master_dark, master_flat)):
+            fingerprint = self.app.config.get_master(master_type)
+            path = getattr(master, 'file_path', None)
+            if master is not None and fingerprint is not None and path == fingerprint['path']:
+                masters[master_type] = path
+            else:
+                masters[master_type] = master
+        self._set_init(masters, {**self._session_options(), **options})
+
+    def _session_options(self):
+        """Рабочая директория и списки калибровочных файлов (для метаданных калибровки)"""
+        return {
+            'working_directory': self.app.config.working_directory,
+            'bias': list(self.app.bias),
+            'darks': list(self.app.darks),
+            'flats': list(self.app.flats),
+            'calibration': dict(self.app.config.calibration),
+        }
+
+    def _refresh_options(self):
+        """Актуальные параметры сессии без смены мастер-кадров"""
+        with self._lock:
+            masters, options = self._init['masters'], self._init['options']
+        self._set_init(masters, {**options, **self._session_options()})
+
+    def _set_init(self, masters, options):
+        init = {'masters': masters, 'options': options}
+        with self._lock:
+            if not self._same_init(init):
+                self._init = init
+                self._init_version += 1
+
+    def _same_init(self, init):
+        """Те же мастер-кадры (пути или объекты) и параметры"""
+        current = self._init
+        return (current['options'] == init['options'] and
+                all(current['masters'].get(t) is init['masters'].get(t) or
+                    (isinstance(init['masters'].get(t), str) and current['masters'].get(t) == init['masters'][t])
+                    for t in MASTER_TYPES))
+
+    def _accept_loop(self):
+        """Прием подключений рабочих: по потоку на рабочего"""
+        listener = self._listener
+        while self._listener is listener:
+            try:
+                conn = listener.accept()
+            except Exception:
+                # Listener закрыт (stop) или рабочий не прошел аутентификацию
+                if self._listener is not listener:
+                    return
+                continue
+            if self._listener is not listener:
+                conn.close()
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        """Обслуживание одного рабочего: задачи из общей очереди по одной"""
+        name = "?"
+        try:
+            hello = conn.recv()
+            name = f"{hello['host']}:{hello['pid']}"
+        except (EOFError, OSError):
+            conn.close()
+            return
+        with self._lock:
+            self._workers.add(name)
+        self.app.log_command(f"Распределенный режим: подключен рабочий {name}")
+
+        version = None
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    conn.send({'type': 'stop'})
+                    return
+                try:
+                    with self._lock:
+                        init, init_version = self._init, self._init_version
+                    if version != init_version:
+                        conn.send({'type': 'init', **init})
+                        reply = conn.recv()
+                        if reply['type'] != 'ready':
+                            raise RuntimeError(f"инициализация: {reply.get('error')}")
+                        version = init_version
+                    conn.send({'type': 'task', 'kind': task.kind, 'args': task.args})
+                    if self.task_timeout and not conn.poll(self.task_timeout):
+                        raise TimeoutError(f"нет ответа {self.task_timeout:.0f} с")
+                    reply = conn.recv()
+                except Exception as e:
+                    # Рабочий упал, завис или не смог загрузить мастер-кадры -
+                    # задача уходит другим, соединение закрывается
+                    self._fail(task, f"рабочий {name}: {e}")
+                    return
+                if reply['type'] == 'result':
+                    self._complete(task, reply['result'])
+                else:
+                    self._fail(task, reply['error'])
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self._lock:
+                self._workers.discard(name)
+            self.app.log_command(f"Распределенный режим: отключен рабочий {name}")
+
+    def _complete(self, task, result):
+        job = task.job
+        with self._lock:
+            job.results[task.index] = result
+            job.remaining -= 1
+            if job.remaining == 0:
+                job.done.set()
+
+    def _fail(self, task, error):
+        task.attempts += 1
+        if task.attempts <= self.max_retries:
+            self.app.log_command(f"  Повтор задачи {task.kind} #{task.index} "
+                                 f"({task.attempts}/{self.max_retries}): {error}")
+            self._tasks.put(task)
+            return
+        job = task.job
+        with self._lock:
+            job.errors[task.index] = error
+            job.remaining -= 1
+            if job.remaining == 0:
+                job.done.set()
+
+    def run(self, kind, args_list):
+        """
+        Выполнение задач одного типа на рабочих
+
+        Returns:
+        --------
+        tuple
+            (результаты по индексам задач, ошибки по индексам задач)
+        """
+        if not self.running:
+            raise RuntimeError("Координатор не запущен")
+        job = _Job(len(args_list))
+        for index, args in enumerate(args_list):
+            self._tasks.put(_Task(job, index, kind, tuple(args)))
+
+        idle_since = None
+        while not job.done.wait(1.0):
+            # Без рабочих задачи никто не возьмет - не ждем бесконечно
+            if self.worker_count:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > self.connect_timeout:
+                self._drain(job)
+                raise RuntimeError(f"Нет подключенных рабочих {self.connect_timeout:.0f} с")
+        return job.results, job.errors
+
+    def _drain(self, job):
+        """Удаление из очереди невыполненных задач этапа"""
+        kept = []
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None or task.job is not job:
+                kept.append(task)
+        for task in kept:
+            self._tasks.put(task)
+
+    def _log_errors(self, file_paths, errors):
+        for index, error in sorted(errors.items()):
+            self.app.log_command(f"  ❌ {os.path.basename(file_paths[index])}: {error}")
+
+    # Этапы обработки
+
+    def calibrate_files(self, lights, output_dir, master_bias=None, master_dark=None,
+                        master_flat=None, remove_cosmic_rays=False, journal=None):
+        """
+        Калибровка light кадров на рабочих
+
+        С журналом (как CalibrationProcessor.calibrate_to_directory) уже
+        откалиброванные кадры рабочим не отправляются, кадры в карантине
+        пропускаются, а кадр, задача которого не удалась после всех
+        повторов, уходит в карантин. Журнал ведет координатор: рабочий
+        только пишет файл, отметка делается по его ответу.
+
+        Returns:
+        --------
+        tuple
+            (пути калиброванных файлов в порядке lights, пути в карантине)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        key = self.app.calibration_processor.run_key(master_bias, master_dark, master_flat,
+                                                     remove_cosmic_rays)
+        outputs = {}
+        quarantined = []
+        todo = []
+        for light_path in lights:
+            output_path = os.path.join(output_dir, f"calibrated_{os.path.basename(light_path)}")
+            status = journal.status('calibrate', light_path, key) if journal is not None else None
+            if status == 'done':
+                outputs[light_path] = output_path
+            elif status == 'quarantined':
+                quarantined.append(light_path)
+            else:
+                todo.append(light_path)
+        if journal is not None and (outputs or quarantined):
+            self.app.log_command(f"Журнал: уже калибровано {len(outputs)}, в карантине {len(quarantined)}, "
+                                 f"осталось {len(todo)}")
+
+        if todo:
+            self.set_masters(master_bias, master_dark, master_flat,
+                             remove_cosmic_rays=remove_cosmic_rays,
+                             overscan_order=self.app.calibration_processor.overscan_order)
+            self.app.log_command(f"Распределенная калибровка: {len(todo)} кадров, "
+                                 f"рабочих {self.worker_count}")
+            args = [(path, os.path.join(output_dir, f"calibrated_{os.path.basename(path)}"))
+                    for path in todo]
+            results, errors = self.run('calibrate', args)
+            self._log_errors(todo, errors)
+            for index, light_path in enumerate(todo):
+                if index in results:
+                    outputs[light_path] = results[index]
+                    if journal is not None:
+                        journal.record_done('calibrate', light_path, key, [results[index]])
+                else:
+                    quarantined.append(light_path)
+                    if journal is not None:
+                        journal.record_failed('calibrate', light_path, key, errors.get(index))
+
+        self.app.log_command(f"Калибровано: {len(outputs)} из {len(lights)}, "
+                             f"в карантине {len(quarantined)}")
+        return [outputs[path] for path in lights if path in outputs], quarantined
+
+    def detect_files(self, file_paths, output_path):
+        """Поиск звезд на рабочих и запись общего каталога (как StarDetectionProcessor.detect_files)"""
+        import numpy as np
+        from .detection import CATALOG_COLUMNS
+
+        processor = self.app.detection_processor
+        params = {'fwhm': processor.fwhm, 'threshold_sigma': processor.threshold_sigma,
+                  'tile_size': processor.tile_size, 'sample_step': processor.sample_step}
+        self._refresh_options()
+        self.app.log_command(f"Распределенный поиск звезд: {len(file_paths)} кадров, "
+                             f"рабочих {self.worker_count}")
+        results, errors = self.run('detect', [(path, params) for path in file_paths])
+        self._log_errors(file_paths, errors)
+
+        # Кадр с ошибкой остается в таблице FRAMES без звезд
+        empty = {name: np.empty(0, dtype=np.float64) for name in ['x', 'y'] + CATALOG_COLUMNS}
+        ordered = [results.get(i, (dict(empty), np.nan, np.nan)) for i in range(len(file_paths))]
+        return processor.write_catalog(file_paths, ordered, output_path)
+
+    def measure_photometry(self, file_paths, positions, output_path, zero_point=0.0, reference=None):
+        """Фотометрия на рабочих (как PhotometryProcessor.process_files)"""
+        import numpy as np
+        from utils.frame import read_frame
+
+        processor = self.app.photometry_processor
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        shape = read_frame(file_paths[0]).shape
+        plan = processor.prepare(positions, shape)
+        params = {'aperture_radius': processor.aperture_radius,
+                  'annulus_radii': processor.annulus_radii, 'subpixels': processor.subpixels}
+        plan_key = secrets.token_hex(8)
+
+        self._refresh_options()
+        self.app.log_command(f"Распределенная фотометрия: {len(positions)} звезд x "
+                             f"{len(file_paths)} кадров, рабочих {self.worker_count}")
+        results, errors = self.run('photometry', [(path, plan_key, positions, shape, params)
+                                                  for path in file_paths])
+        self._log_errors(file_paths, errors)
+
+        # Кадр с ошибкой получает NaN во всех колонках
+        n_frames, n_sources = len(file_paths), len(positions)
+        aperture_sum = np.full((n_frames, n_sources), np.nan)
+        bkg_mean = np.full((n_frames, n_sources), np.nan)
+        exptime = np.full(n_frames, np.nan)
+        scale = np.tile([1.0, 0.0], (n_frames, 1))
+        for i, (frame_sum, frame_bkg, frame_exptime, frame_scale) in results.items():
+            aperture_sum[i], bkg_mean[i], exptime[i], scale[i] = frame_sum, frame_bkg, frame_exptime, frame_scale
+        return processor.save_results(file_paths, plan, aperture_sum, bkg_mean, exptime,
+                                      output_path, zero_point, reference, scale)
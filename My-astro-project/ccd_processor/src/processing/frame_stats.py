@@ -0,0 +1,182 @@
+"""
+Статистика кадров (среднее, медиана, MAD-std, min/max, насыщенные пиксели) с кэшем
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.tiling import get_worker_count
+from .combine import MAD_TO_STD, FitsBandSource
+
+# Версия расчета: входит в запись кэша, смена алгоритма делает старые записи недействительными
+STATS_VERSION = 1
+
+STATS_COLUMNS = ('mean', 'median', 'mad_std', 'min', 'max', 'saturated')
+
+
+def compute_frame_stats(file_path, saturation=65535.0, chunk_rows=256, sample_step=4):
+    """
+    Статистика кадра по полосам строк (memmap), без чтения кадра целиком
+
+    Среднее, минимум, максимум и число пикселей >= SATURATE (из
+    заголовка, иначе saturation) считаются точно по всем полосам;
+    медиана и MAD-std - по прореженной сетке sample_step x sample_step,
+    собранной из тех же полос (sample_step=1 - точно).
+
+    Returns:
+    --------
+    dict
+        mean, median, mad_std, min, max, saturated, pixels
+    """
+    source = FitsBandSource([file_path], hdu=None)
+    try:
+        ny, nx = source.shape
+        saturation = float(source.header(0).get('SATURATE', saturation))
+        total = 0.0
+        count = saturated = 0
+        low, high = np.inf, -np.inf
+        samples = []
+        for start in range(0, ny, chunk_rows):
+            band = source.read_window(0, (slice(start, min(start + chunk_rows, ny)), slice(None)))
+            finite = band[np.isfinite(band)]
+            if finite.size:
+                total += float(finite.sum())
+                count += finite.size
+                low = min(low, float(finite.min()))
+                high = max(high, float(finite.max()))
+                saturated += int(np.count_nonzero(finite >= saturation))
+            # Фаза строк сохраняется между полосами: сетка та же, что у data[::step, ::step]
+            sample = band[(-start) % sample_step::sample_step, ::sample_step]
+            samples.append(sample[np.isfinite(sample)])
+    finally:
+        source.close()
+
+    if count == 0:
+        raise ValueError("В кадре нет конечных значений")
+    sample = np.concatenate(samples)
+    median = float(np.median(sample))
+    return {
+        'mean': total / count,
+        'median': median,
+        'mad_std': MAD_TO_STD * float(np.median(np.abs(sample - median))),
+        'min': low,
+        'max': high,
+        'saturated': saturated,
+        'pixels': count,
+    }
+
+
+class FrameStatsProcessor:
+    """
+    Статистика всех загруженных кадров в фоновом пуле потоков
+
+    Результаты кэшируются в stats/frame_stats.json рабочей директории
+    по пути, времени изменения и размеру файла: повторное открытие
+    таблицы для той же серии только читает кэш, а измененный кадр
+    пересчитывается. Кадры читаются полосами через memmap, NumPy
+    отпускает GIL на чтении и редукциях, поэтому хватает потоков.
+    """
+
+    def __init__(self, app, saturation=65535.0, chunk_rows=256, sample_step=4, max_workers=None):
+        self.app = app
+        self.saturation = saturation
+        self.chunk_rows = chunk_rows
+        self.sample_step = sample_step
+        self.max_workers = get_worker_count(max_workers)
+        self._cache = None
+        self._cache_dir = None
+        self._lock = threading.Lock()
+
+    def get_cache_path(self):
+        """Файл кэша статистики"""
+        return os.path.join(self.app.config.working_directory, "stats", "frame_stats.json")
+
+    def _entries(self):
+        """Записи кэша (загружаются при первом обращении и при смене рабочей директории)"""
+        cache_path = self.get_cache_path()
+        if self._cache is None or self._cache_dir != cache_path:
+            self._cache, self._cache_dir = {}, cache_path
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self._cache
+
+    @staticmethod
+    def _stamp(file_path):
+        stat = os.stat(file_path)
+        return [stat.st_mtime_ns, stat.st_size, STATS_VERSION]
+
+    def cached(self, file_path):
+        """Статистика из кэша или None (нет записи, файл изменен или удален)"""
+        with self._lock:
+            entry = self._entries().get(os.path.abspath(file_path))
+        try:
+            if entry is not None and entry['stamp'] == self._stamp(file_path):
+                return entry['stats']
+        except OSError:
+            pass
+        return None
+
+    def missing(self, file_paths):
+        """Файлы без актуальной статистики в кэше"""
+        return [path for path in file_paths if self.cached(path) is None]
+
+    def save(self):
+        """Запись кэша (через временный файл)"""
+        cache_path = self.get_cache_path()
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with self._lock:
+            payload = json.dumps(self._entries())
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(temp_path, cache_path)
+
+    def compute(self, file_path):
+        """Статистика одного файла с записью в кэш (в памяти)"""
+        stamp = self._stamp(file_path)
+        stats = compute_frame_stats(file_path, self.saturation, self.chunk_rows, self.sample_step)
+        with self._lock:
+            self._entries()[os.path.abspath(file_path)] = {'stamp': stamp, 'stats': stats}
+        return stats
+
+    def generate(self, file_paths, cancelled=None):
+        """
+        Расчет недостающей статистики
+
+        Parameters:
+        -----------
+        cancelled : threading.Event or None
+            Остановка (окно таблицы закрыто): новые файлы не берутся
+
+        Yields:
+        -------
+        tuple
+            (путь, статистика или None при ошибке) в порядке готовности
+        """
+        file_paths = self.missing(file_paths)
+        if not file_paths:
+            return
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self.compute, path): path for path in file_paths}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    yield path, future.result()
+                except Exception as e:
+                    self.app.log_command(f"Ошибка статистики {os.path.basename(path)}: {str(e)}")
+                    yield path, None
+                if cancelled is not None and cancelled.is_set():
+                    break
+                if done % 200 == 0:
+                    self.save()
+        finally:
+            executor.shutdown(cancel_futures=True)
+            self.save()
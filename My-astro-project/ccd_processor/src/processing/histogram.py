@@ -0,0 +1,310 @@
+"""
+Гистограммы кадров на целочисленных корзинах (np.bincount) с кэшем
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from astropy.io import fits
+
+# Версия формата кэша: смена алгоритма делает старые файлы недействительными
+HISTOGRAM_VERSION = 1
+
+# 16 бит: одна корзина на каждое значение исходных данных
+HISTOGRAM_BINS = 65536
+
+# Строк на одну порцию чтения (прогресс панели обновляется после каждой)
+CHUNK_ROWS = 512
+
+
+class FrameHistogram:
+    """
+    Гистограмма кадра на фиксированном диапазоне целых корзин
+
+    Значение корзины b: zero + scale * b. Для 16-битных данных это
+    ровно одно значение АЦП на корзину (BZERO/BSCALE из заголовка),
+    поэтому процентили точные; для вещественных данных диапазон
+    фиксируется заранее (quantized_mapping), а значения за ним попадают
+    в крайние корзины. NaN и BLANK считаются отдельно (blank).
+    """
+
+    def __init__(self, zero, scale, shape, bins=HISTOGRAM_BINS):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.zero = float(zero)
+        self.scale = float(scale)
+        self.shape = tuple(shape)
+        self.rows_done = 0
+        self.blank = 0
+
+    @property
+    def complete(self):
+        return self.rows_done >= self.shape[0]
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def value(self, bins):
+        """Значения данных для номеров корзин"""
+        return self.zero + self.scale * np.asarray(bins, dtype=np.float64)
+
+    def add(self, indices, blank=0):
+        """Добавление порции номеров корзин (целые в [0, bins))"""
+        self.counts += np.bincount(indices.ravel(), minlength=len(self.counts))
+        self.blank += int(blank)
+
+    def percentile(self, q):
+        """
+        Процентили по накопленным счетчикам (без сортировки данных)
+
+        Возвращается значение корзины с нужным рангом - для 16-битных
+        данных это точная порядковая статистика кадра.
+        """
+        cumulative = np.cumsum(self.counts)
+        total = cumulative[-1]
+        if total == 0:
+            return np.full(np.shape(q), np.nan)
+        ranks = np.asarray(q, dtype=np.float64) / 100.0 * (total - 1)
+        return self.value(np.searchsorted(cumulative, ranks, side='right'))
+
+    def mean(self):
+        total = self.total
+        if total == 0:
+            return float('nan')
+        return float(self.value(np.arange(len(self.counts))) @ self.counts / total)
+
+    def snapshot(self):
+        """Копия для передачи в другой поток"""
+        copy = FrameHistogram(self.zero, self.scale, self.shape, len(self.counts))
+        copy.counts[:] = self.counts
+        copy.rows_done, copy.blank = self.rows_done, self.blank
+        return copy
+
+
+def quantized_mapping(sample, bins=HISTOGRAM_BINS, margin=0.05):
+    """
+    (zero, scale) для вещественных данных по выборке значений
+
+    Диапазон - размах выборки с запасом margin с каждой стороны,
+    поделенный на bins корзин.
+    """
+    finite = sample[np.isfinite(sample)]
+    if finite.size == 0:
+        return 0.0, 1.0
+    low, high = float(finite.min()), float(finite.max())
+    span = high - low
+    if span <= 0:
+        return low - 0.5 * (bins - 1), 1.0
+    low -= margin * span
+    return low, span * (1 + 2 * margin) / (bins - 1)
+
+
+class _Binner:
+    """Перевод немасштабированных порций данных в номера корзин"""
+
+    def __init__(self, dtype, header, sample=None):
+        self.bscale = float(header.get('BSCALE', 1.0))
+        self.bzero = float(header.get('BZERO', 0.0))
+        blank = header.get('BLANK')
+        self.kind = dtype.kind
+        self.itemsize = dtype.itemsize
+        if self.kind in 'iu' and self.itemsize == 1:
+            self.bins, self.zero, self.scale = 256, self.bzero, self.bscale
+            offset = 0 if self.kind == 'u' else 128
+        elif self.kind in 'iu' and self.itemsize == 2:
+            # int16 + 32768 -> [0, 65535]: один сдвиг знакового бита, без арифметики
+            self.bins = HISTOGRAM_BINS
+            offset = 32768 if self.kind == 'i' else 0
+            self.zero, self.scale = self.bzero - offset * self.bscale, self.bscale
+        else:
+            self.bins = HISTOGRAM_BINS
+            offset = None
+            self.zero, self.scale = quantized_mapping(self.bscale * sample + self.bzero)
+        self.offset = offset
+        self.blank_bin = (int(blank) + offset) if (blank is not None and offset is not None) else None
+
+    def __call__(self, raw):
+        """(номера корзин, число пропусков) для порции raw"""
+        if self.offset is not None:
+            if self.kind == 'i':
+                # Та же ширина и порядок байт (FITS - big-endian), знаковый бит инвертируется
+                unsigned = np.dtype(raw.dtype.str.replace('i', 'u'))
+                return raw.view(unsigned) ^ unsigned.type(1 << (8 * self.itemsize - 1)), 0
+            return raw, 0
+        data = raw.astype(np.float64) * self.bscale + self.bzero
+        finite = np.isfinite(data)
+        data = data[finite]
+        data -= self.zero
+        data /= self.scale
+        np.rint(data, out=data)
+        np.clip(data, 0, self.bins - 1, out=data)
+        return data.astype(np.intp), finite.size - data.size
+
+    def finish(self, histogram):
+        """BLANK целых данных: из корзины в счетчик пропусков"""
+        if self.blank_bin is not None and 0 <= self.blank_bin < self.bins:
+            histogram.blank += int(histogram.counts[self.blank_bin])
+            histogram.counts[self.blank_bin] = 0
+
+
+def iter_histogram(file_path, chunk_rows=CHUNK_ROWS):
+    """
+    Гистограмма первой плоскости файла (как read_frame) по порциям строк
+
+    Порции читаются через memmap/HDU.section без масштабирования:
+    16-битные данные сразу идут в np.bincount, кадр целиком в памяти
+    не оказывается.
+
+    Yields:
+    -------
+    FrameHistogram
+        Один и тот же объект после каждой порции (rows_done растет)
+    """
+    with fits.open(file_path, memmap=True, do_not_scale_image_data=True) as hdul:
+        hdu = next((h for h in hdul if h.is_image and len(h.shape) >= 2), None)
+        if hdu is None:
+            raise ValueError(f"{file_path}: нет данных изображения")
+        plane = (0,) * (len(hdu.shape) - 2)
+        ny, nx = hdu.shape[-2:]
+        first = hdu.section[plane + (slice(0, min(chunk_rows, ny)), slice(None))]
+        dtype = first.dtype
+        sample = None
+        if dtype.kind not in 'iu' or dtype.itemsize > 2:
+            # Диапазон вещественных данных - по редким строкам всего кадра
+            rows = np.unique(np.linspace(0, ny - 1, min(ny, 64)).astype(int))
+            sample = np.concatenate([hdu.section[plane + (row, slice(None))].ravel()
+                                     for row in rows])
+        binner = _Binner(dtype, hdu.header, sample)
+        histogram = FrameHistogram(binner.zero, binner.scale, (ny, nx), binner.bins)
+
+        for start in range(0, ny, chunk_rows):
+            stop = min(start + chunk_rows, ny)
+            raw = first if start == 0 else hdu.section[plane + (slice(start, stop), slice(None))]
+            indices, blank = binner(raw)
+            histogram.add(indices, blank)
+            histogram.rows_done = stop
+            if histogram.complete:
+                binner.finish(histogram)
+            yield histogram
+
+
+def array_histogram(data):
+    """Гистограмма массива в памяти (мастер-кадр) в той же схеме корзин"""
+    data = np.asarray(data)
+    sample = data[::4, ::4].ravel() if data.ndim == 2 else data.ravel()
+    binner = _Binner(data.dtype, {}, sample.astype(np.float64))
+    histogram = FrameHistogram(binner.zero, binner.scale, data.shape[-2:], binner.bins)
+    for start in range(0, data.shape[0], CHUNK_ROWS):
+        indices, blank = binner(data[start:start + CHUNK_ROWS])
+        histogram.add(indices, blank)
+    histogram.rows_done = histogram.shape[0]
+    return histogram
+
+
+class HistogramProcessor:
+    """
+    Гистограммы кадров для панели гистограммы и растяжки изображения
+
+    Готовые гистограммы хранятся в памяти (LRU) и на диске в
+    histograms/ рабочей директории по пути, времени изменения и размеру
+    файла, так что растяжка и панель используют одну и ту же
+    гистограмму, а повторный показ кадра не читает данные.
+    """
+
+    def __init__(self, app, chunk_rows=CHUNK_ROWS, max_items=64):
+        self.app = app
+        self.chunk_rows = chunk_rows
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cache_dir(self):
+        """Папка кэша гистограмм"""
+        return os.path.join(self.app.config.working_directory, "histograms")
+
+    def get_cache_path(self, file_path):
+        """Путь к гистограмме файла в кэше (None, если файла нет)"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{HISTOGRAM_VERSION}"
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.get_cache_dir(), f"{name}.npz")
+
+    def _remember(self, cache_path, histogram):
+        with self._lock:
+            self._memory[cache_path] = histogram
+            self._memory.move_to_end(cache_path)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def load(self, file_path):
+        """Готовая гистограмма из памяти или с диска, иначе None"""
+        cache_path = self.get_cache_path(file_path)
+        if cache_path is None:
+            return None
+        with self._lock:
+            histogram = self._memory.get(cache_path)
+            if histogram is not None:
+                self._memory.move_to_end(cache_path)
+                return histogram
+        try:
+            with np.load(cache_path) as stored:
+                histogram = FrameHistogram(float(stored['zero']), float(stored['scale']),
+                                           tuple(stored['shape']), len(stored['counts']))
+                histogram.counts[:] = stored['counts']
+                histogram.blank = int(stored['blank'])
+        except (OSError, ValueError, KeyError):
+            return None
+        histogram.rows_done = histogram.shape[0]
+        self._remember(cache_path, histogram)
+        return histogram
+
+    def _store(self, file_path, histogram):
+        cache_path = self.get_cache_path(file_path)
+        if cache_path is None:
+            return
+        self._remember(cache_path, histogram)
+        try:
+            os.makedirs(self.get_cache_dir(), exist_ok=True)
+            # Счетчики в основном нулевые - сжатый файл занимает единицы килобайт
+            np.savez_compressed(cache_path, counts=histogram.counts, zero=histogram.zero,
+                                scale=histogram.scale, shape=np.array(histogram.shape),
+                                blank=histogram.blank)
+        except OSError as e:
+            self.app.log_command(f"Гистограмма не сохранена в кэш: {str(e)}")
+
+    def iter_build(self, file_path):
+        """
+        Гистограмма файла по мере чтения: из кэша - сразу готовая
+
+        Yields:
+        -------
+        FrameHistogram
+            Промежуточные состояния (общий объект); последний - полный,
+            он же попадает в кэш
+        """
+        histogram = self.load(file_path)
+        if histogram is not None:
+            yield histogram
+            return
+        for histogram in iter_histogram(file_path, self.chunk_rows):
+            if histogram.complete:
+                self._store(file_path, histogram)
+            yield histogram
+
+    def histogram(self, file_path):
+        """Полная гистограмма файла (из кэша или с построением)"""
+        histogram = None
+        for histogram in self.iter_build(file_path):
+            pass
+        return histogram
+
+    def stretch(self, file_path, low=1.0, high=99.0):
+        """Границы растяжки изображения (vmin, vmax) по процентилям гистограммы"""
+        vmin, vmax = self.histogram(file_path).percentile([low, high])
+        return float(vmin), float(vmax)
@@ -33,6 +33,30 @@ class IntegrityChecker:
         except Exception as e:
             raise ValueError(f"Ошибка вычисления хэша: {str(e)}")
     
+    @staticmethod
+    def calculate_stream_hash(data):
+        """
+        SHA-256 массива по 2D плоскостям
+        
+        Совпадает с calculate_data_hash, но не делает копию всего куба:
+        байты плоскостей подаются в хэш по очереди.
+        
+        Parameters:
+        -----------
+        data : numpy.ndarray
+            Массив данных HDU (2D или куб)
+            
+        Returns:
+        --------
+        str
+            SHA-256 хэш в виде шестнадцатеричной строки
+        """
+        digest = hashlib.sha256()
+        planes = data.reshape(-1, *data.shape[-2:]) if data.ndim > 2 else [data]
+        for plane in planes:
+            digest.update(np.ascontiguousarray(plane).tobytes())
+        return digest.hexdigest()
+    
     @staticmethod
     def calculate_pixel_sum(data):
         """
@@ -125,6 +149,7 @@ class IntegrityChecker:
             - 'pixel_sum': float (сумма пикселей)
             - 'creation_time': str (время создания)
             - 'file_info': dict (информация о файле)
+            - 'hdus': list (результат по каждому HDU с хэшем)
         """
         results = {
             'is_valid': None,
@@ -133,43 +158,65 @@ class IntegrityChecker:
             'pixel_sum': None,
             'creation_time': None,
             'file_info': {},
+            'hdus': [],
             'error': None
         }
         
         try:
-            # Загружаем файл
+            # Загружаем файл (данные HDU читаются по мере проверки)
             with fits.open(filepath) as hdul:
                 header = hdul[0].header
-                data = hdul[0].data
+                # Первый HDU с данными (у MEF первичный HDU пустой)
+                data_hdu = next((h for h in hdul if h.is_image and h.data is not None), hdul[0])
+                data = data_hdu.data
                 
                 # Базовая информация о файле
                 filename = os.path.basename(filepath)
                 results['file_info'] = {
                     'filename': filename,
                     'size': f"{os.path.getsize(filepath) / 1024:.1f} KB",
-                    'dimensions': f"{data.shape[1]}x{data.shape[0]}",
-                    'data_type': str(data.dtype),
-                    'cal_status': header.get('CALSTAT', 'Unknown')
+                    'dimensions': "x".join(str(n) for n in reversed(data.shape)) if data is not None else "-",
+                    'data_type': str(data.dtype) if data is not None else "-",
+                    'cal_status': header.get('CALSTAT', data_hdu.header.get('CALSTAT', 'Unknown')),
+                    'hdu_count': len(hdul)
                 }
                 
                 # Время создания
-                results['creation_time'] = header.get('CREATED', 'Unknown')
+                results['creation_time'] = header.get('CREATED', data_hdu.header.get('CREATED', 'Unknown'))
+                
+                # Хэш проверяется в каждом HDU, где он записан
+                checked = []
+                for index, hdu in enumerate(hdul):
+                    if not hdu.is_image or 'DATACHECK' not in hdu.header:
+                        continue
+                    stored_hash = hdu.header['DATACHECK']
+                    current_hash = (IntegrityChecker.calculate_stream_hash(hdu.data)[:32]
+                                    if hdu.data is not None else None)
+                    checked.append({
+                        'index': index,
+                        'name': hdu.name,
+                        'stored_hash': stored_hash,
+                        'current_hash': current_hash,
+                        'pixel_sum': float(hdu.header['PIXSUM']) if 'PIXSUM' in hdu.header else None,
+                        'is_valid': stored_hash == current_hash
+                    })
+                results['hdus'] = checked
                 
-                # Сумма пикселей
-                if 'PIXSUM' in header:
+                # Сумма пикселей (по всем HDU)
+                sums = [h['pixel_sum'] for h in checked if h['pixel_sum'] is not None]
+                if sums:
+                    results['pixel_sum'] = float(sum(sums))
+                elif 'PIXSUM' in header:
                     results['pixel_sum'] = float(header['PIXSUM'])
                 
-                # Проверяем хэш, если он есть
-                if 'DATACHECK' in header:
-                    stored_hash = header['DATACHECK']
+                if checked:
+                    stored_hash = checked[0]['stored_hash']
+                    current_hash = checked[0]['current_hash']
                     results['stored_hash'] = stored_hash
-                    
-                    # Вычисляем текущий хэш
-                    current_hash = IntegrityChecker.calculate_data_hash(data)[:32]
                     results['current_hash'] = current_hash
                     
-                    # Сравниваем хэши
-                    is_valid = (stored_hash == current_hash)
+                    # Файл цел, только если совпали хэши всех HDU
+                    is_valid = all(h['is_valid'] for h in checked)
                     results['is_valid'] = is_valid
                     
                     # Выводим информацию, если нужно
@@ -181,10 +228,16 @@ class IntegrityChecker:
                         print(f"Тип данных: {results['file_info']['data_type']}")
                         print(f"Статус калибровки: {results['file_info']['cal_status']}")
                         print(f"Дата создания: {results['creation_time']}")
-                        print(f"Сумма пикселей: {results['pixel_sum']:.2f}")
+                        if results['pixel_sum'] is not None:
+                            print(f"Сумма пикселей: {results['pixel_sum']:.2f}")
                         print(f"\nХэш данных:")
-                        print(f"  Сохраненный: {stored_hash}")
-                        print(f"  Вычисленный: {current_hash}")
+                        if len(checked) == 1:
+                            print(f"  Сохраненный: {stored_hash}")
+                            print(f"  Вычисленный: {current_hash}")
+                        else:
+                            for h in checked:
+                                mark = "✓" if h['is_valid'] else "✗"
+                                print(f"  {mark} HDU {h['index']} {h['name']}: {h['stored_hash']}")
                         
                         if is_valid:
                             print(f"\n✓ ЦЕЛОСТНОСТЬ ДАННЫХ: СОХРАНЕНА")
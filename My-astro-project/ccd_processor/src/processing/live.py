@@ -0,0 +1,272 @@
+"""
+Живой режим: калибровка кадров по мере их появления в папке камеры
+"""
+
+import os
+import queue
+import threading
+import time
+import warnings
+from contextlib import ExitStack
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from .quality import frame_metrics
+
+# watchdog использует inotify (Linux), FSEvents (macOS), ReadDirectoryChangesW
+# (Windows); без него папка опрашивается по таймеру
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+FITS_EXTENSIONS = ('.fits', '.fit', '.fts')
+
+
+def is_fits_complete(path):
+    """
+    Файл FITS записан полностью
+
+    Недописанный файл astropy читает с предупреждением об усечении
+    (или о поврежденном заголовке) - здесь оно считается ошибкой.
+    Данные могут быть в любом HDU с изображением (MEF с пустым
+    первичным HDU), как у read_frame.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            with fits.open(path, memmap=False, lazy_load_hdus=False) as hdul:
+                return any(hdu.is_image and hdu.data is not None for hdu in hdul)
+    except Exception:
+        return False
+
+
+if WATCHDOG_AVAILABLE:
+    class _EventHandler(FileSystemEventHandler):
+        """Передача путей новых и измененных файлов в очередь"""
+
+        def __init__(self, events):
+            super().__init__()
+            self.events = events
+
+        def on_created(self, event):
+            if not event.is_directory:
+                self.events.put(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                self.events.put(event.src_path)
+
+        def on_moved(self, event):
+            # Камера может писать во временный файл и переименовывать его
+            if not event.is_directory:
+                self.events.put(event.dest_path)
+
+
+class LiveProcessor:
+    """
+    Наблюдение за папкой и калибровка новых light кадров
+
+    Новый файл берется в работу, когда его размер и время изменения не
+    меняются settle_time секунд и astropy читает его без предупреждений
+    об усечении. Кадр калибруется по мастер-кадрам, загруженным на
+    момент запуска, записывается в calibrated/ (через временный файл и
+    переименование) и сразу оценивается по метрикам качества. Работа
+    идет в фоновом потоке; результаты передаются в интерфейс через
+    очередь results.
+    """
+
+    def __init__(self, app, poll_interval=1.0, settle_time=2.0, target_latency=30.0):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.target_latency = target_latency
+        self.results = queue.Queue()
+        self._events = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _list_fits(self):
+        """FITS файлы наблюдаемой папки"""
+        return {
+            os.path.join(self.watch_dir, name)
+            for name in os.listdir(self.watch_dir)
+            if name.lower().endswith(FITS_EXTENSIONS)
+        }
+
+    def start(self, watch_dir, working_directory, master_bias=None, master_dark=None,
+              master_flat=None, remove_cosmic_rays=False, include_existing=False, master_flats=None):
+        """
+        Запуск наблюдения за папкой
+
+        Parameters:
+        -----------
+        watch_dir : str
+            Папка, в которую камера пишет кадры
+        working_directory : str
+            Рабочая папка (результаты в calibrated/ и quality/)
+        include_existing : bool
+            Обработать и кадры, уже лежащие в папке
+        master_flats : dict, optional
+            Мастер flat по фильтрам {фильтр: CCDData}: кадр получает flat
+            своего фильтра (masters.flat_for) вместо master_flat
+        """
+        if self.running:
+            raise RuntimeError("Живой режим уже запущен")
+        if not os.path.isdir(watch_dir):
+            raise ValueError(f"Папка не найдена: {watch_dir}")
+
+        self.watch_dir = watch_dir
+        self.calibrated_dir = os.path.join(working_directory, "calibrated")
+        self.quality_path = os.path.join(working_directory, "quality", "live_quality.fits")
+        os.makedirs(self.calibrated_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(self.quality_path), exist_ok=True)
+
+        self._masters = (master_bias, master_dark, master_flat)
+        self._flats = master_flats
+        self._remove_cosmic_rays = remove_cosmic_rays
+        self._seen = set() if include_existing else self._list_fits()
+        self._pending = {}
+        self._first_seen = {}
+        self._metrics = []
+        self._stop.clear()
+
+        if WATCHDOG_AVAILABLE:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self._events), watch_dir, recursive=False)
+            self._observer.start()
+            mode = "события файловой системы (watchdog)"
+        else:
+            self._observer = None
+            mode = f"опрос каждые {self.poll_interval:.1f} с"
+        if include_existing:
+            for path in self._list_fits():
+                self._events.put(path)
+
+        self._thread = threading.Thread(target=self._run, name="live-mode", daemon=True)
+        self._thread.start()
+        self.app.log_command(f"Живой режим: папка {watch_dir}, {mode}")
+
+    def stop(self):
+        """Остановка наблюдения (текущий кадр дорабатывается)"""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.app.log_command("Живой режим остановлен")
+
+    def _collect(self):
+        """Новые файлы в список ожидания: из событий или опросом папки"""
+        if self._observer is None:
+            self._stop.wait(self.poll_interval)
+            candidates = self._list_fits() - self._seen
+        else:
+            candidates = set()
+            try:
+                candidates.add(self._events.get(timeout=self.poll_interval))
+                while True:
+                    candidates.add(self._events.get_nowait())
+            except queue.Empty:
+                pass
+        # Кадры, уже лежавшие в папке при запуске (include_existing)
+        while not self._events.empty():
+            candidates.add(self._events.get_nowait())
+
+        now = time.monotonic()
+        for path in candidates:
+            if path.lower().endswith(FITS_EXTENSIONS) and path not in self._seen:
+                self._pending.setdefault(path, None)
+                self._first_seen.setdefault(path, now)
+
+    def _ready_files(self):
+        """Файлы, которые перестали меняться и читаются целиком"""
+        now = time.monotonic()
+        ready = []
+        for path, state in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                self._first_seen.pop(path, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if state is None or state[0] != signature:
+                self._pending[path] = (signature, now)
+                continue
+            if now - state[1] >= self.settle_time and is_fits_complete(path):
+                del self._pending[path]
+                self._seen.add(path)
+                ready.append(path)
+        return sorted(ready)
+
+    def _run(self):
+        """Цикл фонового потока"""
+        with ExitStack() as stack:
+            # Пул процессов для космических лучей живет весь сеанс
+            if self._remove_cosmic_rays:
+                stack.enter_context(self.app.calibration_processor.cosmic_ray_processor)
+            while not self._stop.is_set():
+                self._collect()
+                for path in self._ready_files():
+                    if self._stop.is_set():
+                        break
+                    try:
+                        self.process_file(path)
+                    except Exception as e:
+                        self.app.log_command(f"Живой режим: ошибка {os.path.basename(path)}: {str(e)}")
+
+    def process_file(self, path):
+        """Калибровка, запись и оценка качества одного кадра"""
+        filename = os.path.basename(path)
+        master_bias, master_dark, master_flat = self._masters
+        if self._flats:
+            from .masters import flat_for, group_by_filter
+            master_flat = flat_for(self._flats, next(iter(group_by_filter([path]))))
+        calibrated = self.app.calibration_processor.calibrate_lights(
+            [path], master_bias, master_dark, master_flat,
+            remove_cosmic_rays=self._remove_cosmic_rays
+        )[0]
+
+        # Запись через временный файл: в calibrated/ не бывает недописанных кадров
+        output_path = os.path.join(self.calibrated_dir, f"calibrated_{filename}")
+        temp_path = output_path + ".part"
+        self.app._save_as_uint16(calibrated, temp_path)
+        os.replace(temp_path, output_path)
+
+        # Метрики качества по калиброванным данным в ADU - как у пакетной оценки
+        # (QualityProcessor калибрует кадры в памяти); пороги - по всей серии ночи
+        metrics = frame_metrics(np.asarray(calibrated.data, dtype=np.float32),
+                                bin_factor=self.app.quality_processor.bin_factor)
+        self._metrics.append({'file': filename, **metrics})
+        table = self.app.quality_processor.reject(Table(rows=self._metrics))
+        table.write(self.quality_path, overwrite=True)
+        row = table[-1]
+
+        latency = time.monotonic() - self._first_seen.pop(path)
+        status = f"ОТБРАКОВАН ({row['reason']})" if row['rejected'] else "ок"
+        self.app.log_command(
+            f"Живой режим: {filename} -> {os.path.basename(output_path)} за {latency:.1f} с, "
+            f"FWHM {row['fwhm']:.2f}, звезд {row['n_stars']} - {status}"
+        )
+        if latency > self.target_latency:
+            self.app.log_command(f"  Предупреждение: задержка больше {self.target_latency:.0f} с")
+
+        self.results.put({
+            'light': path,
+            'calibrated': output_path,
+            'rejected': bool(row['rejected']),
+            'latency': latency,
+        })
@@ -0,0 +1,346 @@
+"""
+Манифест целостности набора кадров (дерево Меркла)
+"""
+
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.tiling import get_worker_count
+
+# Версия формата манифеста
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+FITS_EXTENSIONS = ('.fits', '.fit', '.fts')
+
+
+def hash_file_data(file_path, chunk_size=1 << 22):
+    """
+    SHA-256 данных всех HDU изображений файла
+
+    Хэшируются сырые байты данных в том виде, в каком они лежат
+    в файле (без BZERO/BSCALE), вместе с BITPIX и размером каждого
+    HDU. Правка заголовка не меняет хэш, правка любого пикселя -
+    меняет. Данные читаются через memmap блоками, весь кадр в память
+    не попадает.
+    """
+    import numpy as np
+    from astropy.io import fits
+
+    digest = hashlib.sha256()
+    with fits.open(file_path, memmap=True, do_not_scale_image_data=True) as hdul:
+        for hdu in hdul:
+            if not hdu.is_image or hdu.data is None:
+                continue
+            data = hdu.data
+            digest.update(f"{hdu.header['BITPIX']}|{data.shape}|".encode('ascii'))
+            flat = data.reshape(-1)
+            step = max(1, chunk_size // data.itemsize)
+            for start in range(0, flat.size, step):
+                digest.update(np.ascontiguousarray(flat[start:start + step]).tobytes())
+    return digest.hexdigest()
+
+
+def _leaf_hash(name, data_hash):
+    """Лист дерева: имя файла и хэш его данных"""
+    return hashlib.sha256(b"\x00" + name.encode('utf-8') + b"\x00" + bytes.fromhex(data_hash)).hexdigest()
+
+
+def _node_hash(left, right):
+    """Внутренний узел дерева (префиксы 0/1 не дают выдать лист за узел)"""
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def build_levels(leaves):
+    """
+    Уровни дерева Меркла снизу вверх
+
+    levels[0] - листья, levels[-1] - [корень]. Непарный последний
+    узел уровня переносится на следующий уровень без изменений.
+    """
+    if not leaves:
+        return [[hashlib.sha256(b"").hexdigest()]]
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def leaf_range(levels, level, index):
+    """Диапазон листьев [start, stop), который покрывает узел (level, index)"""
+    width = 1 << level
+    start = index * width
+    return start, min(start + width, len(levels[0]))
+
+
+def proof(levels, index):
+    """
+    Доказательство включения листа: список (хэш соседа, сосед слева)
+    от листа до корня
+    """
+    path = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append((level[sibling], sibling < index))
+        index //= 2
+    return path
+
+
+def verify_proof(leaf, path, root):
+    """Проверка доказательства включения листа в дерево с корнем root"""
+    node = leaf
+    for sibling, is_left in path:
+        node = _node_hash(sibling, node) if is_left else _node_hash(node, sibling)
+    return node == root
+
+
+class ManifestProcessor:
+    """
+    Манифест целостности для папки калиброванных кадров
+
+    В манифесте по каждому файлу хранятся размер, время изменения и
+    хэш данных, а из хэшей собирается дерево Меркла. Один корневой
+    хэш описывает весь набор: лишний, пропавший или измененный файл
+    меняет корень. Проверка может идти по корню (файлы, у которых
+    размер и время изменения не менялись, повторно не хэшируются),
+    по поддереву или по случайной выборке листьев с доказательствами
+    включения. Сравнение двух копий архива спускается только в
+    различающиеся поддеревья, поэтому стоит O(измененных файлов).
+    """
+
+    def __init__(self, app, max_workers=None):
+        self.app = app
+        self.max_workers = get_worker_count(max_workers)
+
+    @staticmethod
+    def get_manifest_path(directory):
+        """Путь к манифесту папки"""
+        return os.path.join(directory, MANIFEST_NAME)
+
+    @staticmethod
+    def list_files(directory):
+        """FITS файлы папки в порядке листьев дерева"""
+        return sorted(
+            name for name in os.listdir(directory)
+            if name.lower().endswith(FITS_EXTENSIONS)
+        )
+
+    def _hash_files(self, directory, names):
+        """Хэши данных файлов в пуле потоков (hashlib и чтение отпускают GIL)"""
+        paths = [os.path.join(directory, name) for name in names]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(names, executor.map(hash_file_data, paths)))
+
+    def build(self, directory, previous=None):
+        """
+        Манифест папки
+
+        Parameters:
+        -----------
+        directory : str
+            Папка с кадрами
+        previous : dict or None
+            Прежний манифест: хэши файлов с неизменными размером и
+            временем изменения берутся из него
+
+        Returns:
+        --------
+        dict
+            Манифест (version, root, files, levels)
+        """
+        names = self.list_files(directory)
+        known = {entry['name']: entry for entry in (previous or {}).get('files', [])}
+
+        entries, to_hash = {}, []
+        for name in names:
+            stat = os.stat(os.path.join(directory, name))
+            entry = {'name': name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            old = known.get(name)
+            if old and old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns']:
+                entry['data_hash'] = old['data_hash']
+            else:
+                to_hash.append(name)
+            entries[name] = entry
+
+        for name, data_hash in self._hash_files(directory, to_hash).items():
+            entries[name]['data_hash'] = data_hash
+
+        files = [entries[name] for name in names]
+        levels = build_levels([_leaf_hash(e['name'], e['data_hash']) for e in files])
+        return {
+            'version': MANIFEST_VERSION,
+            'root': levels[-1][0],
+            'files': files,
+            'levels': levels,
+            'rehashed': len(to_hash),
+        }
+
+    def write(self, directory, incremental=True):
+        """Построение и запись манифеста папки; возвращает манифест"""
+        manifest_path = self.get_manifest_path(directory)
+        previous = self.load(directory) if incremental and os.path.exists(manifest_path) else None
+        manifest = self.build(directory, previous)
+
+        # Запись через временный файл: сбой не оставляет половину манифеста
+        temp_path = manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp_path, manifest_path)
+
+        self.app.log_command(f"Манифест {os.path.basename(directory)}: {len(manifest['files'])} файлов, "
+                             f"перехэшировано {manifest['rehashed']}")
+        self.app.log_command(f"  Корень: {manifest['root']}")
+        return manifest
+
+    def load(self, directory):
+        """Манифест папки из файла"""
+        with open(self.get_manifest_path(directory), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"Неподдерживаемая версия манифеста: {manifest.get('version')}")
+        return manifest
+
+    def _check_entries(self, directory, entries, full):
+        """
+        Проверка записей манифеста по файлам на диске
+
+        Без full файлы с неизменными размером и временем изменения
+        считаются целыми и не читаются.
+        """
+        changed, missing, to_hash = [], [], []
+        for entry in entries:
+            path = os.path.join(directory, entry['name'])
+            try:
+                stat = os.stat(path)
+            except OSError:
+                missing.append(entry['name'])
+                continue
+            if full or stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+                to_hash.append(entry['name'])
+
+        expected = {entry['name']: entry['data_hash'] for entry in entries}
+        for name, data_hash in self._hash_files(directory, to_hash).items():
+            if data_hash != expected[name]:
+                changed.append(name)
+        return changed, missing, len(to_hash)
+
+    def verify(self, directory, mode='root', full=False, level=0, index=0, sample_size=16, seed=None):
+        """
+        Проверка папки по манифесту
+
+        Parameters:
+        -----------
+        directory : str
+            Папка с кадрами и манифестом
+        mode : str
+            'root' - весь набор, включая лишние и пропавшие файлы;
+            'subtree' - файлы под узлом (level, index) дерева;
+            'sample' - случайная выборка из sample_size файлов
+        full : bool
+            Перехэшировать все проверяемые файлы, не доверяя stat
+
+        Returns:
+        --------
+        dict
+            is_valid, checked, rehashed, changed, missing, extra, root
+        """
+        manifest = self.load(directory)
+        levels = manifest['levels']
+        entries = manifest['files']
+        result = {'mode': mode, 'root': manifest['root'], 'extra': []}
+
+        if mode == 'root':
+            stored_root = build_levels([_leaf_hash(e['name'], e['data_hash']) for e in entries])[-1][0]
+            if stored_root != manifest['root']:
+                raise ValueError("Манифест поврежден: корень не совпадает с хэшами файлов")
+            result['extra'] = sorted(set(self.list_files(directory)) - {e['name'] for e in entries})
+            selected = entries
+        elif mode == 'subtree':
+            if not 0 <= level < len(levels) or not 0 <= index < len(levels[level]):
+                raise ValueError(f"Нет узла ({level}, {index}) в дереве")
+            start, stop = leaf_range(levels, level, index)
+            selected = entries[start:stop]
+            # Листья поддерева должны сворачиваться в сохраненный узел
+            subtree_root = build_levels(levels[0][start:stop])[-1][0]
+            if subtree_root != levels[level][index]:
+                raise ValueError(f"Манифест поврежден: узел ({level}, {index}) не совпадает с листьями")
+        elif mode == 'sample':
+            rng = random.Random(seed)
+            indices = sorted(rng.sample(range(len(entries)), min(sample_size, len(entries))))
+            for i in indices:
+                if not verify_proof(levels[0][i], proof(levels, i), manifest['root']):
+                    raise ValueError(f"Манифест поврежден: лист {entries[i]['name']} не входит в корень")
+            selected = [entries[i] for i in indices]
+        else:
+            raise ValueError(f"Неизвестный режим проверки: {mode}")
+
+        changed, missing, rehashed = self._check_entries(directory, selected, full)
+        result.update({
+            'checked': len(selected),
+            'rehashed': rehashed,
+            'changed': changed,
+            'missing': missing,
+            'is_valid': not (changed or missing or result['extra']),
+        })
+
+        self.app.log_command(f"Проверка набора {os.path.basename(directory)} ({mode}): "
+                             f"файлов {len(selected)}, перехэшировано {rehashed}")
+        for name in changed:
+            self.app.log_command(f"  ✗ Изменен: {name}")
+        for name in missing:
+            self.app.log_command(f"  ✗ Отсутствует: {name}")
+        for name in result['extra']:
+            self.app.log_command(f"  ✗ Лишний файл: {name}")
+        self.app.log_command("✓ НАБОР ЦЕЛОСТЕН" if result['is_valid'] else "✗ ЦЕЛОСТНОСТЬ НАБОРА НАРУШЕНА")
+        return result
+
+    @staticmethod
+    def diff(source, target):
+        """
+        Различия двух манифестов (например, двух копий архива)
+
+        При одинаковом составе файлов спуск идет только в поддеревья
+        с разными хэшами; иначе сравниваются листья по именам.
+
+        Returns:
+        --------
+        dict
+            changed, only_in_source, only_in_target - списки имен файлов
+        """
+        result = {'changed': [], 'only_in_source': [], 'only_in_target': []}
+        if source['root'] == target['root']:
+            return result
+
+        source_names = [e['name'] for e in source['files']]
+        target_names = [e['name'] for e in target['files']]
+        if source_names == target_names:
+            a, b = source['levels'], target['levels']
+            stack = [(len(a) - 1, 0)]
+            while stack:
+                level, index = stack.pop()
+                if a[level][index] == b[level][index]:
+                    continue
+                if level == 0:
+                    result['changed'].append(source_names[index])
+                    continue
+                # Дети узла; непарный узел перенесен с уровня ниже как есть
+                for child in (2 * index, 2 * index + 1):
+                    if child < len(a[level - 1]):
+                        stack.append((level - 1, child))
+            result['changed'].sort()
+            return result
+
+        source_hashes = {e['name']: e['data_hash'] for e in source['files']}
+        target_hashes = {e['name']: e['data_hash'] for e in target['files']}
+        result['changed'] = sorted(n for n in source_hashes.keys() & target_hashes.keys()
+                                   if source_hashes[n] != target_hashes[n])
+        result['only_in_source'] = sorted(source_hashes.keys() - target_hashes.keys())
+        result['only_in_target'] = sorted(target_hashes.keys() - source_hashes.keys())
+        return result
@@ -2,85 +2,261 @@
 Создание мастер-кадров
 """
 
-import ccdproc
+import math
+
 import numpy as np
-from astropy.nddata import CCDData
-from astropy.stats import mad_std
+from astropy.io import fits
+
+from utils.frame import read_frame, parse_filter
+from .combine import MAD_TO_STD, ArrayBandSource, FitsBandSource, combine_to_ccd
+from .overscan import OverscanBandSource, subtract_overscan
 
 class MastersProcessor:
-    def __init__(self, app):
+    def __init__(self, app, flat_sample_step=8, flat_region=None, mem_limit=360e6,
+                 overscan_order=None):
         self.app = app
+        # Overscan по BIASSEC/TRIMSEC: None - медиана на строку, число - порядок полинома
+        self.overscan_order = overscan_order
+        # Оценка уровня flat: шаг прореживания и доля центральной области
+        self.flat_sample_step = flat_sample_step
+        self.flat_region = flat_region
+        self.mem_limit = mem_limit
         
     def create_master_bias(self, bias_files):
         """Создание мастер bias"""
         if not bias_files:
             raise ValueError("Нет bias кадров для обработки")
             
-        bias_list = [self.app.read_fits_with_unit(f) for f in bias_files]
+        bias_list = self._read_frames(bias_files)
 
-        master_bias = ccdproc.combine(bias_list,
+        master_bias = combine_to_ccd(
+            ArrayBandSource([bias.data for bias in bias_list]),
+            header=bias_list[0].header,
             method='average',
-            sigma_clip=True, 
-            sigma_clip_low_thresh=5, 
-            sigma_clip_high_thresh=5,
-            sigma_clip_func=np.ma.median, 
-            sigma_clip_dev_func=mad_std,
-            mem_limit=360e6,
+            clip='sigma',
+            low=5,
+            high=5,
+            center='median',
+            dev='mad_std',
+            mem_limit=self.mem_limit,
             unit='adu'
         )
         
         return master_bias
         
+    def _read_frames(self, file_paths):
+        """Кадры с вычтенным overscan и обрезкой (если в заголовке есть BIASSEC)"""
+        frames = [read_frame(f) for f in file_paths]
+        trimmed = sum(subtract_overscan(frame, self.overscan_order) for frame in frames)
+        if trimmed:
+            self.app.log_command(f"Overscan вычтен и кадры обрезаны: {trimmed} из {len(frames)}, "
+                                 f"размер {frames[0].shape}")
+        return frames
+        
     def create_master_dark(self, dark_files, master_bias=None):
         """Создание мастер dark"""
         if not dark_files:
             raise ValueError("Нет dark кадров для обработки")
             
-        dark_list = [self.app.read_fits_with_unit(f) for f in dark_files]
+        dark_list = self._read_frames(dark_files)
         
-        # Вычитание bias если есть
-        if master_bias:
-            dark_list = [ccdproc.subtract_bias(dark, master_bias) for dark in dark_list]
+        # Вычитание bias если есть (на месте, без промежуточных CCDData)
+        if master_bias is not None:
+            for dark in dark_list:
+                dark.data -= master_bias.data
             
-        master_dark = ccdproc.combine(dark_list,
+        master_dark = combine_to_ccd(
+            ArrayBandSource([dark.data for dark in dark_list]),
+            header=dark_list[0].header,
             method='average',
-            sigma_clip=True, 
-            sigma_clip_low_thresh=5, 
-            sigma_clip_high_thresh=5,
-            sigma_clip_func=np.ma.median, 
-            sigma_clip_dev_func=mad_std,
-            mem_limit=360e6,
+            clip='sigma',
+            low=5,
+            high=5,
+            center='median',
+            dev='mad_std',
+            mem_limit=self.mem_limit,
             unit='adu'
         )
         
         return master_dark
         
     def create_master_flat(self, flat_files, master_bias=None):
-        """Создание мастер flat"""
+        """
+        Создание мастер flat
+
+        Кадры читаются полосами через memmap (FitsBandSource, overscan и
+        обрезка - OverscanBandSource): вычитание bias и деление на
+        уровень кадра делаются на месте в буфере стека перед
+        отбраковкой, без копий кадров и промежуточных CCDData. Уровень
+        каждого кадра - медиана прореженной выборки (estimate_flat_scale).
+        """
         if not flat_files:
             raise ValueError("Нет flat кадров для обработки")
-            
-        flat_list = [self.app.read_fits_with_unit(f) for f in flat_files]
-        
-        # Вычитание bias если есть
-        if master_bias:
-            flat_list = [ccdproc.subtract_bias(flat, master_bias) for flat in flat_list]
-            
-        # Нормализация
-        normalized_flats = []
-        for flat in flat_list:
-            # Простая нормализация по медиане
-            normalized_data = flat.data / np.median(flat.data)
-            # Создаем новый CCDData с тем же unit
-            normalized_flat = CCDData(normalized_data, unit=flat.unit)
-            normalized_flats.append(normalized_flat)
-            
-        master_flat = ccdproc.combine(
-            normalized_flats,
-            method='median',
-            sigma_clip=True,
-            sigma_clip_low_thresh=3,
-            sigma_clip_high_thresh=3
-        )
-        
-        return master_flat
\ No newline at end of file
+
+        source = OverscanBandSource(FitsBandSource(flat_files, hdu=None), self.overscan_order)
+        try:
+            bias = master_bias.data if master_bias is not None else None
+            scales, errors = self.flat_scales(source, bias)
+            self.app.log_command(f"Уровни flat: {np.min(scales):.1f}..{np.max(scales):.1f}, "
+                                 f"ошибка оценки <= {np.max(errors):.1e} (отн.)")
+
+            def normalize(stack, rows):
+                if bias is not None:
+                    stack -= bias[rows]
+                stack /= scales[:, None, None]
+
+            # В заголовке мастер-flat только фильтр: по нему flat подбирается
+            # к light кадрам при калибровке (flat_for)
+            header = fits.Header()
+            flat_filter = parse_filter(source.header(0))
+            if flat_filter:
+                header['FILTER'] = (flat_filter, 'Filter of the combined flats')
+
+            # Параметры отбраковки - как у ccdproc.combine по умолчанию (mean/std)
+            master_flat = combine_to_ccd(
+                source,
+                header=header,
+                method='median',
+                clip='sigma',
+                low=3,
+                high=3,
+                center='mean',
+                dev='std',
+                mem_limit=self.mem_limit,
+                unit='adu',
+                prepare=normalize
+            )
+        finally:
+            source.close()
+
+        return master_flat
+
+    def flat_scales(self, source, bias=None):
+        """
+        Уровни всех кадров источника по прореженной выборке
+
+        Returns:
+        --------
+        tuple
+            (уровни, относительные ошибки оценки) - массивы по кадрам
+        """
+        window = sample_window(source.shape, self.flat_sample_step, self.flat_region)
+        bias_sample = bias[window] if bias is not None else None
+        scales = np.empty(len(source))
+        errors = np.empty(len(source))
+        for i in range(len(source)):
+            sample = source.read_window(i, window)
+            if bias_sample is not None:
+                sample -= bias_sample
+            scales[i], errors[i] = estimate_flat_scale(sample)
+        return scales, errors
+
+    def create_master_flats(self, flat_files, master_bias=None, groups=None):
+        """
+        Мастер flat для каждого фильтра набора за один вызов
+
+        Кадры группируются по фильтру заголовка (без чтения данных),
+        группы комбинируются по очереди: в памяти одновременно только
+        буфер полосы одной группы (mem_limit) и готовые мастер-кадры.
+
+        Parameters:
+        -----------
+        groups : dict, optional
+            Готовая группировка group_by_filter(flat_files) - заголовки
+            повторно не читаются
+
+        Returns:
+        --------
+        dict
+            {фильтр: CCDData}; кадры без фильтра - под ключом None
+        """
+        if not flat_files:
+            raise ValueError("Нет flat кадров для обработки")
+
+        if groups is None:
+            groups = group_by_filter(flat_files)
+        masters = {}
+        for flat_filter, files in groups.items():
+            self.app.log_command(f"Master Flat [{flat_filter or 'без фильтра'}]: {len(files)} кадров")
+            masters[flat_filter] = self.create_master_flat(files, master_bias)
+        return masters
+
+
+def sample_window(shape, step, region=None):
+    """
+    Срезы прореженной выборки кадра
+
+    region - доля центральной области по каждой оси (0.5 - центральная
+    половина), None - весь кадр.
+    """
+    window = []
+    for size in shape:
+        if region is None:
+            start, stop = 0, size
+        else:
+            margin = int(size * (1.0 - region) / 2)
+            start, stop = margin, size - margin
+        window.append(slice(start, stop, step))
+    return tuple(window)
+
+
+def estimate_flat_scale(sample):
+    """
+    Уровень flat по выборке: (медиана, относительная ошибка)
+
+    Ошибка - стандартная ошибка выборочной медианы
+    sqrt(pi/2) * sigma / sqrt(m) для m конечных пикселей с разбросом
+    sigma (mad_std выборки), деленная на медиану. Разброс включает и
+    крупномасштабную неоднородность (виньетирование), поэтому оценка
+    консервативна. Пример: кадр 4096x4096 с шагом 8 дает m = 262144,
+    при разбросе 2% ошибка уровня ~5e-5.
+    """
+    values = sample[np.isfinite(sample)]
+    if values.size == 0:
+        raise ValueError("В выборке flat нет конечных значений")
+    median = float(np.median(values))
+    if median <= 0:
+        raise ValueError(f"Уровень flat не положителен: {median}")
+    sigma = MAD_TO_STD * float(np.median(np.abs(values - median)))
+    error = math.sqrt(math.pi / 2) * sigma / math.sqrt(values.size) / median
+    return median, error
+
+
+def group_by_filter(file_paths):
+    """Файлы по фильтрам (порядок первого появления), фильтр читается из заголовков"""
+    groups = {}
+    for path in file_paths:
+        with fits.open(path) as hdul:
+            flat_filter = next((f for f in (parse_filter(h.header) for h in hdul) if f), None)
+        groups.setdefault(flat_filter, []).append(path)
+    return groups
+
+
+def flat_for(flats, light_filter):
+    """
+    Мастер flat для кадра с фильтром light_filter или None
+
+    flats - {фильтр: CCDData}. Flat без фильтра (ключ None) подходит
+    любому кадру; единственный flat - и кадрам без фильтра в заголовке.
+    Flat другого фильтра не применяется никогда.
+    """
+    if light_filter in flats:
+        return flats[light_filter]
+    if None in flats:
+        return flats[None]
+    if light_filter is None and len(flats) == 1:
+        return next(iter(flats.values()))
+    return None
+
+
+def assign_flats(light_files, flats):
+    """
+    Light кадры по мастер flat своего фильтра
+
+    Returns:
+    --------
+    list
+        (фильтр кадров, мастер flat или None, файлы) в порядке первого появления фильтра
+    """
+    return [(light_filter, flat_for(flats, light_filter), files)
+            for light_filter, files in group_by_filter(light_files).items()]
@@ -0,0 +1,217 @@
+"""
+Вычитание overscan и обрезка кадра по BIASSEC/TRIMSEC
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Ключи заголовка после обработки: исходные секции переносятся сюда,
+# чтобы кадр не обрабатывался повторно
+APPLIED_KEYS = {'BIASSEC': 'OVSCSEC', 'TRIMSEC': 'TRIMMED'}
+
+_SECTION = re.compile(r'^\s*\[\s*(\d+)\s*:\s*(\d+)\s*,\s*(\d+)\s*:\s*(\d+)\s*\]\s*$')
+
+
+def parse_section(value):
+    """
+    Секция FITS '[x1:x2,y1:y2]' (с 1, включительно) -> (срез строк, срез столбцов)
+
+    Обратный порядок границ ('[50:1,...]') допускается - берется тот же диапазон.
+    """
+    match = _SECTION.match(str(value))
+    if not match:
+        raise ValueError(f"Неверная секция FITS: {value!r}")
+    x1, x2, y1, y2 = (int(v) for v in match.groups())
+    return (slice(min(y1, y2) - 1, max(y1, y2)), slice(min(x1, x2) - 1, max(x1, x2)))
+
+
+class DetectorGeometry:
+    """
+    Геометрия детектора: секции overscan и обрезки и оператор подгонки
+
+    Overscan-полоса сбоку кадра (на всю высоту) дает уровень на каждую
+    строку, полоса сверху или снизу - на каждый столбец. Подгонка
+    полиномом order вдоль этой оси - одно матричное умножение на
+    заранее посчитанный оператор наименьших квадратов (V @ pinv(V)),
+    поэтому геометрия кэшируется (detector_geometry), а на кадр остается
+    медиана по полосе и умножение.
+    """
+
+    def __init__(self, shape, biassec, trimsec, order=None):
+        self.shape = tuple(shape)
+        self.bias = parse_section(biassec)
+        self.trim = parse_section(trimsec) if trimsec else (slice(0, shape[0]), slice(0, shape[1]))
+        for name, section in (("BIASSEC", self.bias), ("TRIMSEC", self.trim)):
+            if section[0].stop > shape[0] or section[1].stop > shape[1]:
+                raise ValueError(f"{name} выходит за кадр {shape}")
+
+        rows = self.bias[0].stop - self.bias[0].start
+        cols = self.bias[1].stop - self.bias[1].start
+        # Ось, вдоль которой меняется уровень: 0 - по строкам, 1 - по столбцам
+        self.axis = 0 if rows >= cols else 1
+        self.order = order
+        length = rows if self.axis == 0 else cols
+        self._fit = None
+        if order is not None and length > order + 1:
+            x = np.linspace(-1.0, 1.0, length)
+            design = np.polynomial.legendre.legvander(x, order)
+            self._fit = design @ np.linalg.pinv(design)
+
+    @property
+    def trimmed_shape(self):
+        return (self.trim[0].stop - self.trim[0].start, self.trim[1].stop - self.trim[1].start)
+
+    def model(self, strip):
+        """
+        Уровень overscan по полосе: вектор вдоль оси self.axis
+
+        Медиана поперек полосы (устойчива к космическим частицам), затем
+        сглаживание полиномом, если задан order.
+        """
+        level = np.median(strip, axis=1 - self.axis)
+        if self._fit is not None:
+            level = self._fit @ level
+        return level
+
+    def correction(self, level):
+        """Поправка для обрезанной области: столбец (h, 1) или строка (1, w)"""
+        if self.axis == 0:
+            start = self.bias[0].start
+            part = level[self.trim[0].start - start:self.trim[0].stop - start]
+            return part[:, None]
+        start = self.bias[1].start
+        part = level[self.trim[1].start - start:self.trim[1].stop - start]
+        return part[None, :]
+
+    def covers_trim(self):
+        """Overscan-полоса покрывает все строки (столбцы) обрезанной области"""
+        axis = self.axis
+        return (self.bias[axis].start <= self.trim[axis].start and
+                self.bias[axis].stop >= self.trim[axis].stop)
+
+
+@lru_cache(maxsize=16)
+def detector_geometry(shape, biassec, trimsec, order=None):
+    """Геометрия детектора (кэш по форме кадра, секциям и порядку подгонки)"""
+    geometry = DetectorGeometry(shape, biassec, trimsec, order)
+    if not geometry.covers_trim():
+        raise ValueError(f"BIASSEC {biassec} не покрывает TRIMSEC {trimsec}")
+    return geometry
+
+
+def geometry_for(header, shape, order=None):
+    """Геометрия по заголовку кадра или None (нет BIASSEC / уже обработан)"""
+    biassec = header.get('BIASSEC')
+    if not biassec:
+        return None
+    return detector_geometry(tuple(shape), str(biassec).strip(),
+                             str(header.get('TRIMSEC', '')).strip() or None, order)
+
+
+def mark_applied(header, geometry):
+    """Заголовок после обработки: секции переносятся, WCS сдвигается на обрезку"""
+    for key, applied in APPLIED_KEYS.items():
+        if key in header:
+            header[applied] = (header[key], f'{key} applied by overscan stage')
+            del header[key]
+    y0, x0 = geometry.trim[0].start, geometry.trim[1].start
+    for key, offset in (('CRPIX1', x0), ('CRPIX2', y0)):
+        if key in header and offset:
+            header[key] = header[key] - offset
+    header['HISTORY'] = (f"Overscan subtracted ({'rows' if geometry.axis == 0 else 'columns'}, "
+                         f"order {geometry.order}), trimmed to {geometry.trimmed_shape}")
+
+
+def subtract_overscan(frame, order=None):
+    """
+    Вычитание overscan и обрезка Frame (на месте, кадр без BIASSEC не меняется)
+
+    Обрезанные данные копируются в новый непрерывный буфер, чтобы
+    исходный кадр с overscan-полосами не держался в памяти.
+
+    Returns:
+    --------
+    bool
+        True - кадр обработан
+    """
+    geometry = geometry_for(frame.header, frame.data.shape, order)
+    if geometry is None:
+        return False
+    level = geometry.model(frame.data[geometry.bias])
+    data = frame.data[geometry.trim]
+    data -= geometry.correction(level)
+    frame.data = np.ascontiguousarray(data) if data.shape != frame.data.shape else data
+    mark_applied(frame.header, geometry)
+    return True
+
+
+class OverscanBandSource:
+    """
+    Источник полос обрезанных кадров с вычтенным overscan поверх FitsBandSource
+
+    Уровень overscan каждого кадра считается один раз по его полосе
+    (read_window, малая часть кадра); полосы строк читаются сразу в
+    обрезанных координатах. Кадры без BIASSEC читаются как есть, но
+    форма у всех кадров должна совпадать после обрезки.
+    """
+
+    def __init__(self, source, order=None):
+        self.source = source
+        self._geometries = []
+        self._corrections = []
+        for i in range(len(source)):
+            geometry = geometry_for(source.header(i), source.shape, order)
+            self._geometries.append(geometry)
+            self._corrections.append(
+                geometry.correction(geometry.model(source.read_window(i, geometry.bias)))
+                if geometry is not None else None
+            )
+        shapes = {g.trimmed_shape if g is not None else source.shape for g in self._geometries}
+        if len(shapes) > 1:
+            raise ValueError(f"Размеры кадров после обрезки не совпадают: {sorted(shapes)}")
+        self.shape = shapes.pop()
+
+    def __len__(self):
+        return len(self.source)
+
+    def header(self, index=0):
+        """Заголовок кадра после обработки overscan (копия)"""
+        header = self.source.header(index)
+        if self._geometries[index] is not None:
+            mark_applied(header, self._geometries[index])
+        return header
+
+    def read(self, rows, out=None):
+        """Стек (n, h, nx) обрезанных кадров для диапазона строк rows"""
+        if out is None:
+            out = np.empty((len(self), rows.stop - rows.start, self.shape[1]), dtype=np.float32)
+        for i, (geometry, correction) in enumerate(zip(self._geometries, self._corrections)):
+            if geometry is None:
+                out[i] = self.source.read_window(i, (rows, slice(None)))
+                continue
+            y0, x0 = geometry.trim[0].start, geometry.trim[1].start
+            window = (slice(y0 + rows.start, y0 + rows.stop), slice(x0, geometry.trim[1].stop))
+            out[i] = self.source.read_window(i, window)
+            out[i] -= correction[rows] if geometry.axis == 0 else correction
+        return out
+
+    def read_window(self, index, window):
+        """Окно обрезанного кадра (кортеж срезов) в float64"""
+        geometry = self._geometries[index]
+        if geometry is None:
+            return self.source.read_window(index, window)
+        rows = range(*window[0].indices(self.shape[0]))
+        cols = range(*window[1].indices(self.shape[1]))
+        y0, x0 = geometry.trim[0].start, geometry.trim[1].start
+        data = self.source.read_window(index, (
+            slice(y0 + rows.start, y0 + rows.stop, rows.step),
+            slice(x0 + cols.start, x0 + cols.stop, cols.step),
+        ))
+        correction = self._corrections[index]
+        data -= correction[window[0]] if geometry.axis == 0 else correction[:, window[1]]
+        return data
+
+    def close(self):
+        self.source.close()
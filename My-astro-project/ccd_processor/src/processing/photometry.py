@@ -0,0 +1,285 @@
+"""
+Векторизованная апертурная фотометрия списка звезд по серии кадров
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+from utils.frame import read_frame
+from utils.tiling import get_worker_count
+from .ptc import data_scale, noise_model
+
+
+def _subpixel_weights(offsets, half_size, radius_in, radius_out, subpixels):
+    """
+    Доли площади пикселей вырезки, попадающие в кольцо radius_in..radius_out
+
+    Parameters:
+    -----------
+    offsets : numpy.ndarray
+        Дробные смещения центров звезд относительно центрального пикселя, (N, 2) как (dx, dy)
+    half_size : int
+        Полуразмер вырезки; вырезка (2*half_size+1) x (2*half_size+1)
+    radius_in, radius_out : float
+        Внутренний и внешний радиус (radius_in=0 - круглая апертура)
+    subpixels : int
+        Число подпикселей по каждой оси (аналог method='subpixel' в photutils)
+
+    Returns:
+    --------
+    numpy.ndarray
+        Массив весов (N, k, k) float32
+    """
+    k = 2 * half_size + 1
+    # Координаты центров подпикселей относительно центрального пикселя
+    sub = (np.arange(k * subpixels) + 0.5) / subpixels - 0.5 - half_size
+    weights = np.empty((len(offsets), k, k), dtype=np.float32)
+    r_in2, r_out2 = radius_in ** 2, radius_out ** 2
+    # По одной звезде за раз: (k*s)^2 булевых значений вместо N*(k*s)^2
+    for i, (dx, dy) in enumerate(offsets):
+        dist2 = (sub[None, :] - dx) ** 2 + (sub[:, None] - dy) ** 2
+        inside = (dist2 >= r_in2) & (dist2 < r_out2) if radius_in > 0 else dist2 < r_out2
+        weights[i] = inside.reshape(k, subpixels, k, subpixels).mean(axis=(1, 3))
+    return weights
+
+
+def _positive_flux(net_flux):
+    """Чистый поток для логарифма: неположительные значения -> NaN"""
+    net_flux = np.asarray(net_flux, dtype=np.float64)
+    return np.where(net_flux > 0, net_flux, np.nan)
+
+
+class PhotometryProcessor:
+    """
+    Пакетная апертурная фотометрия фиксированного списка звезд
+
+    Повторяет CircularAperture / CircularAnnulus / ApertureStats /
+    aperture_photometry из 07-stars-detection.ipynb, но для всех звезд
+    и всех кадров сразу: веса апертуры и кольца считаются один раз для
+    списка звезд, на каждом кадре все вырезки извлекаются одним
+    индексированием в стек (N, k, k), а суммы и фон - одной операцией
+    по стеку. Звездные величины считаются NumPy для всей матрицы
+    кадр x звезда.
+    """
+
+    def __init__(self, app, aperture_radius=5.0, annulus_radii=(10.0, 15.0),
+                 subpixels=5, max_workers=None):
+        self.app = app
+        self.aperture_radius = aperture_radius
+        self.annulus_radii = tuple(annulus_radii)
+        self.subpixels = subpixels
+        self.max_workers = get_worker_count(max_workers)
+
+    @staticmethod
+    def load_sources(catalog_path, frame=0):
+        """Позиции звезд (N, 2) из каталога поиска звезд для опорного кадра"""
+        with fits.open(catalog_path) as hdul:
+            table = hdul['DETECTIONS'].data
+            selected = table[table['frame'] == frame]
+            return np.column_stack((selected['x'], selected['y'])).astype(np.float64)
+
+    def prepare(self, positions, shape):
+        """
+        Подготовка индексов и весов для списка звезд (один раз на серию)
+
+        Returns:
+        --------
+        dict
+            Индексы вырезок в кадре и веса апертуры и кольца
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        half_size = int(np.ceil(max(self.aperture_radius, self.annulus_radii[1]))) + 1
+        k = 2 * half_size + 1
+
+        centers = np.rint(positions).astype(np.int64)
+        offsets = positions - centers
+
+        aperture = _subpixel_weights(offsets, half_size, 0.0, self.aperture_radius, self.subpixels)
+        # Фон в кольце - по центрам пикселей (как среднее в ApertureStats)
+        annulus = _subpixel_weights(offsets, half_size, self.annulus_radii[0],
+                                    self.annulus_radii[1], 1)
+
+        # Индексы вырезок; пиксели за краем кадра получают нулевой вес
+        steps = np.arange(-half_size, half_size + 1)
+        rows = centers[:, 1, None, None] + steps[None, :, None]
+        cols = centers[:, 0, None, None] + steps[None, None, :]
+        outside = (rows < 0) | (rows >= shape[0]) | (cols < 0) | (cols >= shape[1])
+        aperture[outside] = 0.0
+        annulus[outside] = 0.0
+        rows = np.clip(rows, 0, shape[0] - 1)
+        cols = np.clip(cols, 0, shape[1] - 1)
+        flat_index = (rows * shape[1] + cols).reshape(len(positions), k, k)
+
+        return {
+            'positions': positions,
+            'shape': tuple(shape),
+            'index': flat_index,
+            'aperture': aperture,
+            'annulus': annulus,
+            'aperture_area': aperture.sum(axis=(1, 2)),
+            'annulus_area': annulus.sum(axis=(1, 2)),
+        }
+
+    @staticmethod
+    def measure_frame(data, plan):
+        """
+        Фотометрия всех звезд на одном кадре
+
+        Returns:
+        --------
+        tuple
+            (сумма в апертуре, средний фон в кольце) - массивы длины N
+        """
+        if data.shape != plan['shape']:
+            raise ValueError(f"Размер кадра {data.shape} не совпадает с {plan['shape']}")
+        cutouts = np.ravel(data)[plan['index']].astype(np.float64)
+        aperture_sum = np.einsum('nij,nij->n', cutouts, plan['aperture'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bkg_mean = np.einsum('nij,nij->n', cutouts, plan['annulus']) / plan['annulus_area']
+        return aperture_sum, bkg_mean
+
+    @staticmethod
+    def magnitudes(net_flux, exptime, zero_point):
+        """
+        Звездные величины ZP - 2.5 log10(net / t) для матрицы кадр x звезда
+
+        Неположительный чистый поток (звезда не выше фона) дает NaN, а не
+        величину по модулю потока.
+        """
+        exptime = np.asarray(exptime, dtype=np.float64).reshape(-1, 1)
+        zero_point = np.asarray(zero_point, dtype=np.float64).reshape(-1, 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return zero_point - 2.5 * np.log10(_positive_flux(net_flux) / exptime)
+
+    def _read_frame(self, path):
+        """Данные, время экспозиции и перевод значений в ADU (data_scale) кадра"""
+        frame = read_frame(path)
+        return frame.data, frame.exposure_time.value, data_scale(frame.header)
+
+    def process_files(self, file_paths, positions, output_path,
+                      zero_point=0.0, reference=None):
+        """
+        Фотометрия списка звезд по всем кадрам с записью в .npz
+
+        Parameters:
+        -----------
+        file_paths : list
+            Калиброванные (выровненные) кадры
+        positions : numpy.ndarray
+            Позиции звезд (N, 2) как (x, y)
+        output_path : str
+            Путь к .npz файлу результата
+        zero_point : float
+            Нуль-пункт, если reference не задан
+        reference : tuple or None
+            (индекс звезды, ее каталожная величина) - нуль-пункт
+            вычисляется для каждого кадра по этой звезде
+
+        Returns:
+        --------
+        dict
+            Массивы результата (те же, что записаны в .npz)
+        """
+        if not file_paths:
+            raise ValueError("Нет кадров для фотометрии")
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        if len(positions) == 0:
+            raise ValueError("Список звезд для фотометрии пуст")
+
+        n_frames, n_sources = len(file_paths), len(positions)
+        self.app.log_command(f"Фотометрия: {n_sources} звезд x {n_frames} кадров, "
+                             f"{self.max_workers} потоков")
+
+        first_data, _, _ = self._read_frame(file_paths[0])
+        plan = self.prepare(positions, first_data.shape)
+        del first_data
+
+        aperture_sum = np.empty((n_frames, n_sources), dtype=np.float64)
+        bkg_mean = np.empty((n_frames, n_sources), dtype=np.float64)
+        exptime = np.empty(n_frames, dtype=np.float64)
+        scale = np.empty((n_frames, 2), dtype=np.float64)
+
+        def measure(i):
+            data, t, scale[i] = self._read_frame(file_paths[i])
+            aperture_sum[i], bkg_mean[i] = self.measure_frame(data, plan)
+            exptime[i] = t
+            return i
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for done, i in enumerate(executor.map(measure, range(n_frames)), 1):
+                if done % 100 == 0 or done == n_frames:
+                    self.app.log_command(f"  Обработано кадров: {done}/{n_frames}")
+
+        return self.save_results(file_paths, plan, aperture_sum, bkg_mean, exptime,
+                                 output_path, zero_point, reference, scale)
+
+    @staticmethod
+    def flux_errors(net_flux, bkg_mean, aperture_area, annulus_area, scale, gain, read_noise):
+        """
+        Ошибка чистого потока по уравнению ПЗС (в единицах кадра)
+
+        var = N/g + A * (1 + A/A_bkg) * (B/g + (RN/g)^2) в ADU, где N - чистый
+        поток, B - фон на пиксель, A и A_bkg - площади апертуры и кольца;
+        scale - (n_frames, 2) перевод значений кадров в ADU (data_scale).
+        """
+        factor = scale[:, 0:1]
+        net_adu = net_flux * factor
+        sky_adu = bkg_mean * factor + scale[:, 1:2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pixel_var = np.maximum(sky_adu, 0.0) / gain + (read_noise / gain) ** 2
+            area = aperture_area[None, :]
+            variance = (np.maximum(net_adu, 0.0) / gain +
+                        area * (1.0 + area / annulus_area[None, :]) * pixel_var)
+        return np.sqrt(variance) / factor
+
+    def save_results(self, file_paths, plan, aperture_sum, bkg_mean, exptime, output_path,
+                     zero_point=0.0, reference=None, scale=None):
+        """
+        Чистый поток, звездные величины и запись .npz по суммам в апертурах
+        и фону в кольцах (матрицы кадр x звезда)
+
+        С моделью шума сессии (PTC) добавляются ошибки flux_err и mag_err.
+        """
+        positions = plan['positions']
+        n_frames = len(file_paths)
+        total_bkg = bkg_mean * plan['aperture_area'][None, :]
+        net_flux = aperture_sum - total_bkg
+
+        if reference is not None:
+            ref_index, ref_mag = reference
+            with np.errstate(invalid='ignore', divide='ignore'):
+                zero_point = ref_mag + 2.5 * np.log10(_positive_flux(net_flux[:, ref_index]) / exptime)
+        zero_point = np.broadcast_to(np.asarray(zero_point, dtype=np.float64), (n_frames,))
+        mag = self.magnitudes(net_flux, exptime, zero_point)
+
+        result = {
+            'frame': np.array([os.path.basename(p) for p in file_paths]),
+            'source_x': positions[:, 0],
+            'source_y': positions[:, 1],
+            'aperture_sum': aperture_sum.astype(np.float32),
+            'background': bkg_mean.astype(np.float32),
+            'total_bkg': total_bkg.astype(np.float32),
+            'net_flux': net_flux.astype(np.float32),
+            'mag': mag.astype(np.float32),
+            'exptime': exptime,
+            'zero_point': np.array(zero_point),
+            'aperture_area': plan['aperture_area'],
+            'radii': np.array([self.aperture_radius, *self.annulus_radii]),
+        }
+        model = noise_model(getattr(self.app, 'config', None))
+        if model is not None:
+            if scale is None:
+                scale = np.tile([1.0, 0.0], (n_frames, 1))
+            flux_err = self.flux_errors(net_flux, bkg_mean, plan['aperture_area'],
+                                        plan['annulus_area'], np.asarray(scale), *model)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mag_err = 2.5 / np.log(10) * flux_err / _positive_flux(net_flux)
+            result['flux_err'] = flux_err.astype(np.float32)
+            result['mag_err'] = mag_err.astype(np.float32)
+            result['noise_model'] = np.array(model)
+        np.savez_compressed(output_path, **result)
+        self.app.log_command(f"Фотометрия сохранена в {output_path}")
+        return result
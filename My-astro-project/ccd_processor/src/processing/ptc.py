@@ -0,0 +1,299 @@
+"""
+Кривая передачи фотонов (PTC): усиление и шум считывания по парам bias и flat
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from utils.frame import parse_exposure, parse_filter
+from utils.tiling import get_worker_count
+from .combine import MAD_TO_STD, FitsBandSource
+from .overscan import geometry_for
+
+
+def noise_model(config):
+    """
+    Модель шума детектора из параметров калибровки сессии
+
+    Returns:
+    --------
+    tuple or None
+        (усиление e-/ADU, шум считывания e-) или None, если PTC не строилась
+    """
+    calibration = getattr(config, 'calibration', None) or {}
+    gain, read_noise = calibration.get('gain'), calibration.get('read_noise')
+    if not gain or read_noise is None:
+        return None
+    return float(gain), float(read_noise)
+
+
+def data_scale(header):
+    """
+    Перевод значений файла в ADU: adu = value * scale + zero
+
+    Калиброванные кадры пишутся в uint16 с растяжением диапазона
+    (save_as_uint16 записывает CALSCALE/CALZERO); для остальных - (1, 0).
+    """
+    return float(header.get('CALSCALE', 1.0)), float(header.get('CALZERO', 0.0))
+
+
+def pixel_sigma(signal_adu, gain, read_noise):
+    """Шум пикселя в ADU при сигнале signal_adu: sqrt(S/g + (RN/g)^2)"""
+    return np.sqrt(np.maximum(signal_adu, 0.0) / gain + (read_noise / gain) ** 2)
+
+
+def tile_windows(shape, tile_size=64, grid=8, region=None):
+    """
+    Окна прореженной сетки тайлов: grid x grid тайлов tile_size, равномерно по области
+
+    region - (срез строк, срез столбцов) рабочей области (TRIMSEC), None - весь кадр.
+    """
+    if region is None:
+        region = (slice(0, shape[0]), slice(0, shape[1]))
+    starts = []
+    for axis in (0, 1):
+        lo, hi = region[axis].start, region[axis].stop
+        size = min(tile_size, hi - lo)
+        count = max(1, min(grid, (hi - lo) // size))
+        starts.append(np.linspace(lo, hi - size, count).astype(int))
+    size_y = min(tile_size, region[0].stop - region[0].start)
+    size_x = min(tile_size, region[1].stop - region[1].start)
+    return [(slice(y, y + size_y), slice(x, x + size_x)) for y in starts[0] for x in starts[1]]
+
+
+def _read_tiles(source, index, windows):
+    """Тайлы кадра одним массивом (n_tiles, h, w) в ADU"""
+    return np.stack([source.read_window(index, window) for window in windows])
+
+
+def pair_statistics(first, second, windows, bias_level=None, scale_second=True):
+    """
+    Сигнал и дисперсия пары кадров по тайлам (векторизовано по тайлам)
+
+    Разность кадров убирает фиксированный шаблон (PRNU, структуру
+    bias); второй кадр масштабируется к уровню первого в каждом тайле
+    (поправка на дрейф освещенности). Дисперсия - (mad_std разности)^2 / 2:
+    устойчива к космическим частицам и дефектам.
+
+    Returns:
+    --------
+    tuple
+        (средний уровень тайлов, дисперсия одного кадра, максимум пары) - массивы по тайлам
+    """
+    source = FitsBandSource([first, second], hdu=None)
+    try:
+        tiles_a = _read_tiles(source, 0, windows)
+        tiles_b = _read_tiles(source, 1, windows)
+    finally:
+        source.close()
+    mean_a = tiles_a.mean(axis=(1, 2))
+    mean_b = tiles_b.mean(axis=(1, 2))
+    if scale_second:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tiles_b *= (mean_a / mean_b)[:, None, None]
+    diff = (tiles_a - tiles_b).reshape(len(windows), -1)
+    center = np.median(diff, axis=1)
+    sigma = MAD_TO_STD * np.median(np.abs(diff - center[:, None]), axis=1)
+    signal = (mean_a + mean_b) / 2
+    if bias_level is not None:
+        signal = signal - bias_level
+    peak = np.maximum(tiles_a.max(axis=(1, 2)), tiles_b.max(axis=(1, 2)))
+    return signal, sigma ** 2 / 2, peak
+
+
+def _frame_info(path):
+    """(фильтр, экспозиция) по заголовкам без чтения данных"""
+    with fits.open(path) as hdul:
+        headers = [hdu.header for hdu in hdul]
+    frame_filter = next((f for f in (parse_filter(h) for h in headers) if f), None)
+    exposure = next((e for e in (parse_exposure(h) for h in headers) if e is not None),
+                    parse_exposure({}, path))
+    return frame_filter, exposure
+
+
+def flat_pairs(flat_files):
+    """
+    Пары flat одного фильтра и экспозиции (уровня) в порядке файлов
+
+    Returns:
+    --------
+    list
+        (файл 1, файл 2, фильтр, экспозиция)
+    """
+    groups = {}
+    for path in flat_files:
+        groups.setdefault(_frame_info(path), []).append(path)
+    pairs = []
+    for (flat_filter, exposure), files in groups.items():
+        for first, second in zip(files[0::2], files[1::2]):
+            pairs.append((first, second, flat_filter, exposure))
+    return pairs
+
+
+def fit_ptc(signal, variance, read_variance=None, clip=3.0, iterations=3):
+    """
+    Подгонка прямой var = RN^2 + S/g по точкам (ADU) с отбраковкой выбросов
+
+    Если дисперсия шума считывания известна по парам bias, подгоняется
+    только наклон (прямая через read_variance), иначе - наклон и сдвиг.
+
+    Returns:
+    --------
+    tuple
+        (усиление e-/ADU, шум считывания ADU, маска использованных точек)
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    variance = np.asarray(variance, dtype=np.float64)
+    used = np.isfinite(signal) & np.isfinite(variance) & (signal > 0)
+    slope = intercept = np.nan
+    for _ in range(iterations):
+        if np.count_nonzero(used) < 2:
+            raise ValueError("Недостаточно точек для подгонки PTC")
+        s, v = signal[used], variance[used]
+        if read_variance is not None:
+            intercept = read_variance
+            slope = np.sum(s * (v - intercept)) / np.sum(s * s)
+        else:
+            slope, intercept = np.polyfit(s, v, 1)
+        residual = variance - (intercept + slope * signal)
+        spread = MAD_TO_STD * np.median(np.abs(residual[used]))
+        keep = used & (np.abs(residual) <= clip * spread) if spread > 0 else used
+        if np.array_equal(keep, used):
+            break
+        used = keep
+    if not slope > 0:
+        raise ValueError(f"Наклон PTC не положителен ({slope:.3g}): проверьте пары flat")
+    return 1.0 / slope, float(np.sqrt(max(intercept, 0.0))), used
+
+
+class PhotonTransferProcessor:
+    """
+    Усиление и шум считывания по загруженным bias и flat
+
+    Кадры обрабатываются парами: последовательные bias дают шум
+    считывания и уровень смещения, flat одного фильтра и экспозиции -
+    точку кривой (сигнал, дисперсия). Из каждого кадра читается только
+    прореженная сетка тайлов (memmap), пары считаются в пуле потоков,
+    поэтому сотни flat не держатся в памяти одновременно. Точки
+    каждого тайла каждой пары flat идут в подгонку; уровни выше
+    перегиба кривой (насыщение) отбрасываются.
+    """
+
+    def __init__(self, app, tile_size=64, grid=8, saturation=60000.0, max_workers=None):
+        self.app = app
+        self.tile_size = tile_size
+        self.grid = grid
+        self.saturation = saturation
+        self.max_workers = get_worker_count(max_workers)
+
+    def _windows(self, file_path):
+        """Сетка тайлов в рабочей области кадра (без overscan по BIASSEC/TRIMSEC)"""
+        source = FitsBandSource([file_path], hdu=None)
+        try:
+            shape, header = source.shape, source.header(0)
+        finally:
+            source.close()
+        geometry = geometry_for(header, shape)
+        region = geometry.trim if geometry is not None else None
+        return tile_windows(shape, self.tile_size, self.grid, region)
+
+    def analyze(self, bias_files, flat_files):
+        """
+        Построение и подгонка PTC
+
+        Returns:
+        --------
+        dict
+            gain (e-/ADU), read_noise (e-), read_noise_adu и таблица точек 'points'
+        """
+        pairs = flat_pairs(flat_files)
+        if not pairs:
+            raise ValueError("Нет пар flat одного фильтра и экспозиции")
+        windows = self._windows(pairs[0][0])
+        bias_pairs = list(zip(bias_files[0::2], bias_files[1::2]))
+        self.app.log_command(f"PTC: {len(bias_pairs)} пар bias, {len(pairs)} пар flat, "
+                             f"{len(windows)} тайлов {self.tile_size}px, {self.max_workers} потоков")
+
+        rows = []
+        bias_level = read_variance = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if bias_pairs:
+                levels, variances = [], []
+                for (first, second), (level, variance, _) in zip(bias_pairs, executor.map(
+                        lambda p: pair_statistics(p[0], p[1], windows, scale_second=False), bias_pairs)):
+                    levels.append(level)
+                    variances.append(float(np.median(variance)))
+                    rows.append(('bias', first, second, '', 0.0, float(np.median(level)),
+                                 variances[-1], False))
+                # Уровень смещения каждого тайла - среднее по парам
+                bias_level = np.mean(levels, axis=0)
+                read_variance = float(np.median(variances))
+            else:
+                self.app.log_command("  Предупреждение: нет пар bias - уровень смещения не вычитается, "
+                                     "шум считывания по сдвигу прямой")
+
+            signal, variance, pair_index = [], [], []
+            results = executor.map(lambda p: pair_statistics(p[0], p[1], windows, bias_level), pairs)
+            for i, ((first, second, flat_filter, exposure), (s, v, peak)) in enumerate(zip(pairs, results)):
+                unsaturated = peak < self.saturation
+                signal.append(s[unsaturated])
+                variance.append(v[unsaturated])
+                pair_index.append(np.full(np.count_nonzero(unsaturated), i))
+                rows.append(('flat', first, second, flat_filter or '', exposure or 0.0,
+                             float(np.median(s)), float(np.median(v)), bool(unsaturated.any())))
+                if (i + 1) % 50 == 0 or i + 1 == len(pairs):
+                    self.app.log_command(f"  Обработано пар flat: {i + 1}/{len(pairs)}")
+
+        signal = np.concatenate(signal)
+        variance = np.concatenate(variance)
+        pair_index = np.concatenate(pair_index)
+        signal, variance, pair_index = self._below_rollover(signal, variance, pair_index)
+
+        gain, read_noise_adu, used = fit_ptc(signal, variance, read_variance)
+        used_pairs = set(pair_index[used].tolist())
+        flat_rows = [i for i, row in enumerate(rows) if row[0] == 'flat']
+        for pair, row_index in enumerate(flat_rows):
+            rows[row_index] = rows[row_index][:7] + (pair in used_pairs,)
+
+        result = {
+            'gain': float(gain),
+            'read_noise': float(read_noise_adu * gain),
+            'read_noise_adu': float(read_noise_adu),
+            'n_points': int(np.count_nonzero(used)),
+            'points': Table(rows=rows, names=('kind', 'file1', 'file2', 'filter', 'exposure',
+                                              'signal', 'variance', 'used')),
+        }
+        self.app.log_command(f"PTC: усиление {result['gain']:.3f} e-/ADU, шум считывания "
+                             f"{result['read_noise']:.2f} e- ({read_noise_adu:.2f} ADU), "
+                             f"точек {result['n_points']}")
+        return result
+
+    @staticmethod
+    def _below_rollover(signal, variance, pair_index):
+        """Точки ниже перегиба кривой: после насыщения дисперсия падает с ростом сигнала"""
+        if len(signal) == 0:
+            return signal, variance, pair_index
+        pairs = np.unique(pair_index)
+        level = np.array([np.median(signal[pair_index == p]) for p in pairs])
+        spread = np.array([np.median(variance[pair_index == p]) for p in pairs])
+        order = np.argsort(level)
+        peak_level = level[order][np.argmax(spread[order])]
+        keep = np.isin(pair_index, pairs[level <= peak_level])
+        return signal[keep], variance[keep], pair_index[keep]
+
+    def write(self, result, output_path):
+        """Таблица точек PTC и результат подгонки (GAIN, RDNOISE) в FITS"""
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        hdu = fits.table_to_hdu(result['points'])
+        hdu.name = 'PTC'
+        hdu.header['GAIN'] = (result['gain'], 'Gain, e-/ADU')
+        hdu.header['RDNOISE'] = (result['read_noise'], 'Read noise, e-')
+        hdu.header['RDNOISEA'] = (result['read_noise_adu'], 'Read noise, ADU')
+        hdu.header['NPOINTS'] = (result['n_points'], 'Tile points used in the fit')
+        fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(output_path, overwrite=True)
+        self.app.log_command(f"PTC сохранена в {output_path}")
+        return output_path
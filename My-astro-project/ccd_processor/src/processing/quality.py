@@ -0,0 +1,236 @@
+"""
+Оценка качества кадров и автоматическая отбраковка
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.stats import sigma_clipped_stats
+from astropy.table import Table
+from scipy import ndimage
+
+from utils.frame import read_frame
+from utils.tiling import get_worker_count
+from .calibration import apply_masters
+from .centroids import extract_cutouts
+from .overscan import subtract_overscan
+from .registration import bin_frame
+
+# Колонки таблицы метрик
+METRIC_COLUMNS = ['background', 'noise', 'n_stars', 'fwhm', 'eccentricity']
+
+
+def frame_metrics(data, bin_factor=2, threshold_sigma=5.0, max_stars=50, box_size=9):
+    """
+    Метрики качества кадра по бинированной копии
+
+    Parameters:
+    -----------
+    data : numpy.ndarray
+        Двумерный кадр
+    bin_factor : int
+        Коэффициент бинирования (FWHM пересчитывается в пиксели кадра)
+    threshold_sigma : float
+        Порог обнаружения звезд в единицах шума
+    max_stars : int
+        Число самых ярких звезд для оценки FWHM и эксцентриситета
+    box_size : int
+        Размер вырезки для моментов (в бинированных пикселях)
+
+    Returns:
+    --------
+    dict
+        background, noise, n_stars, fwhm, eccentricity
+    """
+    binned = bin_frame(data, bin_factor)
+    _, median, std = sigma_clipped_stats(binned[::2, ::2], sigma=3.0)
+    # Шум бинированного кадра в пересчете на исходный пиксель
+    metrics = {'background': float(median), 'noise': float(std) * bin_factor,
+               'n_stars': 0, 'fwhm': np.nan, 'eccentricity': np.nan}
+
+    signal = binned - median
+    peaks = (signal == ndimage.maximum_filter(signal, size=box_size)) & (signal > threshold_sigma * std)
+    margin = box_size
+    peaks[:margin] = peaks[-margin:] = False
+    peaks[:, :margin] = peaks[:, -margin:] = False
+    ys, xs = np.nonzero(peaks)
+    metrics['n_stars'] = int(len(xs))
+    if len(xs) == 0:
+        return metrics
+
+    brightest = np.argsort(signal[ys, xs])[::-1][:max_stars]
+    positions = np.column_stack((xs[brightest], ys[brightest])).astype(np.float64)
+    cutouts, _ = extract_cutouts(signal, positions, box_size)
+    cutouts = np.clip(cutouts, 0, None).astype(np.float64)
+
+    # Вторые моменты всех вырезок сразу
+    k = box_size
+    coords = np.arange(k, dtype=np.float64)
+    total = cutouts.sum(axis=(1, 2))
+    valid = total > 0
+    cutouts, total = cutouts[valid], total[valid]
+    if len(total) == 0:
+        return metrics
+    x_mean = cutouts.sum(axis=1) @ coords / total
+    y_mean = cutouts.sum(axis=2) @ coords / total
+    dx = coords[None, None, :] - x_mean[:, None, None]
+    dy = coords[None, :, None] - y_mean[:, None, None]
+    xx = (cutouts * dx ** 2).sum(axis=(1, 2)) / total
+    yy = (cutouts * dy ** 2).sum(axis=(1, 2)) / total
+    xy = (cutouts * dx * dy).sum(axis=(1, 2)) / total
+
+    # Собственные значения ковариационной матрицы 2x2
+    half_trace = (xx + yy) / 2
+    root = np.sqrt(((xx - yy) / 2) ** 2 + xy ** 2)
+    major, minor = half_trace + root, np.clip(half_trace - root, 0, None)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fwhm = 2.3548 * np.sqrt((major + minor) / 2) * bin_factor
+        eccentricity = np.sqrt(1 - minor / major)
+
+    metrics['fwhm'] = float(np.nanmedian(fwhm))
+    metrics['eccentricity'] = float(np.nanmedian(eccentricity))
+    return metrics
+
+
+# Калибровка рабочего процесса: (порядок overscan, bias, dark, экспозиция
+# dark, нормированный flat) - передается один раз при запуске пула
+_CALIBRATION = None
+
+
+def _init_worker(calibration):
+    global _CALIBRATION
+    _CALIBRATION = calibration
+
+
+def _file_metrics(path, params):
+    """
+    Метрики одного файла (выполняется в рабочем процессе)
+
+    С мастер-кадрами кадр сначала калибруется в памяти (overscan, bias,
+    dark, flat - та же арифметика, что у калибровки), так что метрики
+    в тех же единицах, что у живого режима, и фон не завышен уровнем
+    bias и темнового тока.
+    """
+    frame = read_frame(path, dtype=np.float32)
+    data = frame.data
+    if _CALIBRATION is not None:
+        order, bias, dark, dark_exposure, flat = _CALIBRATION
+        subtract_overscan(frame, order)
+        data = apply_masters(frame.data, frame.exposure_time.value, bias, dark, dark_exposure, flat)
+    return frame_metrics(data, **params)
+
+
+class QualityProcessor:
+    """
+    Метрики качества кадров и отбраковка по порогам
+
+    Кадры оцениваются калиброванными (мастер-кадры применяются в памяти,
+    файлы не пишутся) - как и в живом режиме, поэтому пороги значат
+    одно и то же в обоих режимах. Для каждого кадра по бинированной
+    копии считаются уровень фона,
+    шум, число звезд, медианные FWHM и эксцентриситет звезд. Пороги
+    отбраковки задаются относительно медианы по серии (облака поднимают
+    фон и уменьшают число звезд, смаз увеличивает FWHM) и абсолютно для
+    эксцентриситета (вытянутые звезды при сбое гидирования).
+    """
+
+    def __init__(self, app, bin_factor=2, max_workers=None,
+                 max_background_ratio=1.5, min_stars_ratio=0.5,
+                 max_fwhm_ratio=1.5, max_eccentricity=0.6):
+        self.app = app
+        self.bin_factor = bin_factor
+        self.max_workers = get_worker_count(max_workers)
+        self.max_background_ratio = max_background_ratio
+        self.min_stars_ratio = min_stars_ratio
+        self.max_fwhm_ratio = max_fwhm_ratio
+        self.max_eccentricity = max_eccentricity
+
+    def compute_metrics(self, file_paths, master_bias=None, master_dark=None, master_flats=None):
+        """
+        Метрики для списка файлов в пуле процессов
+
+        С мастер-кадрами кадры калибруются в памяти; master_flats -
+        {фильтр: CCDData}, каждый кадр получает flat своего фильтра
+        (masters.assign_flats).
+        """
+        params = {'bin_factor': self.bin_factor}
+        if all(m is None for m in (master_bias, master_dark)) and not master_flats:
+            groups = [(None, file_paths)]
+        else:
+            from .masters import assign_flats
+            groups = [(flat, files) for _, flat, files in assign_flats(file_paths, master_flats or {})]
+
+        metrics = {}
+        for master_flat, files in groups:
+            calibration = None
+            if any(m is not None for m in (master_bias, master_dark, master_flat)):
+                processor = self.app.calibration_processor
+                bias, dark, dark_exposure, flat, _ = processor.prepare_masters(
+                    master_bias, master_dark, master_flat)
+                dark_seconds = dark_exposure.value if dark_exposure is not None else None
+                calibration = (processor.overscan_order, bias, dark, dark_seconds, flat)
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(calibration,)) as executor:
+                metrics.update(zip(files, executor.map(_file_metrics, files, [params] * len(files))))
+        results = [metrics[path] for path in file_paths]
+
+        table = Table()
+        table['file'] = [os.path.basename(p) for p in file_paths]
+        for name in METRIC_COLUMNS:
+            table[name] = [r[name] for r in results]
+        return table
+
+    def reject(self, table):
+        """
+        Отбраковка по порогам: добавляет колонки rejected и reason
+
+        Returns:
+        --------
+        astropy.table.Table
+            Та же таблица с результатами отбраковки
+        """
+        background = np.median(table['background'])
+        stars = np.median(table['n_stars'])
+        fwhm = np.nanmedian(table['fwhm']) if np.any(np.isfinite(table['fwhm'])) else np.nan
+
+        reasons = []
+        for row in table:
+            reason = []
+            if background > 0 and row['background'] > self.max_background_ratio * background:
+                reason.append('background')
+            if row['n_stars'] < self.min_stars_ratio * stars:
+                reason.append('stars')
+            if np.isfinite(fwhm) and row['fwhm'] > self.max_fwhm_ratio * fwhm:
+                reason.append('fwhm')
+            if row['eccentricity'] > self.max_eccentricity:
+                reason.append('eccentricity')
+            reasons.append(','.join(reason))
+
+        table['rejected'] = [bool(r) for r in reasons]
+        table['reason'] = reasons
+        return table
+
+    def process_files(self, file_paths, output_path, master_bias=None, master_dark=None,
+                      master_flats=None):
+        """Метрики, отбраковка и запись таблицы; возвращает таблицу"""
+        if not file_paths:
+            raise ValueError("Нет кадров для оценки качества")
+
+        self.app.log_command(f"Оценка качества: {len(file_paths)} кадров, "
+                             f"{self.max_workers} процессов")
+        if master_bias is None and master_dark is None and not master_flats:
+            self.app.log_command("  Мастер-кадров нет: метрики по сырым кадрам (фон включает bias и dark)")
+        table = self.reject(self.compute_metrics(file_paths, master_bias, master_dark, master_flats))
+
+        for row in table:
+            status = f"ОТБРАКОВАН ({row['reason']})" if row['rejected'] else "ок"
+            self.app.log_command(
+                f"  {row['file']}: фон {row['background']:.1f}, шум {row['noise']:.2f}, "
+                f"звезд {row['n_stars']}, FWHM {row['fwhm']:.2f}, e={row['eccentricity']:.2f} - {status}"
+            )
+
+        table.write(output_path, overwrite=True)
+        self.app.log_command(f"Отбраковано: {int(np.sum(table['rejected']))} из {len(table)}")
+        self.app.log_command(f"Таблица качества сохранена в {output_path}")
+        return table
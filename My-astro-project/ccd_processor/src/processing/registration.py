@@ -0,0 +1,295 @@
+"""
+Выравнивание кадров: фазовая корреляция (FFT) и уточнение по звездам
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.stats import sigma_clipped_stats
+from astropy.table import Table
+from scipy import ndimage
+
+from utils.frame import read_frame
+from utils.helpers import file_fingerprint
+from utils.journal import params_key
+from utils.tiling import get_worker_count
+from .centroids import extract_cutouts, centroid_com_batch, centroid_quadratic_batch
+
+# Состояние рабочего процесса: спектр опорного кадра и его звезды
+# передаются один раз при запуске процесса, а не с каждым кадром
+_worker_state = {}
+
+
+def bin_frame(data, factor):
+    """Бинирование кадра factor x factor (среднее), лишние строки/столбцы отбрасываются"""
+    data = np.asarray(data, dtype=np.float32)
+    if factor <= 1:
+        return data
+    ny, nx = data.shape[0] // factor, data.shape[1] // factor
+    return data[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor).mean(axis=(1, 3))
+
+
+def _prepare_for_fft(binned):
+    """Вычитание фона и окно Ханна - чтобы края кадра не давали ложный пик"""
+    prepared = binned - np.median(binned)
+    np.clip(prepared, 0, None, out=prepared)
+    window = np.outer(np.hanning(binned.shape[0]), np.hanning(binned.shape[1]))
+    return prepared * window.astype(np.float32)
+
+
+def reference_spectrum(data, factor):
+    """Комплексно сопряженный спектр опорного кадра (считается один раз)"""
+    return np.conj(np.fft.rfft2(_prepare_for_fft(bin_frame(data, factor))))
+
+
+def phase_correlation_shift(data, ref_spectrum, factor):
+    """
+    Сдвиг кадра относительно опорного по фазовой корреляции
+
+    Returns:
+    --------
+    tuple
+        (dx, dy) в пикселях полного разрешения: точка опорного кадра
+        (x, y) находится на кадре в (x + dx, y + dy)
+    """
+    binned = _prepare_for_fft(bin_frame(data, factor))
+    cross = np.fft.rfft2(binned) * ref_spectrum
+    cross /= np.maximum(np.abs(cross), 1e-12)
+    correlation = np.fft.irfft2(cross, s=binned.shape)
+
+    ny, nx = correlation.shape
+    py, px = np.unravel_index(np.argmax(correlation), correlation.shape)
+
+    # Субпиксельная вершина параболой по трем точкам вдоль каждой оси
+    def vertex(minus, center, plus):
+        denom = minus - 2 * center + plus
+        return 0.0 if denom == 0 else 0.5 * (minus - plus) / denom
+
+    sub_y = vertex(correlation[(py - 1) % ny, px], correlation[py, px], correlation[(py + 1) % ny, px])
+    sub_x = vertex(correlation[py, (px - 1) % nx], correlation[py, px], correlation[py, (px + 1) % nx])
+
+    # Циклический сдвиг -> знаковый
+    dy = (py + ny // 2) % ny - ny // 2 + sub_y
+    dx = (px + nx // 2) % nx - nx // 2 + sub_x
+    return dx * factor, dy * factor
+
+
+def find_reference_stars(data, max_stars=100, box_size=11, threshold_sigma=10.0):
+    """Яркие изолированные звезды опорного кадра для уточнения сдвига"""
+    data = np.asarray(data, dtype=np.float32)
+    _, median, std = sigma_clipped_stats(data[::4, ::4], sigma=3.0)
+    signal = data - median
+
+    # Локальные максимумы выше порога, не у края кадра
+    peaks = (signal == ndimage.maximum_filter(signal, size=box_size)) & (signal > threshold_sigma * std)
+    margin = box_size
+    peaks[:margin] = peaks[-margin:] = False
+    peaks[:, :margin] = peaks[:, -margin:] = False
+    ys, xs = np.nonzero(peaks)
+    if len(xs) == 0:
+        return np.empty((0, 2))
+
+    brightest = np.argsort(signal[ys, xs])[::-1][:max_stars]
+    positions = np.column_stack((xs[brightest], ys[brightest])).astype(np.float64)
+    return _refine(signal, positions, box_size)
+
+
+def _refine(signal, positions, box_size):
+    """Центроиды звезд: квадратичный фит, при неудаче - центр масс"""
+    cutouts, origins = extract_cutouts(signal, positions, box_size)
+    local = centroid_quadratic_batch(cutouts)
+    failed = ~np.all(np.isfinite(local), axis=1)
+    if np.any(failed):
+        local[failed] = centroid_com_batch(np.clip(cutouts[failed], 0, None))
+    return local + origins
+
+
+def fit_transform(reference, measured, estimate_rotation):
+    """
+    Преобразование measured ~ R @ reference + t по МНК (Кабш)
+
+    Returns:
+    --------
+    tuple
+        (угол в радианах, dx, dy)
+    """
+    if not estimate_rotation or len(reference) < 3:
+        dx, dy = np.median(measured - reference, axis=0)
+        return 0.0, float(dx), float(dy)
+
+    ref_center = reference.mean(axis=0)
+    meas_center = measured.mean(axis=0)
+    h = (reference - ref_center).T @ (measured - meas_center)
+    angle = np.arctan2(h[0, 1] - h[1, 0], h[0, 0] + h[1, 1])
+    c, s = np.cos(angle), np.sin(angle)
+    rotation = np.array([[c, -s], [s, c]])
+    dx, dy = meas_center - rotation @ ref_center
+    return float(angle), float(dx), float(dy)
+
+
+def _init_worker(ref_spectrum, ref_stars, params):
+    """Инициализация рабочего процесса"""
+    _worker_state['spectrum'] = ref_spectrum
+    _worker_state['stars'] = ref_stars
+    _worker_state['params'] = params
+
+
+def _register_frame(path, output_path):
+    """Выравнивание одного кадра (выполняется в рабочем процессе)"""
+    params = _worker_state['params']
+    frame = read_frame(path, dtype=np.float32)
+    data = frame.data
+
+    # 1. Грубый сдвиг по фазовой корреляции бинированных кадров
+    dx, dy = phase_correlation_shift(data, _worker_state['spectrum'], params['bin_factor'])
+    angle = 0.0
+    matched = 0
+
+    # 2. Уточнение по центроидам звезд опорного кадра
+    ref_stars = _worker_state['stars']
+    if len(ref_stars) > 0:
+        predicted = ref_stars + (dx, dy)
+        ny, nx = data.shape
+        half = params['box_size']
+        inside = ((predicted[:, 0] > half) & (predicted[:, 0] < nx - half) &
+                  (predicted[:, 1] > half) & (predicted[:, 1] < ny - half))
+        if np.count_nonzero(inside) >= 3:
+            signal = data - np.median(data[::4, ::4])
+            measured = _refine(signal, predicted[inside], params['box_size'])
+            residual = measured - predicted[inside]
+            good = np.all(np.isfinite(measured), axis=1) & np.all(np.abs(residual) < params['match_radius'], axis=1)
+            matched = int(np.count_nonzero(good))
+            if matched >= 3:
+                angle, dx, dy = fit_transform(ref_stars[inside][good], measured[good],
+                                              params['estimate_rotation'])
+
+    # 3. Перенос на сетку опорного кадра: out(p) = frame(R p + t)
+    c, s = np.cos(angle), np.sin(angle)
+    matrix = np.array([[c, s], [-s, c]])  # R в порядке осей (y, x)
+    aligned = ndimage.affine_transform(
+        data, matrix, offset=(dy, dx), order=3, mode='constant', cval=np.nan
+    ).astype(np.float32)
+
+    header = frame.header
+    for key in ('BZERO', 'BSCALE'):
+        header.remove(key, ignore_missing=True)
+    header['REGDX'] = (dx, 'Registration shift X, pixels')
+    header['REGDY'] = (dy, 'Registration shift Y, pixels')
+    header['REGROT'] = (np.degrees(angle), 'Registration rotation, degrees')
+    header['REGNSTAR'] = (matched, 'Stars used to refine registration')
+    header['HISTORY'] = 'Registered: FFT phase correlation + star centroids'
+    # float32 без масштабирования - кадр можно читать через memmap;
+    # запись через временный файл, чтобы сбой не оставил недописанный кадр
+    temp_path = output_path + ".part"
+    fits.PrimaryHDU(data=aligned, header=header).writeto(temp_path, overwrite=True)
+    os.replace(temp_path, output_path)
+
+    return {'dx': float(dx), 'dy': float(dy), 'angle': float(np.degrees(angle)), 'n_stars': matched}
+
+
+class RegistrationProcessor:
+    """
+    Выравнивание калиброванных кадров по опорному
+
+    Грубый сдвиг - фазовая корреляция бинированных кадров, уточнение
+    (и, опционально, поворот) - по центроидам ярких звезд опорного
+    кадра. Спектр опорного кадра и его звезды считаются один раз и
+    передаются в пул процессов при запуске; каждый процесс держит в
+    памяти только один кадр.
+    """
+
+    def __init__(self, app, bin_factor=4, estimate_rotation=False, max_stars=100,
+                 box_size=11, match_radius=3.0, max_workers=None):
+        self.app = app
+        self.bin_factor = bin_factor
+        self.estimate_rotation = estimate_rotation
+        self.max_stars = max_stars
+        self.box_size = box_size
+        self.match_radius = match_radius
+        self.max_workers = get_worker_count(max_workers)
+
+    def register_files(self, file_paths, output_dir, reference_index=0, journal=None):
+        """
+        Выравнивание кадров с записью в output_dir
+
+        С журналом запусков (utils.journal.RunJournal) кадры, уже
+        выровненные на тот же опорный кадр с теми же параметрами, не
+        пересчитываются, а кадр с ошибкой попадает в карантин вместо
+        прерывания всей серии.
+
+        Returns:
+        --------
+        list
+            Пути к выровненным кадрам (в порядке file_paths, без карантина)
+        """
+        if not file_paths:
+            raise ValueError("Нет кадров для выравнивания")
+        os.makedirs(output_dir, exist_ok=True)
+
+        reference_path = file_paths[reference_index]
+        self.app.log_command(f"Выравнивание: {len(file_paths)} кадров, "
+                             f"опорный {os.path.basename(reference_path)}, "
+                             f"{self.max_workers} процессов")
+
+        reference = read_frame(reference_path, dtype=np.float32).data
+        spectrum = reference_spectrum(reference, self.bin_factor)
+        ref_stars = find_reference_stars(reference, self.max_stars, self.box_size)
+        del reference
+        self.app.log_command(f"  Опорных звезд: {len(ref_stars)}")
+
+        params = {
+            'bin_factor': self.bin_factor,
+            'box_size': self.box_size,
+            'match_radius': self.match_radius,
+            'estimate_rotation': self.estimate_rotation,
+        }
+        output_paths = [
+            os.path.join(output_dir, f"registered_{os.path.basename(p)}") for p in file_paths
+        ]
+
+        # Ключ этапа: параметры и содержимое опорного кадра
+        key = params_key({**params, 'reference': file_fingerprint(reference_path)['sha256']}) \
+            if journal is not None else None
+        results = {}
+        todo = []
+        for i, path in enumerate(file_paths):
+            status = journal.status('register', path, key) if journal is not None else None
+            if status == 'done':
+                results[i] = journal.get('register', path)['result']
+            elif status is None:
+                todo.append(i)
+        skipped = len(file_paths) - len(results) - len(todo)
+        if journal is not None and (results or skipped):
+            self.app.log_command(f"  Журнал: уже выровнено {len(results)}, в карантине {skipped}, "
+                                 f"осталось {len(todo)}")
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                 initargs=(spectrum, ref_stars, params)) as executor:
+            futures = [(i, executor.submit(_register_frame, file_paths[i], output_paths[i])) for i in todo]
+            for done, (i, future) in enumerate(futures, 1):
+                filename = os.path.basename(file_paths[i])
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if journal is None:
+                        raise
+                    journal.record_failed('register', file_paths[i], key, e)
+                    self.app.log_command(f"  [{done}/{len(todo)}] {filename}: ОШИБКА, в карантин: {str(e)}")
+                    continue
+                results[i] = result
+                if journal is not None:
+                    journal.record_done('register', file_paths[i], key, [output_paths[i]], result)
+                self.app.log_command(
+                    f"  [{done}/{len(todo)}] {filename}: dx={result['dx']:.2f}, "
+                    f"dy={result['dy']:.2f}, rot={result['angle']:.3f}°, звезд {result['n_stars']}"
+                )
+
+        transforms = {'file': [], 'dx': [], 'dy': [], 'angle': [], 'n_stars': []}
+        for i in sorted(results):
+            transforms['file'].append(os.path.basename(file_paths[i]))
+            for name in ('dx', 'dy', 'angle', 'n_stars'):
+                transforms[name].append(results[i][name])
+        Table(transforms).write(os.path.join(output_dir, "transforms.fits"), overwrite=True)
+        return [output_paths[i] for i in sorted(results)]
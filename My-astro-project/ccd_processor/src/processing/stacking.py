@@ -0,0 +1,52 @@
+"""
+Сложение выровненных кадров в глубокое изображение (вне памяти)
+"""
+
+from .combine import FitsBandSource, combine_to_file
+
+
+class StackingProcessor:
+    """
+    Сложение выровненных калиброванных кадров
+
+    Кадры читаются через memmap полосами строк, для каждой полосы
+    выбросы вдоль стека отбрасываются (sigma) или winsorize-ются,
+    результат полосы сразу дописывается в файл. Использует ту же
+    машину комбинирования, что и мастер-кадры, поэтому память
+    ограничена mem_limit независимо от числа кадров.
+    """
+
+    def __init__(self, app, method='average', clip='sigma', low=3.0, high=3.0,
+                 mem_limit=1e9):
+        self.app = app
+        self.method = method
+        self.clip = clip
+        self.low = low
+        self.high = high
+        self.mem_limit = mem_limit
+
+    def stack_files(self, file_paths, output_path):
+        """Сложение кадров file_paths с записью в output_path"""
+        if not file_paths:
+            raise ValueError("Нет кадров для сложения")
+
+        self.app.log_command(f"Сложение: {len(file_paths)} кадров, метод {self.method}, "
+                             f"отбраковка {self.clip or 'нет'} ({self.low}/{self.high} σ)")
+
+        # Калиброванные кадры - в ADU: у каждого свой CALSCALE/CALZERO
+        source = FitsBandSource(file_paths, to_adu=True)
+        try:
+            header = source.header(0)
+            for key in ('CALSCALE', 'CALZERO'):
+                header.remove(key, ignore_missing=True)
+            header['HISTORY'] = f'Stacked {len(file_paths)} frames: {self.method}, clip={self.clip}'
+            combine_to_file(
+                source, output_path, header=header,
+                method=self.method, clip=self.clip, low=self.low, high=self.high,
+                center='median', dev='mad_std', mem_limit=self.mem_limit
+            )
+        finally:
+            source.close()
+
+        self.app.log_command(f"Сложенный кадр сохранен в {output_path}")
+        return output_path
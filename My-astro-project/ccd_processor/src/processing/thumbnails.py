@@ -0,0 +1,131 @@
+"""
+Миниатюры кадров с кэшем на диске
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.frame import read_frame
+from utils.tiling import get_worker_count
+
+# Версия алгоритма миниатюр: входит в ключ кэша, смена растяжки
+# автоматически делает старые миниатюры недействительными
+THUMBNAIL_VERSION = 1
+
+
+def make_thumbnail(data, size=128, low=0.5, high=99.5, asinh_a=0.1):
+    """
+    Миниатюра кадра: бинирование до size пикселей по большей стороне
+    и растяжка asinh между процентилями low и high
+
+    Returns:
+    --------
+    numpy.ndarray
+        uint8 (h, w), строки в порядке отображения (origin='lower')
+    """
+    data = np.asarray(data, dtype=np.float32)
+    factor = max(1, int(np.ceil(max(data.shape) / size)))
+    ny, nx = data.shape[0] // factor, data.shape[1] // factor
+    binned = data[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor).mean(axis=(1, 3))
+
+    finite = binned[np.isfinite(binned)]
+    if finite.size == 0:
+        return np.zeros(binned.shape, dtype=np.uint8)
+    vmin, vmax = np.percentile(finite, [low, high])
+    scaled = np.clip((binned - vmin) / max(vmax - vmin, 1e-12), 0, 1)
+    stretched = np.arcsinh(scaled / asinh_a) / np.arcsinh(1 / asinh_a)
+    image = np.nan_to_num(stretched * 255, nan=0).astype(np.uint8)
+    # В кадре y растет вверх, в изображении Tk - вниз
+    return image[::-1]
+
+
+def _make_thumbnail_file(path, cache_path, size):
+    """Миниатюра одного файла в кэш (выполняется в рабочем процессе)"""
+    thumbnail = make_thumbnail(read_frame(path, dtype=np.float32).data, size)
+    temp_path = cache_path + ".tmp.npy"
+    np.save(temp_path, thumbnail)
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+
+class ThumbnailProcessor:
+    """
+    Миниатюры кадров для обзорной сетки
+
+    Ключ кэша - путь, время изменения и размер файла (и размер
+    миниатюры), поэтому измененный или перезаписанный кадр получает
+    новую миниатюру, а повторный просмотр серии только читает
+    маленькие .npy файлы. Недостающие миниатюры строятся в пуле
+    процессов, каждый процесс сам пишет результат в кэш.
+    """
+
+    def __init__(self, app, size=128, max_workers=None):
+        self.app = app
+        self.size = size
+        self.max_workers = get_worker_count(max_workers)
+
+    def get_cache_dir(self):
+        """Папка кэша миниатюр"""
+        return os.path.join(self.app.config.working_directory, "thumbnails")
+
+    def get_cache_path(self, file_path):
+        """Путь к миниатюре файла в кэше (None, если файла нет)"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}|{THUMBNAIL_VERSION}"
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.get_cache_dir(), f"{name}.npy")
+
+    def load(self, file_path):
+        """Миниатюра из кэша или None"""
+        cache_path = self.get_cache_path(file_path)
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+        try:
+            return np.load(cache_path)
+        except (OSError, ValueError):
+            return None
+
+    def missing(self, file_paths):
+        """Файлы, для которых в кэше нет миниатюры"""
+        result = []
+        for path in file_paths:
+            cache_path = self.get_cache_path(path)
+            if cache_path is not None and not os.path.exists(cache_path):
+                result.append(path)
+        return result
+
+    def generate(self, file_paths):
+        """
+        Построение недостающих миниатюр
+
+        Yields:
+        -------
+        tuple
+            (путь к кадру, миниатюра или None при ошибке) по мере готовности
+        """
+        file_paths = self.missing(file_paths)
+        if not file_paths:
+            return
+        os.makedirs(self.get_cache_dir(), exist_ok=True)
+
+        executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [
+                executor.submit(_make_thumbnail_file, path, self.get_cache_path(path), self.size)
+                for path in file_paths
+            ]
+            for path, future in zip(file_paths, futures):
+                try:
+                    yield path, np.load(future.result())
+                except Exception as e:
+                    self.app.log_command(f"Ошибка миниатюры {os.path.basename(path)}: {str(e)}")
+                    yield path, None
+        finally:
+            # Окно обзора закрыли раньше - оставшиеся кадры не обрабатываем
+            executor.shutdown(cancel_futures=True)
@@ -3,6 +3,19 @@ Utility Modules
 """
 
 from .config import Config
-from .helpers import read_fits_with_unit, ensure_directory_exists
+from .helpers import read_fits_with_unit, ensure_directory_exists, file_fingerprint, fingerprint_matches
+from .tiling import iter_tiles, get_worker_count
+from .lazy import LazyProcessor, lazy_exports
+from .journal import RunJournal
 
-__all__ = ['Config', 'read_fits_with_unit', 'ensure_directory_exists']
\ No newline at end of file
+# Frame, read_frame и чтение ROI тянут numpy и astropy - импортируются по запросу
+__getattr__ = lazy_exports(__name__, {
+    'Frame': 'frame',
+    'read_frame': 'frame',
+    'TiledFrameReader': 'roi',
+    'roi_statistics': 'roi',
+})
+
+__all__ = ['Config', 'read_fits_with_unit', 'ensure_directory_exists', 'file_fingerprint',
+           'fingerprint_matches', 'Frame', 'read_frame', 'TiledFrameReader', 'roi_statistics',
+           'iter_tiles', 'get_worker_count', 'LazyProcessor', 'lazy_exports', 'RunJournal']
@@ -4,7 +4,12 @@
 
 import os
 import json
-from pathlib import Path
+
+from .helpers import file_fingerprint
+
+# Версия формата файла сессии
+SESSION_VERSION = 1
+MASTER_TYPES = ("bias", "dark", "flat")
 
 class Config:
     def __init__(self, config_file=None):
@@ -14,15 +19,25 @@ class Config:
         self.bias = []
         self.flats = []
         
-        # Мастер-кадры
+        # Мастер-кадры: отпечатки файлов (путь, размер, mtime, SHA-256)
         self.master_bias = None
         self.master_dark = None  
         self.master_flat = None
+        # Мастер flat по фильтрам: {фильтр: отпечаток}, кадры без фильтра - под None
+        self.master_flats = {}
         
         # Текущее состояние
         self.current_image_index = 0
         self.current_image_type = "lights"
         
+        # Параметры калибровки и производные продукты сессии
+        # (gain, e-/ADU, и read_noise, e-, появляются после построения PTC)
+        self.calibration = {"remove_cosmic_rays": False}
+        self.calibrated_lights = []
+        self.registered_lights = []
+        self.rejected_lights = []
+        self.products = {}
+        
         if config_file and os.path.exists(config_file):
             self.load_config(config_file)
             
@@ -41,6 +56,45 @@ class Config:
         elif file_type == "flats":
             self.flats.extend(files)
             
+    def set_master(self, master_type, file_path):
+        """Запомнить файл мастер-кадра вместе с отпечатком содержимого"""
+        if master_type not in MASTER_TYPES:
+            raise ValueError(f"Неизвестный тип мастер-кадра: {master_type}")
+        fingerprint = file_fingerprint(file_path) if file_path else None
+        setattr(self, f"master_{master_type}", fingerprint)
+        
+    def get_master(self, master_type):
+        """Отпечаток мастер-кадра или None"""
+        return getattr(self, f"master_{master_type}")
+        
+    def set_master_flats(self, paths):
+        """Запомнить мастер flat всех фильтров: {фильтр: путь} (пустой словарь - сброс)"""
+        self.master_flats = {flat_filter: file_fingerprint(path) for flat_filter, path in paths.items()}
+        
+    def update_products(self):
+        """Указатели на производные продукты, уже лежащие в рабочей директории"""
+        candidates = {
+            "quality": os.path.join("quality", "quality.fits"),
+            "live_quality": os.path.join("quality", "live_quality.fits"),
+            "catalog": os.path.join("catalogs", "detections.fits"),
+            "background": "background",
+            "photometry": os.path.join("photometry", "photometry.npz"),
+            "transforms": os.path.join("registered", "transforms.fits"),
+            "stacked": os.path.join("stacked", "master_light.fits"),
+            "thumbnails": "thumbnails",
+            "manifest": os.path.join("calibrated", "manifest.json"),
+            "journal": "run_journal.jsonl",
+            "ptc": os.path.join("ptc", "ptc.fits"),
+            "frame_stats": os.path.join("stats", "frame_stats.json"),
+            "histograms": "histograms",
+        }
+        self.products = {
+            name: os.path.join(self.working_directory, relative)
+            for name, relative in candidates.items()
+            if os.path.exists(os.path.join(self.working_directory, relative))
+        }
+        return self.products
+        
     def get_file_counts(self):
         """Получение количества файлов"""
         return {
@@ -53,23 +107,52 @@ class Config:
     def save_config(self, filepath):
         """Сохранение конфигурации"""
         config_data = {
+            "version": SESSION_VERSION,
             "working_directory": self.working_directory,
-            "lights": self.lights,
-            "darks": self.darks,
-            "bias": self.bias,
-            "flats": self.flats
+            "lights": list(self.lights),
+            "darks": list(self.darks),
+            "bias": list(self.bias),
+            "flats": list(self.flats),
+            "masters": {t: self.get_master(t) for t in MASTER_TYPES},
+            # Ключи JSON - строки: flat без фильтра записывается под ""
+            "master_flats": {flat_filter or "": fingerprint
+                             for flat_filter, fingerprint in self.master_flats.items()},
+            "calibration": self.calibration,
+            "calibrated_lights": list(self.calibrated_lights),
+            "registered_lights": list(self.registered_lights),
+            "rejected_lights": sorted(self.rejected_lights),
+            "products": self.products,
+            "current_image_type": self.current_image_type,
+            "current_image_index": self.current_image_index
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(config_data, f, indent=2)
+        # Запись через временный файл: сбой при сохранении не портит сессию
+        temp_path = filepath + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(config_data, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, filepath)
             
     def load_config(self, filepath):
         """Загрузка конфигурации"""
-        with open(filepath, 'r') as f:
+        with open(filepath, 'r', encoding='utf-8') as f:
             config_data = json.load(f)
             
         self.working_directory = config_data.get("working_directory", os.getcwd())
         self.lights = config_data.get("lights", [])
         self.darks = config_data.get("darks", [])
         self.bias = config_data.get("bias", [])
-        self.flats = config_data.get("flats", [])
\ No newline at end of file
+        self.flats = config_data.get("flats", [])
+        
+        # Поля сессии (в старых файлах конфигурации их нет)
+        masters = config_data.get("masters", {})
+        for master_type in MASTER_TYPES:
+            setattr(self, f"master_{master_type}", masters.get(master_type))
+        self.master_flats = {flat_filter or None: fingerprint
+                             for flat_filter, fingerprint in config_data.get("master_flats", {}).items()}
+        self.calibration = {**self.calibration, **config_data.get("calibration", {})}
+        self.calibrated_lights = config_data.get("calibrated_lights", [])
+        self.registered_lights = config_data.get("registered_lights", [])
+        self.rejected_lights = config_data.get("rejected_lights", [])
+        self.products = config_data.get("products", {})
+        self.current_image_type = config_data.get("current_image_type", "lights")
+        self.current_image_index = config_data.get("current_image_index", 0)
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Легкий контейнер кадра для внутренних циклов обработки
+"""
+
+import os
+import re
+
+import numpy as np
+import astropy.units as u
+from astropy.io import fits
+from astropy.nddata import CCDData
+
+EXPOSURE_KEYS = ('EXPTIME', 'EXPOSURE', 'EXP TIME', 'EXPTIME1')
+IMAGE_TYPE_KEYS = ('IMAGETYP', 'FRAMETYP', 'FRAME')
+FILTER_KEYS = ('FILTER', 'FILTER1', 'FILTNAME')
+TEMPERATURE_KEYS = ('CCD-TEMP', 'CCDTEMP', 'TEMPERAT', 'SET-TEMP')
+
+
+def _first_value(header, keys):
+    """Значение первого найденного ключа заголовка"""
+    for key in keys:
+        if key in header:
+            return header[key]
+    return None
+
+
+def parse_exposure(header, file_path=None):
+    """
+    Время экспозиции в секундах (как CCDProcessorApp.get_exposure_time)
+
+    Порядок: ключи заголовка (строки вида '120 s' разбираются), затем
+    имя файла ('light_120s.fits'). None - определить не удалось.
+    """
+    for key in EXPOSURE_KEYS:
+        if key in header:
+            value = header[key]
+            if isinstance(value, str):
+                match = re.search(r'(\d+\.?\d*)', value)
+                if not match:
+                    continue
+                value = match.group(1)
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                continue
+
+    if file_path:
+        match = re.search(r'(\d+\.?\d*)[sS]', os.path.basename(file_path))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def parse_filter(header):
+    """Имя фильтра из заголовка (FILTER, FILTER1, FILTNAME) или None"""
+    value = _first_value(header, FILTER_KEYS)
+    return str(value).strip() if value is not None else None
+
+
+class Frame:
+    """
+    Кадр: массив NumPy, заголовок и разобранные из него поля
+
+    В отличие от CCDData не несет маски, неопределенности и meta и не
+    копирует заголовок: внутри циклов обработки кадр - это буфер данных
+    и несколько чисел. В CCDData кадр переводится только на границе API
+    (to_ccddata), когда результат отдается наружу или пишется в файл.
+    """
+
+    __slots__ = ('data', 'header', 'path', 'unit', 'extension', 'plane',
+                 'exposure', 'image_type', 'filter', 'temperature')
+
+    def __init__(self, data, header=None, path=None, unit='adu', extension=None, plane=None):
+        self.data = data
+        self.header = header if header is not None else fits.Header()
+        self.path = path
+        self.unit = unit
+        # Расширение (EXTNAME или номер HDU) и индекс плоскости куба
+        self.extension = extension
+        self.plane = plane
+        self.exposure = parse_exposure(self.header, path)
+        image_type = _first_value(self.header, IMAGE_TYPE_KEYS)
+        self.image_type = str(image_type).strip().lower() if image_type is not None else None
+        self.filter = parse_filter(self.header)
+        temperature = _first_value(self.header, TEMPERATURE_KEYS)
+        try:
+            self.temperature = float(temperature) if temperature is not None else None
+        except (TypeError, ValueError):
+            self.temperature = None
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def exposure_time(self):
+        """Экспозиция как Quantity (1 с, если не определена - как в приложении)"""
+        return (self.exposure if self.exposure is not None else 1.0) * u.second
+
+    def to_ccddata(self, mask=None):
+        """CCDData с копией заголовка (граница API)"""
+        ccd = CCDData(self.data, unit=self.unit, header=self.header.copy(), mask=mask)
+        ccd.file_path = self.path
+        return ccd
+
+    @classmethod
+    def from_ccddata(cls, ccd_data):
+        """Кадр поверх данных и заголовка CCDData (без копирования)"""
+        return cls(np.asarray(ccd_data.data), ccd_data.header,
+                   getattr(ccd_data, 'file_path', None), ccd_data.unit)
+
+    def __repr__(self):
+        name = os.path.basename(self.path) if self.path else '-'
+        if self.extension is not None:
+            name += f"[{self.extension}]"
+        if self.plane:
+            name += f"[{','.join(map(str, self.plane))}]"
+        return (f"Frame({name}, shape={self.data.shape}, dtype={self.data.dtype}, "
+                f"exposure={self.exposure}, type={self.image_type}, filter={self.filter})")
+
+
+def read_frame(file_path, dtype=np.float64, unit='adu', hdu_index=None, plane=()):
+    """
+    Чтение FITS в Frame без CCDData
+
+    Берется первый HDU с изображением (как CCDData.read): у MEF - первое
+    расширение с данными, у куба - первая плоскость (все плоскости -
+    utils.mef.iter_planes). Читается только эта плоскость через
+    memmap/HDU.section, BZERO/BSCALE применяются при чтении.
+    """
+    from .mef import read_plane
+    try:
+        return read_plane(file_path, hdu_index, plane, dtype, unit)
+    except Exception as e:
+        raise Exception(f"Ошибка чтения {file_path}: {str(e)}")
@@ -3,10 +3,11 @@
 """
 
 import os
-from astropy.nddata import CCDData
+import hashlib
 
 def read_fits_with_unit(file_path, unit='adu'):
     """Чтение FITS файла с указанием unit"""
+    from astropy.nddata import CCDData
     try:
         ccd = CCDData.read(file_path, unit=unit)
         ccd.file_path = file_path  # Сохраняем путь для извлечения метаданных
@@ -20,4 +21,36 @@ def get_filename_without_extenstion(filepath):
 
 def ensure_directory_exists(directory):
     """Создание директории если не существует"""
-    os.makedirs(directory, exist_ok=True)
\ No newline at end of file
+    os.makedirs(directory, exist_ok=True)
+
+def file_fingerprint(file_path, chunk_size=1 << 20):
+    """Отпечаток файла: размер, время изменения и SHA-256 содержимого"""
+    stat = os.stat(file_path)
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return {
+        'path': file_path,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256.hexdigest(),
+    }
+
+def fingerprint_matches(fingerprint):
+    """
+    Файл не изменился с момента снятия отпечатка
+
+    Если размер и время изменения совпадают, хэш не пересчитывается -
+    проверка занимает один stat. Иначе сравнивается SHA-256 содержимого.
+    """
+    file_path = fingerprint['path']
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    if stat.st_size != fingerprint['size']:
+        return False
+    if stat.st_mtime_ns == fingerprint['mtime_ns']:
+        return True
+    return file_fingerprint(file_path)['sha256'] == fingerprint['sha256']
@@ -0,0 +1,150 @@
+"""
+Журнал запусков конвейера: возобновление после сбоя и карантин входных файлов
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from .helpers import file_fingerprint, fingerprint_matches
+
+JOURNAL_NAME = "run_journal.jsonl"
+
+
+def params_key(params):
+    """Короткий ключ параметров этапа (мастер-кадры, опции): смена параметров - новая работа"""
+    payload = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+class RunJournal:
+    """
+    Журнал выполненных единиц работы (кадр x этап)
+
+    Каждая запись - строка JSON, дописываемая в конец файла и
+    сбрасываемая на диск (fsync) сразу после того, как результат
+    записан: после сбоя в журнале есть все завершенные кадры, а
+    недописанная последняя строка просто игнорируется. В записи
+    хранятся отпечатки входного и выходных файлов (размер, время
+    изменения, SHA-256) и ключ параметров этапа.
+
+    Кадр считается выполненным, если входной файл, параметры и
+    выходные файлы не изменились; входной файл, на котором этап упал,
+    попадает в карантин и пропускается, пока не изменится сам файл
+    или карантин не будет снят.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        # Последняя строка файла недописана (сбой при записи)
+        self._torn = False
+        if os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def for_directory(cls, directory):
+        """Журнал рабочей директории"""
+        return cls(os.path.join(directory, JOURNAL_NAME))
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._torn = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Строка, недописанная при сбое
+                    continue
+                key = (record['stage'], record['input'])
+                if record['status'] == 'cleared':
+                    self._records.pop(key, None)
+                else:
+                    self._records[key] = record
+
+    def _append(self, record):
+        record['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            # Новая запись не должна продолжить недописанную строку
+            if self._torn:
+                f.write("\n")
+                self._torn = False
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        key = (record['stage'], record['input'])
+        if record['status'] == 'cleared':
+            self._records.pop(key, None)
+        else:
+            self._records[key] = record
+
+    def status(self, stage, input_path, key):
+        """
+        Состояние единицы работы
+
+        Returns:
+        --------
+        str or None
+            'done' - результат актуален, 'quarantined' - вход в карантине,
+            None - нужно выполнять
+        """
+        record = self._records.get((stage, os.path.abspath(input_path)))
+        if record is None or not fingerprint_matches(record['input_fingerprint']):
+            return None
+        if record['status'] == 'failed':
+            return 'quarantined'
+        if record['key'] != key:
+            return None
+        if all(fingerprint_matches(output) for output in record['outputs']):
+            return 'done'
+        return None
+
+    def get(self, stage, input_path):
+        """Последняя запись единицы работы или None"""
+        return self._records.get((stage, os.path.abspath(input_path)))
+
+    def record_done(self, stage, input_path, key, outputs, result=None):
+        """Единица работы выполнена: отпечатки входа и выходов, результат этапа"""
+        self._append({
+            'stage': stage,
+            'input': os.path.abspath(input_path),
+            'key': key,
+            'status': 'done',
+            'input_fingerprint': file_fingerprint(input_path),
+            'outputs': [file_fingerprint(path) for path in outputs],
+            'result': result,
+        })
+
+    def record_failed(self, stage, input_path, key, error):
+        """Этап упал на входном файле: файл уходит в карантин"""
+        try:
+            fingerprint = file_fingerprint(input_path)
+        except OSError:
+            # Файла нет - карантин до его появления
+            fingerprint = {'path': input_path, 'size': -1, 'mtime_ns': -1, 'sha256': ''}
+        self._append({
+            'stage': stage,
+            'input': os.path.abspath(input_path),
+            'key': key,
+            'status': 'failed',
+            'input_fingerprint': fingerprint,
+            'outputs': [],
+            'error': str(error),
+        })
+
+    def quarantined(self, stage=None):
+        """Входные файлы в карантине: список (этап, путь, ошибка)"""
+        return [
+            (record['stage'], record['input'], record.get('error'))
+            for record in self._records.values()
+            if record['status'] == 'failed' and (stage is None or record['stage'] == stage)
+        ]
+
+    def clear_quarantine(self, stage=None):
+        """Снятие карантина: файлы будут обработаны при следующем запуске"""
+        cleared = self.quarantined(stage)
+        for record_stage, input_path, _ in cleared:
+            self._append({'stage': record_stage, 'input': input_path, 'status': 'cleared'})
+        return len(cleared)
@@ -0,0 +1,51 @@
+"""
+Отложенный импорт тяжелых модулей
+"""
+
+import importlib
+
+
+class LazyProcessor:
+    """
+    Процессор, который создается при первом обращении к атрибуту
+
+    Модуль процессора (и вместе с ним numpy, astropy, scipy, ccdproc)
+    импортируется только тогда, когда процессор впервые нужен, а не
+    при запуске приложения. Созданный объект кладется в __dict__
+    экземпляра, поэтому дальнейшие обращения идут напрямую.
+    """
+
+    def __init__(self, module_name, class_name):
+        self.module_name = module_name
+        self.class_name = class_name
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        processor_class = getattr(importlib.import_module(self.module_name), self.class_name)
+        processor = processor_class(instance)
+        instance.__dict__[self.name] = processor
+        return processor
+
+
+def lazy_exports(package_name, exports):
+    """
+    __getattr__ для пакета: атрибут импортируется из подмодуля по запросу
+
+    Parameters:
+    -----------
+    package_name : str
+        Имя пакета (__name__ в __init__.py)
+    exports : dict
+        Имя атрибута -> имя подмодуля пакета
+    """
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+        module = importlib.import_module(f".{exports[name]}", package_name)
+        return getattr(module, name)
+    return __getattr__
@@ -0,0 +1,293 @@
+"""
+Многорасширенные FITS (MEF) и кубы данных: чтение и запись по плоскостям
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from astropy.io import fits
+
+from .frame import Frame
+
+# Заглушка полного хэша в HISTORY: заменяется при закрытии файла
+_HASH_PLACEHOLDER = 'Data SHA-256: ' + '0' * 64
+
+# Структурные ключи заголовка: при записи формируются заново
+STRUCTURAL_KEYS = {'SIMPLE', 'XTENSION', 'BITPIX', 'NAXIS', 'EXTEND', 'PCOUNT', 'GCOUNT',
+                   'BZERO', 'BSCALE', 'BLANK', 'CHECKSUM', 'DATASUM', 'END'}
+
+
+def scale_raw(raw, header, dtype=np.float64):
+    """
+    Немасштабированные данные -> физические значения
+
+    astropy не масштабирует BZERO/BSCALE для memmap-срезов, поэтому
+    файлы открываются с do_not_scale_image_data, а масштабирование
+    (и BLANK -> NaN для целых) делается здесь для каждой плоскости.
+    """
+    data = raw.astype(dtype)
+    blank = header.get('BLANK')
+    if blank is not None and raw.dtype.kind in 'iu':
+        data[raw == blank] = np.nan
+    bscale = float(header.get('BSCALE', 1.0))
+    bzero = float(header.get('BZERO', 0.0))
+    if bscale != 1.0:
+        data *= bscale
+    if bzero != 0.0:
+        data += bzero
+    return data
+
+
+def plane_indices(shape):
+    """Индексы 2D плоскостей массива формы shape (для 2D - один пустой индекс)"""
+    if len(shape) < 2:
+        return []
+    return list(np.ndindex(*shape[:-2]))
+
+
+def _open(file_path):
+    return fits.open(file_path, memmap=True, do_not_scale_image_data=True)
+
+
+def _image_shape(hdu):
+    return tuple(hdu.shape) if hdu.is_image else ()
+
+
+def list_hdus(file_path):
+    """
+    Структура файла по заголовкам (данные не читаются)
+
+    Returns:
+    --------
+    list
+        Словари {'index', 'name', 'shape', 'planes', 'header'} для всех
+        HDU с изображениями и пустого первичного HDU; shape () - нет данных
+    """
+    with _open(file_path) as hdul:
+        hdus = []
+        for index, hdu in enumerate(hdul):
+            if not hdu.is_image:
+                continue
+            shape = _image_shape(hdu)
+            hdus.append({
+                'index': index,
+                'name': hdu.name,
+                'shape': shape,
+                'planes': len(plane_indices(shape)),
+                'header': hdu.header.copy(),
+            })
+        return hdus
+
+
+def count_planes(file_path):
+    """Число 2D плоскостей во всех HDU файла"""
+    return sum(hdu['planes'] for hdu in list_hdus(file_path))
+
+
+def is_multi_plane(file_path):
+    """Файл содержит больше одной 2D плоскости (MEF или куб)"""
+    return count_planes(file_path) > 1
+
+
+def _extension_label(hdu, hdu_index):
+    """Метка расширения для Frame: EXTNAME или номер (None для первичного HDU)"""
+    return (hdu.name or hdu_index) if hdu_index else None
+
+
+def merged_header(hdul, hdu):
+    """Заголовок плоскости: первичный + заголовок расширения (как read_frame)"""
+    return hdul[0].header if hdu is hdul[0] else hdul[0].header + hdu.header
+
+
+def _read_plane(hdul, hdu_index, plane, dtype):
+    hdu = hdul[hdu_index]
+    raw = hdu.section[tuple(plane) + (slice(None), slice(None))]
+    return scale_raw(raw, hdu.header, dtype)
+
+
+def read_plane(file_path, hdu_index=None, plane=(), dtype=np.float64, unit='adu'):
+    """
+    Одна 2D плоскость файла в Frame без чтения остальных данных
+
+    Parameters:
+    -----------
+    hdu_index : int, optional
+        Номер HDU (по умолчанию первый HDU с изображением)
+    plane : tuple
+        Индекс плоскости по старшим осям куба (для 2D - пустой)
+    """
+    with _open(file_path) as hdul:
+        if hdu_index is None:
+            hdu_index = next((i for i, h in enumerate(hdul) if len(_image_shape(h)) >= 2), None)
+            if hdu_index is None:
+                raise ValueError("нет данных изображения")
+        hdu = hdul[hdu_index]
+        if not plane and len(_image_shape(hdu)) > 2:
+            plane = (0,) * (len(hdu.shape) - 2)
+        data = _read_plane(hdul, hdu_index, plane, dtype)
+        return Frame(data, merged_header(hdul, hdu), file_path, unit,
+                     extension=_extension_label(hdu, hdu_index), plane=tuple(plane))
+
+
+def iter_planes(file_path, dtype=np.float64, unit='adu'):
+    """
+    Все 2D плоскости файла по очереди (расширения, затем оси куба)
+
+    В памяти одновременно только одна плоскость: данные читаются
+    через memmap/HDU.section, сжатые расширения распаковываются по тайлам.
+
+    Yields:
+    -------
+    Frame
+        Плоскость с полями extension и plane
+    """
+    with _open(file_path) as hdul:
+        for hdu_index, hdu in enumerate(hdul):
+            if not hdu.is_image:
+                continue
+            header = None
+            for plane in plane_indices(_image_shape(hdu)):
+                if header is None:
+                    header = merged_header(hdul, hdu)
+                data = _read_plane(hdul, hdu_index, plane, dtype)
+                yield Frame(data, header, file_path, unit,
+                            extension=_extension_label(hdu, hdu_index), plane=plane)
+
+
+def _output_header(source_header, shape, primary, dtype):
+    """Заголовок выходного HDU той же формы с данными dtype"""
+    stub_data = np.zeros((1,) * len(shape), dtype=dtype) if shape else None
+    stub = fits.PrimaryHDU(data=stub_data) if primary else fits.ImageHDU(data=stub_data)
+    header = stub.header.copy()
+    for axis, size in enumerate(reversed(shape), start=1):
+        header[f'NAXIS{axis}'] = size
+    for card in source_header.cards:
+        key = card.keyword
+        if key in STRUCTURAL_KEYS or key.startswith('NAXIS') or key == '':
+            continue
+        if key == 'HISTORY':
+            header.add_history(card.value)
+        elif key == 'COMMENT':
+            header.add_comment(card.value)
+        else:
+            header[key] = (card.value, card.comment)
+    return header
+
+
+class PlaneWriter:
+    """
+    Потоковая запись результата с той же структурой HDU, что у исходного файла
+
+    Каждый HDU пишется через fits.StreamingHDU плоскость за плоскостью,
+    поэтому в памяти не бывает всего куба. Для каждого HDU с данными
+    по мере записи считается SHA-256 (по байтам в порядке FITS) и сумма
+    пикселей; при закрытии они вписываются в зарезервированные карточки
+    DATACHECK и PIXSUM этого HDU (заголовок того же размера
+    переписывается на месте).
+
+    Parameters:
+    -----------
+    output_path : str
+        Выходной файл (перезаписывается)
+    hdus : list
+        Структура исходного файла (list_hdus)
+    update_header : callable, optional
+        Дополнение заголовка каждого HDU с данными (метаданные обработки)
+    """
+
+    def __init__(self, output_path, hdus, dtype=np.float32, update_header=None):
+        self.output_path = output_path
+        self.hdus = hdus
+        self.dtype = np.dtype(dtype)
+        self.update_header = update_header
+        self._temp_path = output_path + ".part"
+        self._next = 0          # индекс следующего HDU в self.hdus
+        self._stream = None
+        self._stream_index = None
+        self._remaining = 0
+        self._hash = None
+        self._pixel_sum = 0.0
+        self._integrity = {}    # номер HDU в выходном файле -> (хэш, сумма)
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _open_next_hdu(self):
+        """Заголовок следующего HDU; пустые HDU записываются сразу"""
+        while self._next < len(self.hdus):
+            info = self.hdus[self._next]
+            output_index = self._next
+            self._next += 1
+            header = _output_header(info['header'], info['shape'], output_index == 0, self.dtype)
+            if info['planes'] == 0:
+                fits.StreamingHDU(self._temp_path, header).close()
+                continue
+            if self.update_header is not None:
+                self.update_header(header)
+            header['DATACHECK'] = ('0' * 32, 'SHA-256 first 32 chars hash')
+            header['PIXSUM'] = ('0', 'Sum of all pixel values')
+            header['HISTORY'] = _HASH_PLACEHOLDER
+            self._stream = fits.StreamingHDU(self._temp_path, header)
+            self._stream_index = output_index
+            self._remaining = info['planes']
+            self._hash = hashlib.sha256()
+            self._pixel_sum = 0.0
+            return
+        raise ValueError("Записано больше плоскостей, чем в исходном файле")
+
+    def write(self, data):
+        """Следующая плоскость (в порядке iter_planes исходного файла)"""
+        if self._stream is None:
+            self._open_next_hdu()
+        plane = np.ascontiguousarray(data, dtype=self.dtype.newbyteorder('>'))
+        self._hash.update(plane.tobytes())
+        self._pixel_sum += float(np.sum(plane, dtype=np.float64))
+        self._stream.write(plane)
+        self._remaining -= 1
+        if self._remaining == 0:
+            self._stream.close()
+            self._stream = None
+            self._integrity[self._stream_index] = (self._hash.hexdigest(), self._pixel_sum)
+
+    def close(self):
+        """Завершение файла: хвостовые пустые HDU, карточки целостности, переименование"""
+        if self._stream is not None:
+            self.abort()
+            raise ValueError("Записаны не все плоскости исходного файла")
+        while self._next < len(self.hdus):
+            self._open_next_hdu()
+            if self._stream is not None:
+                self.abort()
+                raise ValueError("Записаны не все плоскости исходного файла")
+
+        with fits.open(self._temp_path, mode='update', memmap=True) as hdul:
+            for index, (data_hash, pixel_sum) in self._integrity.items():
+                header = hdul[index].header
+                header['DATACHECK'] = data_hash[:32]
+                header['PIXSUM'] = f"{pixel_sum:.2f}"
+                # Число карточек не меняется - заголовок переписывается на месте
+                for card_index, card in enumerate(header.cards):
+                    if card.keyword == 'HISTORY' and card.value == _HASH_PLACEHOLDER:
+                        header[card_index] = f'Data SHA-256: {data_hash}'
+        os.replace(self._temp_path, self.output_path)
+        return self._integrity
+
+    def abort(self):
+        """Удаление недописанного файла"""
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
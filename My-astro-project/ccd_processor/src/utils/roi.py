@@ -0,0 +1,171 @@
+"""
+Чтение окон (ROI) кадра без загрузки всего изображения
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+from .mef import scale_raw
+
+
+def roi_statistics(data):
+    """
+    Статистика окна: среднее, медиана, стандартное отклонение, минимум, максимум
+
+    NaN не учитываются; для окна без конечных значений возвращаются NaN.
+    """
+    finite = data[np.isfinite(data)]
+    if finite.size == 0:
+        return dict.fromkeys(('mean', 'median', 'std', 'min', 'max'), float('nan'))
+    return {
+        'mean': float(finite.mean()),
+        'median': float(np.median(finite)),
+        'std': float(finite.std()),
+        'min': float(finite.min()),
+        'max': float(finite.max()),
+    }
+
+
+class TiledFrameReader:
+    """
+    Окна кадра с диска по тайлам
+
+    Файл открывается с memmap, а данные читаются через HDU.section: для
+    обычного изображения это срез отображенного в память файла, для
+    сжатого (CompImageHDU) распаковываются только нужные тайлы. Тайлы
+    tile_size x tile_size хранятся в LRU кэше ограниченного размера,
+    поэтому память и время просмотра не зависят от размера кадра.
+    Соседние тайлы подгружаются в фоне (prefetch), чтобы панорамирование
+    не ждало диска.
+    """
+
+    def __init__(self, file_path, tile_size=256, max_tiles=64, dtype=np.float32):
+        self.file_path = file_path
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.dtype = dtype
+
+        # Масштабирование BZERO/BSCALE с memmap недоступно - применяем сами (scale_raw)
+        self._hdul = fits.open(file_path, memmap=True, do_not_scale_image_data=True)
+        self._hdu = next((h for h in self._hdul if h.is_image and len(h.shape) >= 2), None)
+        if self._hdu is None:
+            self._hdul.close()
+            raise ValueError(f"{file_path}: нет данных изображения")
+        self.shape = tuple(self._hdu.shape[-2:])
+
+        self._tiles = OrderedDict()
+        # Чтение из одного файла не потокобезопасно: section под блокировкой
+        self._read_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=1)
+        self._pending = set()
+
+    @property
+    def header(self):
+        return self._hdu.header
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Остановка подгрузки и закрытие файла"""
+        self._prefetcher.shutdown(wait=True, cancel_futures=True)
+        self._tiles.clear()
+        self._hdul.close()
+
+    def _tile_bounds(self, ty, tx):
+        ny, nx = self.shape
+        y0, x0 = ty * self.tile_size, tx * self.tile_size
+        return y0, min(y0 + self.tile_size, ny), x0, min(x0 + self.tile_size, nx)
+
+    def _read_tile(self, ty, tx):
+        """Тайл из кэша или с диска"""
+        key = (ty, tx)
+        with self._cache_lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+
+        y0, y1, x0, x1 = self._tile_bounds(ty, tx)
+        # Лишние оси (например, куб из одного среза) - первый срез
+        index = (0,) * (len(self._hdu.shape) - 2) + (slice(y0, y1), slice(x0, x1))
+        with self._read_lock:
+            raw = self._hdu.section[index]
+        tile = scale_raw(raw, self._hdu.header, self.dtype)
+
+        with self._cache_lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+            self._pending.discard(key)
+        return tile
+
+    def read(self, y0, y1, x0, x1, prefetch=True):
+        """
+        Окно [y0:y1, x0:x1] кадра (границы обрезаются по размеру кадра)
+
+        Parameters:
+        -----------
+        y0, y1, x0, x1 : int
+            Границы окна в пикселях
+        prefetch : bool
+            Подгрузить в фоне тайлы вокруг окна
+
+        Returns:
+        --------
+        tuple
+            (данные окна, (y0, y1, x0, x1) после обрезки)
+        """
+        ny, nx = self.shape
+        y0, y1 = max(0, int(y0)), min(ny, int(y1))
+        x0, x1 = max(0, int(x0)), min(nx, int(x1))
+        if y1 <= y0 or x1 <= x0:
+            return np.empty((0, 0), dtype=self.dtype), (y0, y1, x0, x1)
+
+        size = self.tile_size
+        ty0, ty1 = y0 // size, (y1 - 1) // size
+        tx0, tx1 = x0 // size, (x1 - 1) // size
+        window = np.empty((y1 - y0, x1 - x0), dtype=self.dtype)
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                tile = self._read_tile(ty, tx)
+                tile_y0, tile_y1, tile_x0, tile_x1 = self._tile_bounds(ty, tx)
+                cy0, cy1 = max(y0, tile_y0), min(y1, tile_y1)
+                cx0, cx1 = max(x0, tile_x0), min(x1, tile_x1)
+                window[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = \
+                    tile[cy0 - tile_y0:cy1 - tile_y0, cx0 - tile_x0:cx1 - tile_x0]
+
+        if prefetch:
+            self._prefetch(ty0 - 1, ty1 + 1, tx0 - 1, tx1 + 1)
+        return window, (y0, y1, x0, x1)
+
+    def _prefetch(self, ty0, ty1, tx0, tx1):
+        """Фоновая подгрузка кольца тайлов вокруг окна"""
+        ny, nx = self.shape
+        max_ty = (ny - 1) // self.tile_size
+        max_tx = (nx - 1) // self.tile_size
+        with self._cache_lock:
+            keys = [
+                (ty, tx)
+                for ty in range(max(0, ty0), min(max_ty, ty1) + 1)
+                for tx in range(max(0, tx0), min(max_tx, tx1) + 1)
+                if (ty, tx) not in self._tiles and (ty, tx) not in self._pending
+            ]
+            # Кольцо не должно вытеснять из кэша только что прочитанное окно
+            keys = keys[:max(0, self.max_tiles // 2)]
+            self._pending.update(keys)
+        for key in keys:
+            try:
+                self._prefetcher.submit(self._read_tile, *key)
+            except RuntimeError:
+                # Читатель уже закрыт
+                break
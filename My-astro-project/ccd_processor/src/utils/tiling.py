@@ -0,0 +1,59 @@
+"""
+Разбиение кадров на перекрывающиеся тайлы для параллельной обработки
+"""
+
+import os
+from collections import namedtuple
+
+# window - срез тайла в кадре (с перекрытием)
+# core   - срез "чистой" части тайла в кадре (без перекрытия)
+# inner  - тот же срез core, но в координатах тайла
+Tile = namedtuple('Tile', ['window', 'core', 'inner'])
+
+
+def get_worker_count(max_workers=None):
+    """Количество рабочих процессов (по умолчанию - число ядер)"""
+    if max_workers is not None and max_workers > 0:
+        return int(max_workers)
+    return max(1, os.cpu_count() or 1)
+
+
+def _axis_ranges(length, tile_size, overlap):
+    """Диапазоны (core_start, core_stop, win_start, win_stop) вдоль одной оси"""
+    ranges = []
+    for start in range(0, length, tile_size):
+        stop = min(start + tile_size, length)
+        win_start = max(0, start - overlap)
+        win_stop = min(length, stop + overlap)
+        ranges.append((start, stop, win_start, win_stop))
+    return ranges
+
+
+def iter_tiles(shape, tile_size=1024, overlap=32):
+    """
+    Генератор перекрывающихся тайлов для двумерного кадра
+
+    Parameters:
+    -----------
+    shape : tuple
+        Размер кадра (ny, nx)
+    tile_size : int
+        Размер "чистой" части тайла в пикселях
+    overlap : int
+        Ширина перекрытия с каждой стороны тайла
+
+    Yields:
+    -------
+    Tile
+        Срезы окна тайла, его чистой части в кадре и в самом тайле.
+        Чистые части тайлов не пересекаются и покрывают кадр целиком,
+        поэтому при сшивке каждый пиксель берется ровно из одного тайла.
+    """
+    ny, nx = shape[-2], shape[-1]
+    for y0, y1, wy0, wy1 in _axis_ranges(ny, tile_size, overlap):
+        for x0, x1, wx0, wx1 in _axis_ranges(nx, tile_size, overlap):
+            yield Tile(
+                window=(slice(wy0, wy1), slice(wx0, wx1)),
+                core=(slice(y0, y1), slice(x0, x1)),
+                inner=(slice(y0 - wy0, y1 - wy0), slice(x0 - wx0, x1 - wx0))
+            )
@@ -0,0 +1,728 @@
+"""
+Тесты этапов обработки
+"""
+
+import os
+import sys
+import threading
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.nddata import CCDData
+
+from processing import distributed
+from processing.distributed import DistributedProcessor, WorkerContext, run_worker
+
+
+class _App(WorkerContext):
+    """Приложение без интерфейса: процессоры и конфигурация как у рабочего"""
+
+    def __init__(self, working_directory):
+        super().__init__()
+        self.config.set_working_directory(str(working_directory))
+        self.messages = []
+
+    def log_command(self, message):
+        self.messages.append(message)
+
+
+def _write_lights(directory, count=4, shape=(64, 64), seed=0):
+    """Light кадры: фон, несколько звезд и шум"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    stars = [(20.0, 20.0, 3000.0), (40.0, 30.0, 1500.0), (15.0, 45.0, 800.0)]
+    paths = []
+    for i in range(count):
+        data = rng.normal(1100.0, 10.0, shape)
+        for x, y, flux in stars:
+            data += flux * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * 1.5 ** 2))
+        header = fits.Header({'EXPTIME': 30.0, 'IMAGETYP': 'LIGHT'})
+        path = os.path.join(directory, f"light_{i:03d}.fits")
+        fits.writeto(path, data.astype(np.float32), header)
+        paths.append(path)
+    return paths, np.array([(x, y) for x, y, _ in stars])
+
+
+def _masters(shape=(64, 64)):
+    rng = np.random.default_rng(1)
+    bias = CCDData(np.full(shape, 100.0), unit='adu')
+    dark = CCDData(np.full(shape, 5.0), unit='adu', meta={'EXPTIME': 30.0})
+    flat = CCDData(rng.normal(1.0, 0.01, shape), unit='adu')
+    return bias, dark, flat
+
+
+@pytest.fixture(scope='module')
+def coordinator(tmp_path_factory):
+    """Координатор на 127.0.0.1:0 с двумя локальными рабочими процессами"""
+    app = _App(tmp_path_factory.mktemp("distributed"))
+    processor = DistributedProcessor(app, max_retries=1, connect_timeout=60.0)
+    processor.start("127.0.0.1:0", local_workers=2)
+    try:
+        yield app, processor
+    finally:
+        processor.stop()
+
+
+def test_distributed_calibration_matches_single_process(coordinator, tmp_path):
+    app, processor = coordinator
+    lights, _ = _write_lights(str(tmp_path))
+    bias, dark, flat = _masters()
+
+    remote, quarantined = processor.calibrate_files(lights, str(tmp_path / "remote"), bias, dark, flat)
+    local, _ = app.calibration_processor.calibrate_to_directory(
+        lights, str(tmp_path / "local"), bias, dark, flat)
+
+    assert quarantined == []
+    assert [os.path.basename(p) for p in remote] == [os.path.basename(p) for p in local]
+    for remote_path, local_path in zip(remote, local):
+        np.testing.assert_array_equal(fits.getdata(remote_path), fits.getdata(local_path))
+
+
+def test_distributed_photometry_matches_single_process(coordinator, tmp_path):
+    app, processor = coordinator
+    lights, positions = _write_lights(str(tmp_path), seed=2)
+
+    remote = processor.measure_photometry(lights, positions, str(tmp_path / "remote.npz"))
+    local = app.photometry_processor.process_files(lights, positions, str(tmp_path / "local.npz"))
+
+    assert np.all(np.isfinite(local['net_flux']))
+    assert set(remote) == set(local)
+    for name, values in local.items():
+        if values.dtype.kind in 'fc':
+            np.testing.assert_allclose(remote[name], values, rtol=1e-6, equal_nan=True)
+        else:
+            np.testing.assert_array_equal(remote[name], values)
+
+
+def test_distributed_task_failing_once_is_retried(tmp_path, monkeypatch):
+    # Рабочие в потоках этого процесса - чтобы видеть подмененную задачу
+    attempts = []
+
+    def flaky(context, value):
+        attempts.append(value)
+        if attempts.count(value) == 1:
+            raise RuntimeError("сбой первой попытки")
+        return value * 2
+
+    monkeypatch.setitem(distributed.TASKS, 'flaky', flaky)
+    app = _App(tmp_path)
+    processor = DistributedProcessor(app, max_retries=1, connect_timeout=30.0)
+    processor.start("127.0.0.1:0", authkey=b"test")
+    workers = [threading.Thread(target=run_worker, args=(processor.address, b"test"), daemon=True)
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    try:
+        results, errors = processor.run('flaky', [(1,), (2,), (3,)])
+    finally:
+        processor.stop()
+        for worker in workers:
+            worker.join(timeout=10)
+
+    assert errors == {}
+    assert results == {0: 2, 1: 4, 2: 6}
+    assert sorted(attempts) == [1, 1, 2, 2, 3, 3]
+    assert any("Повтор задачи flaky" in message for message in app.messages)
+
+
+def _stack_with_outliers(n_frames=21, shape=(48, 40), seed=3):
+    """Кадры смещения с космическими частицами и горячими пикселями"""
+    rng = np.random.default_rng(seed)
+    stack = rng.normal(1000.0, 10.0, (n_frames,) + shape)
+    hits = rng.integers(0, [n_frames, shape[0], shape[1]], (shape[0] * shape[1] // 8, 3))
+    stack[hits[:, 0], hits[:, 1], hits[:, 2]] += rng.uniform(100.0, 5000.0, len(hits))
+    return stack
+
+
+def _masked_reference(stack, method, low, high, center, dev):
+    """
+    Эталон ccdproc.Combiner: astropy sigma_clip (одна итерация) на
+    маскированном стеке, затем np.ma.average / np.ma.median и
+    неопределенность ccdproc (std или 1.4826 * MAD, деленные на sqrt(n))
+    """
+    import warnings
+    from astropy.stats import mad_std, sigma_clip
+
+    stdfunc = mad_std if dev == 'mad_std' else np.ma.std
+    cenfunc = np.ma.median if center == 'median' else np.ma.mean
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        clipped = sigma_clip(np.ma.masked_invalid(stack), sigma_lower=low, sigma_upper=high,
+                             axis=0, maxiters=1, cenfunc=cenfunc, stdfunc=stdfunc, masked=True)
+    count = (~np.ma.getmaskarray(clipped)).sum(axis=0)
+    if method == 'average':
+        data = np.ma.average(clipped, axis=0)
+        deviation = np.ma.std(clipped, axis=0)
+    else:
+        data = np.ma.median(clipped, axis=0)
+        deviation = 1.4826 * np.ma.median(np.ma.abs(clipped - data), axis=0)
+    return data.filled(np.nan), (deviation / np.sqrt(count)).filled(np.nan), count
+
+
+# Параметры отбраковки мастер-кадров: bias/dark и flat (MastersProcessor)
+MASTER_COMBINE = [
+    ('average', 5.0, 5.0, 'median', 'mad_std'),
+    ('median', 5.0, 5.0, 'median', 'mad_std'),
+    ('average', 3.0, 3.0, 'mean', 'std'),
+    ('median', 3.0, 3.0, 'mean', 'std'),
+]
+
+
+@pytest.mark.parametrize('method, low, high, center, dev', MASTER_COMBINE)
+def test_combine_matches_masked_sigma_clip(method, low, high, center, dev):
+    from processing.combine import ArrayBandSource, combine_to_ccd
+
+    stack = _stack_with_outliers()
+    expected, expected_uncertainty, count = _masked_reference(stack, method, low, high, center, dev)
+    assert (count < len(stack)).any()
+    options = dict(method=method, clip='sigma', low=low, high=high, center=center, dev=dev)
+
+    # Одна полоса в одном потоке и несколько полос, каждая поделена между потоками
+    single = combine_to_ccd(ArrayBandSource(list(stack)), max_workers=1, **options)
+    split = combine_to_ccd(ArrayBandSource(list(stack)), mem_limit=stack[0].nbytes * 3,
+                           max_workers=3, **options)
+
+    for ccd in (single, split):
+        np.testing.assert_allclose(ccd.data, expected, rtol=1e-12, atol=1e-9)
+        np.testing.assert_allclose(ccd.uncertainty.array, expected_uncertainty, rtol=1e-10, atol=1e-9)
+        assert not ccd.mask.any()
+        assert ccd.meta['NCOMBINE'] == len(stack)
+
+
+def test_combine_band_split_is_exercised():
+    from processing.combine import band_height
+
+    stack = _stack_with_outliers()
+    height = band_height(len(stack), stack.shape[2], stack[0].nbytes * 3, np.float64)
+    assert 1 < height < stack.shape[1]
+
+
+def _write_mef_with_overscan(path, n_ext=2, shape=(40, 50), seed=4):
+    """MEF: пустой первичный HDU и расширения с overscan справа (BIASSEC/TRIMSEC)"""
+    rng = np.random.default_rng(seed)
+    hdus = [fits.PrimaryHDU(header=fits.Header({'EXPTIME': 30.0}))]
+    for i in range(n_ext):
+        data = rng.normal(1000.0, 5.0, shape)
+        data += np.linspace(0.0, 20.0, shape[0])[:, None]
+        data[:, :40] += 200.0 * (i + 1)
+        header = fits.Header({'EXTNAME': f'AMP{i + 1}', 'BIASSEC': '[41:50,1:40]',
+                              'TRIMSEC': '[1:40,1:38]'})
+        hdus.append(fits.ImageHDU(data.astype(np.float32), header))
+    fits.HDUList(hdus).writeto(path)
+
+
+def test_calibrate_planes_applies_overscan_per_hdu(tmp_path):
+    from processing.overscan import subtract_overscan
+    from utils.mef import read_plane
+
+    app = _App(tmp_path)
+    path = str(tmp_path / "mef.fits")
+    _write_mef_with_overscan(path)
+    bias = CCDData(np.full((38, 40), 10.0), unit='adu')
+
+    count = app.calibration_processor.calibrate_planes(path, str(tmp_path / "out.fits"), bias, None, None)
+
+    assert count == 2
+    with fits.open(str(tmp_path / "out.fits")) as hdul:
+        assert 'BIASSEC' not in hdul[0].header
+        for index in (1, 2):
+            frame = read_plane(path, index)
+            assert subtract_overscan(frame)
+            expected = np.clip(frame.data - 10.0, 0, None)
+            assert hdul[index].data.shape == (38, 40)
+            assert hdul[index].header['OVSCSEC'] == '[41:50,1:40]'
+            assert 'BIASSEC' not in hdul[index].header
+            np.testing.assert_allclose(hdul[index].data, expected, rtol=1e-6)
+
+
+def test_calibrate_planes_rejects_mismatched_master(tmp_path):
+    app = _App(tmp_path)
+    path = str(tmp_path / "mef.fits")
+    _write_mef_with_overscan(path)
+    untrimmed = CCDData(np.full((40, 50), 10.0), unit='adu')
+
+    with pytest.raises(ValueError, match="Bias"):
+        app.calibration_processor.calibrate_planes(path, str(tmp_path / "out.fits"), untrimmed, None, None)
+    assert not os.path.exists(str(tmp_path / "out.fits"))
+
+
+def test_calibrate_planes_cleans_with_session_noise_model(tmp_path, monkeypatch):
+    from processing import cosmic_rays
+
+    calls = []
+
+    def fake_lacosmic(tile_data, params):
+        calls.append(params)
+        return np.asarray(tile_data, dtype=np.float32), np.zeros(tile_data.shape, dtype=bool)
+
+    monkeypatch.setattr(cosmic_rays, '_lacosmic_tile', fake_lacosmic)
+    app = _App(tmp_path)
+    app.config.calibration.update(gain=2.5, read_noise=4.0)
+    path = str(tmp_path / "mef.fits")
+    _write_mef_with_overscan(path)
+
+    app.calibration_processor.calibrate_planes(path, str(tmp_path / "out.fits"), None, None, None,
+                                               remove_cosmic_rays=True)
+
+    assert len(calls) == 2
+    assert all(params['gain'] == 2.5 and params['readnoise'] == 4.0 for params in calls)
+    assert app.calibration_processor.cosmic_ray_processor.params['gain'] == 1.0
+
+
+def test_cosmic_ray_params_fall_back_to_header_then_defaults(tmp_path):
+    app = _App(tmp_path)
+    processor = app.calibration_processor.cosmic_ray_processor
+    header = fits.Header({'GAIN': 1.8, 'RDNOISE': 9.0})
+
+    assert processor.frame_params()['gain'] == 1.0
+    assert processor.frame_params(fits.Header({'GAIN': 'n/a'}))['readnoise'] == 6.5
+    params = processor.frame_params(header)
+    assert (params['gain'], params['readnoise']) == (1.8, 9.0)
+
+    app.config.calibration.update(gain=2.5, read_noise=4.0)
+    params = processor.frame_params(header)
+    assert (params['gain'], params['readnoise']) == (2.5, 4.0)
+
+    app.config.calibration['cosmic_rays'] = {'sigclip': 6.0, 'readnoise': 5.0}
+    params = processor.frame_params(header)
+    assert (params['sigclip'], params['gain'], params['readnoise']) == (6.0, 2.5, 5.0)
+
+
+def test_magnitudes_of_non_positive_flux_are_nan():
+    from processing.photometry import PhotometryProcessor
+
+    net_flux = np.array([[1000.0, 0.0, -1000.0]])
+    mag = PhotometryProcessor.magnitudes(net_flux, [10.0], [25.0])
+
+    np.testing.assert_allclose(mag[0, 0], 25.0 - 2.5 * np.log10(100.0))
+    assert np.isnan(mag[0, 1:]).all()
+
+
+def _star_cutouts(centers, size=11, background=200.0, noise=0.0, seed=5):
+    """Вырезки с гауссовой звездой на постоянном фоне"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size]
+    cutouts = []
+    for x, y in centers:
+        star = 1000.0 * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * 1.6 ** 2))
+        cutouts.append(background + star + rng.normal(0.0, noise, star.shape))
+    return np.array(cutouts)
+
+
+def test_centroid_1dg_batch_recovers_centers_on_background():
+    from processing.centroids import centroid_1dg_batch
+
+    centers = np.array([(5.0, 5.0), (4.3, 6.7), (6.8, 3.2)])
+    result = centroid_1dg_batch(_star_cutouts(centers))
+
+    np.testing.assert_allclose(result, centers, atol=1e-3)
+
+
+def test_centroid_1dg_batch_marks_only_degenerate_star_nan():
+    from processing.centroids import _solve_batch, centroid_1dg_batch
+
+    cutouts = _star_cutouts([(5.0, 5.0), (4.3, 6.7)])
+    cutouts = np.concatenate((cutouts, np.zeros((1, 11, 11))))
+    result = centroid_1dg_batch(cutouts)
+
+    np.testing.assert_allclose(result[:2], [(5.0, 5.0), (4.3, 6.7)], atol=1e-3)
+    assert np.isnan(result[2]).all()
+
+    steps = _solve_batch(np.stack((2 * np.eye(4), np.zeros((4, 4)))), np.ones((2, 4)))
+    np.testing.assert_allclose(steps[0], 0.5)
+    assert np.isnan(steps[1]).all()
+
+
+def test_centroid_1dg_batch_matches_photutils():
+    centroids = pytest.importorskip('photutils.centroids')
+    from processing.centroids import centroid_1dg_batch
+
+    centers = [(5.0, 5.0), (4.3, 6.7), (6.8, 3.2), (5.5, 4.1)]
+    cutouts = _star_cutouts(centers, noise=3.0)
+    expected = np.array([centroids.centroid_1dg(cutout) for cutout in cutouts])
+
+    np.testing.assert_allclose(centroid_1dg_batch(cutouts), expected, atol=1e-3)
+
+
+def test_stack_converts_calibrated_frames_to_adu(tmp_path):
+    from processing.calibration import save_as_uint16
+    from processing.stacking import StackingProcessor
+
+    # Одна сцена, у второго кадра другой диапазон - другие CALSCALE/CALZERO
+    rng = np.random.default_rng(5)
+    scene = rng.uniform(100.0, 1000.0, (32, 32))
+    paths = []
+    for i, frame in enumerate((scene, scene * 3.0 + 50.0)):
+        path = str(tmp_path / f"cal_{i}.fits")
+        save_as_uint16(CCDData(frame, unit='adu', meta=fits.Header()), path)
+        paths.append(path)
+    assert fits.getheader(paths[0])['CALSCALE'] != fits.getheader(paths[1])['CALSCALE']
+
+    app = _App(tmp_path)
+    output = StackingProcessor(app, method='average', clip=None).stack_files(paths, str(tmp_path / "stack.fits"))
+
+    # uint16 отбрасывает дробную часть: до одного шага CALSCALE на кадр
+    expected = (scene + scene * 3.0 + 50.0) / 2.0
+    step = sum(fits.getheader(path)['CALSCALE'] for path in paths) / 2.0
+    np.testing.assert_allclose(fits.getdata(output), expected, atol=step + 1e-3)
+    assert 'CALSCALE' not in fits.getheader(output)
+
+
+def _write_flats(directory, filters=('R', 'V'), count=3, shape=(24, 24)):
+    rng = np.random.default_rng(6)
+    paths = []
+    for flat_filter in filters:
+        for i in range(count):
+            path = os.path.join(directory, f"flat_{flat_filter}_{i}.fits")
+            header = fits.Header({'EXPTIME': 1.0, 'IMAGETYP': 'FLAT', 'FILTER': flat_filter})
+            fits.writeto(path, rng.normal(20000.0, 100.0, shape).astype(np.float32), header)
+            paths.append(path)
+    return paths
+
+
+def test_master_flats_keep_filter_and_match_lights(tmp_path):
+    from processing.masters import MastersProcessor, assign_flats, flat_for
+    from utils.config import Config
+
+    app = _App(tmp_path)
+    masters = MastersProcessor(app).create_master_flats(_write_flats(str(tmp_path)))
+    assert {name: master.header['FILTER'] for name, master in masters.items()} == {'R': 'R', 'V': 'V'}
+
+    lights = []
+    for name, light_filter in (('a', 'V'), ('b', 'R'), ('c', 'B')):
+        path = str(tmp_path / f"light_{name}.fits")
+        fits.writeto(path, np.zeros((24, 24), np.float32), fits.Header({'FILTER': light_filter}))
+        lights.append(path)
+    groups = assign_flats(lights, masters)
+    assert [(light_filter, flat, files) for light_filter, flat, files in groups] == [
+        ('V', masters['V'], [lights[0]]), ('R', masters['R'], [lights[1]]), ('B', None, [lights[2]])]
+
+    # Flat без фильтра подходит всем, flat другого фильтра - никому
+    assert flat_for({None: masters['R']}, 'V') is masters['R']
+    assert flat_for({'R': masters['R']}, None) is masters['R']
+    assert flat_for({'R': masters['R'], 'V': masters['V']}, None) is None
+
+    paths = {}
+    for name, master in masters.items():
+        paths[name] = str(tmp_path / f"master_flat_{name}.fits")
+        master.write(paths[name])
+    config = Config()
+    config.set_master_flats({**paths, None: paths['R']})
+    config.save_config(str(tmp_path / "session.json"))
+    loaded = Config(str(tmp_path / "session.json"))
+    assert loaded.master_flats == config.master_flats
+    assert loaded.master_flats[None]['path'] == paths['R']
+
+
+def test_live_accepts_complete_mef_and_rejects_truncated(tmp_path):
+    pytest.importorskip('scipy')
+    from processing.live import is_fits_complete
+
+    path = str(tmp_path / "mef.fits")
+    _write_mef_with_overscan(path)
+    with fits.open(path) as hdul:
+        assert hdul[0].data is None
+    assert is_fits_complete(path)
+
+    truncated = str(tmp_path / "truncated.fits")
+    with open(path, 'rb') as source, open(truncated, 'wb') as target:
+        target.write(source.read()[:-4000])
+    assert not is_fits_complete(truncated)
+
+
+def test_manifest_diff_and_subtree_verification(tmp_path):
+    import shutil
+    from processing.manifest import ManifestProcessor
+
+    source, target = tmp_path / "source", tmp_path / "target"
+    source.mkdir()
+    for i in range(5):
+        fits.writeto(str(source / f"frame_{i}.fits"), np.full((8, 8), i, dtype=np.uint16))
+    shutil.copytree(str(source), str(target))
+
+    def touch_pixel(path, value):
+        with fits.open(path, mode='update') as hdul:
+            hdul[0].data[0, 0] = value
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    manifests = ManifestProcessor(_App(tmp_path), max_workers=2)
+    source_manifest = manifests.write(str(source))
+    manifests.write(str(target))
+    touch_pixel(str(target / "frame_3.fits"), 100)
+    target_manifest = manifests.write(str(target))
+
+    assert target_manifest['rehashed'] == 1
+    assert ManifestProcessor.diff(source_manifest, target_manifest) == {
+        'changed': ['frame_3.fits'], 'only_in_source': [], 'only_in_target': []
+    }
+
+    # После записи манифеста правим кадр: ломается только его поддерево
+    touch_pixel(str(source / "frame_3.fits"), 200)
+    assert manifests.verify(str(source), mode='subtree', level=1, index=0)['is_valid']
+    broken = manifests.verify(str(source), mode='subtree', level=1, index=1)
+    assert not broken['is_valid'] and broken['changed'] == ['frame_3.fits']
+    assert manifests.verify(str(source))['changed'] == ['frame_3.fits']
+
+
+def test_journal_resumes_calibration_and_quarantines_failures(tmp_path):
+    from utils.journal import RunJournal
+
+    app = _App(tmp_path)
+    lights, _ = _write_lights(str(tmp_path), count=3)
+    broken = str(tmp_path / "light_broken.fits")
+    fits.writeto(broken, np.zeros((32, 32), dtype=np.float32), fits.Header({'EXPTIME': 30.0}))
+    lights.insert(1, broken)
+    bias, dark, flat = _masters()
+    output_dir = str(tmp_path / "calibrated")
+
+    journal = RunJournal.for_directory(str(tmp_path))
+    outputs, quarantined = app.calibration_processor.calibrate_to_directory(
+        lights, output_dir, bias, dark, flat, journal=journal)
+    assert quarantined == [broken]
+    assert len(outputs) == 3
+    mtimes = [os.stat(path).st_mtime_ns for path in outputs]
+
+    # Сбой посреди записи: недописанная строка в конце журнала
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"stage": "calibrate", "inp')
+
+    journal = RunJournal.for_directory(str(tmp_path))
+    assert [entry[1] for entry in journal.quarantined('calibrate')] == [broken]
+    resumed, quarantined = app.calibration_processor.calibrate_to_directory(
+        lights, output_dir, bias, dark, flat, journal=journal)
+    assert resumed == outputs and quarantined == [broken]
+    assert [os.stat(path).st_mtime_ns for path in resumed] == mtimes
+    assert any("уже калибровано 3, в карантине 1, осталось 0" in message for message in app.messages)
+
+    assert journal.clear_quarantine('calibrate') == 1
+    assert RunJournal.for_directory(str(tmp_path)).quarantined() == []
+
+
+def test_histogram_percentiles_on_int16_bzero_data(tmp_path):
+    from processing.histogram import iter_histogram
+
+    rng = np.random.default_rng(6)
+    data = rng.integers(1, 65536, (50, 37)).astype(np.uint16)
+    data[::7, ::5] = 0
+    path = str(tmp_path / "frame.fits")
+    fits.writeto(path, data)
+    # uint16 хранится как int16 с BZERO=32768; BLANK - сырое значение нуля
+    with fits.open(path, mode='update', do_not_scale_image_data=True) as hdul:
+        assert hdul[0].data.dtype.kind == 'i' and hdul[0].header['BZERO'] == 32768
+        hdul[0].header['BLANK'] = -32768
+
+    for histogram in iter_histogram(path, chunk_rows=8):
+        pass
+
+    valid = data[data > 0].astype(np.float64)
+    assert histogram.complete
+    assert histogram.blank == data.size - valid.size
+    assert histogram.total == valid.size
+    q = [0.0, 1.0, 25.0, 50.0, 99.0, 100.0]
+    np.testing.assert_array_equal(histogram.percentile(q), np.percentile(valid, q, method='lower'))
+    np.testing.assert_allclose(histogram.mean(), valid.mean())
+
+
+def _star_field(positions, shape=(128, 128), seed=7):
+    """Кадр с гауссовыми звездами в positions (x, y) на шумном фоне"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    data = rng.normal(100.0, 2.0, shape)
+    for x, y in positions:
+        data += 2000.0 * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * 1.5 ** 2))
+    return data.astype(np.float32)
+
+
+def test_registration_recovers_known_shift(tmp_path):
+    pytest.importorskip('scipy')
+    from processing.registration import RegistrationProcessor
+
+    grid = np.arange(28.0, 101.0, 18.0)
+    rng = np.random.default_rng(8)
+    stars = np.array([(x, y) for x in grid for y in grid]) + rng.uniform(-2.0, 2.0, (len(grid) ** 2, 2))
+    shift = np.array([5.3, -3.6])
+    paths = []
+    for i, positions in enumerate((stars, stars + shift)):
+        paths.append(str(tmp_path / f"frame_{i}.fits"))
+        fits.writeto(paths[-1], _star_field(positions, seed=i))
+
+    processor = RegistrationProcessor(_App(tmp_path), bin_factor=2, max_workers=1)
+    registered = processor.register_files(paths, str(tmp_path / "registered"))
+
+    header = fits.getheader(registered[1])
+    assert header['REGNSTAR'] >= 3
+    np.testing.assert_allclose((header['REGDX'], header['REGDY']), shift, atol=0.1)
+    np.testing.assert_allclose((fits.getheader(registered[0])['REGDX'],
+                                fits.getheader(registered[0])['REGDY']), (0.0, 0.0), atol=0.1)
+
+
+def test_detection_keeps_one_star_per_tile_overlap():
+    pytest.importorskip('photutils')
+    from processing.detection import StarDetectionProcessor
+
+    # Звезды на границах тайлов 64x64 и в их зонах перекрытия
+    stars = np.array([(63.6, 30.0), (64.4, 100.0), (30.0, 63.5), (100.0, 64.2),
+                      (64.0, 64.0), (127.8, 40.0), (20.0, 20.0), (140.0, 140.0)])
+    data = _star_field(stars, shape=(160, 160))
+
+    tiled = StarDetectionProcessor(None, tile_size=64).detect_frame(data)[0]
+    whole = StarDetectionProcessor(None, tile_size=1024).detect_frame(data)[0]
+
+    assert len(tiled['x']) == len(whole['x']) == len(stars)
+    found = np.column_stack((tiled['x'], tiled['y']))
+    for x, y in stars:
+        assert np.min(np.hypot(found[:, 0] - x, found[:, 1] - y)) < 0.5
+    order = np.lexsort((tiled['y'], tiled['x']))
+    whole_order = np.lexsort((whole['y'], whole['x']))
+    np.testing.assert_allclose(tiled['x'][order], whole['x'][whole_order], atol=1e-6)
+
+
+def test_session_round_trip_keeps_state_and_detects_changed_masters(tmp_path):
+    import json
+    from utils.config import Config, MASTER_TYPES
+    from utils.helpers import fingerprint_matches
+
+    lights, _ = _write_lights(str(tmp_path), count=2)
+    bias, _, _ = _masters()
+    bias_path = str(tmp_path / "master_bias.fits")
+    bias.write(bias_path)
+    (tmp_path / "calibrated").mkdir()
+    (tmp_path / "calibrated" / "manifest.json").write_text("{}")
+
+    config = Config()
+    config.set_working_directory(str(tmp_path))
+    config.add_files("lights", lights)
+    config.set_master("bias", bias_path)
+    config.calibration.update(gain=1.7, read_noise=5.5, cosmic_rays={'sigclip': 6.0})
+    config.calibrated_lights = [str(tmp_path / "calibrated" / "calibrated_light_000.fits")]
+    config.rejected_lights = ["light_001.fits"]
+    config.current_image_type, config.current_image_index = "calibrated", 1
+    config.update_products()
+    session = str(tmp_path / "session.json")
+    config.save_config(session)
+
+    loaded = Config(session)
+    for name in ('working_directory', 'lights', 'calibration', 'calibrated_lights', 'rejected_lights',
+                 'products', 'current_image_type', 'current_image_index'):
+        assert getattr(loaded, name) == getattr(config, name), name
+    assert loaded.products == {'manifest': str(tmp_path / "calibrated" / "manifest.json")}
+    assert [loaded.get_master(t) for t in MASTER_TYPES] == [config.master_bias, None, None]
+    assert fingerprint_matches(loaded.master_bias)
+
+    bias.data[0, 0] += 1.0
+    bias.write(bias_path, overwrite=True)
+    assert not fingerprint_matches(loaded.master_bias)
+
+    # Старый файл конфигурации без полей сессии
+    old = str(tmp_path / "old.json")
+    with open(old, 'w', encoding='utf-8') as f:
+        json.dump({"working_directory": str(tmp_path), "lights": lights}, f)
+    legacy = Config(old)
+    assert legacy.lights == lights and legacy.master_bias is None and legacy.master_flats == {}
+    assert legacy.calibration == {"remove_cosmic_rays": False}
+
+
+def test_thumbnail_cache_is_reused_until_frame_changes(tmp_path):
+    from processing.thumbnails import ThumbnailProcessor
+
+    lights, _ = _write_lights(str(tmp_path), count=2, shape=(64, 96))
+    thumbnails = ThumbnailProcessor(_App(tmp_path), size=32, max_workers=1)
+
+    generated = dict(thumbnails.generate(lights))
+    assert set(generated) == set(lights)
+    assert generated[lights[0]].shape == (21, 32) and generated[lights[0]].dtype == np.uint8
+    assert thumbnails.missing(lights) == []
+    np.testing.assert_array_equal(thumbnails.load(lights[0]), generated[lights[0]])
+
+    data = fits.getdata(lights[1])
+    fits.writeto(lights[1], data * 2, overwrite=True)
+    stat = os.stat(lights[1])
+    os.utime(lights[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert thumbnails.missing(lights) == [lights[1]]
+    assert thumbnails.load(lights[1]) is None
+
+
+def test_tiled_reader_windows_match_scaled_frame(tmp_path):
+    from utils.roi import TiledFrameReader
+
+    rng = np.random.default_rng(9)
+    data = rng.integers(0, 65536, (70, 90)).astype(np.uint16)
+    path = str(tmp_path / "frame.fits")
+    fits.writeto(path, data)
+
+    with TiledFrameReader(path, tile_size=16, max_tiles=4) as reader:
+        assert reader.shape == data.shape
+        for y0, y1, x0, x1 in [(5, 40, 10, 75), (-3, 8, 80, 120), (60, 70, 0, 16)]:
+            window, bounds = reader.read(y0, y1, x0, x1, prefetch=False)
+            cy0, cy1, cx0, cx1 = bounds
+            assert bounds == (max(0, y0), min(70, y1), max(0, x0), min(90, x1))
+            np.testing.assert_array_equal(window, data[cy0:cy1, cx0:cx1].astype(np.float32))
+        assert len(reader._tiles) <= 4
+
+
+def test_frame_stats_match_numpy_on_bands(tmp_path):
+    from astropy.stats import mad_std
+    from processing.frame_stats import compute_frame_stats
+
+    rng = np.random.default_rng(10)
+    data = rng.normal(1000.0, 20.0, (61, 47)).astype(np.float32)
+    data[3, 4] = np.nan
+    data[10:12, 20] = 5000.0
+    path = str(tmp_path / "frame.fits")
+    fits.writeto(path, data, fits.Header({'SATURATE': 4000.0}))
+
+    stats = compute_frame_stats(path, chunk_rows=7, sample_step=3)
+
+    finite = data[np.isfinite(data)].astype(np.float64)
+    sample = data[::3, ::3]
+    sample = sample[np.isfinite(sample)]
+    assert stats['pixels'] == finite.size and stats['saturated'] == 2
+    np.testing.assert_allclose(stats['mean'], finite.mean(), rtol=1e-9)
+    assert (stats['min'], stats['max']) == (finite.min(), finite.max())
+    np.testing.assert_allclose(stats['median'], np.median(sample))
+    np.testing.assert_allclose(stats['mad_std'], mad_std(sample), rtol=1e-6)
+
+
+def test_background_cache_is_keyed_by_absolute_path(tmp_path):
+    pytest.importorskip('scipy')
+    from processing.background import BackgroundProcessor
+
+    processor = BackgroundProcessor(_App(tmp_path), box_size=(16, 16))
+    paths = []
+    for level, folder in ((500.0, "night1"), (900.0, "night2")):
+        (tmp_path / folder).mkdir()
+        paths.append(str(tmp_path / folder / "light_000.fits"))
+        rng = np.random.default_rng(int(level))
+        fits.writeto(paths[-1], rng.normal(level, 5.0, (64, 64)).astype(np.float32))
+
+    meshes = [processor.get_mesh(path) for path in paths]
+    assert processor.get_cache_path(paths[0]) != processor.get_cache_path(paths[1])
+    for mesh, level, path in zip(meshes, (500.0, 900.0), paths):
+        np.testing.assert_allclose(mesh.background_median, level, atol=2.0)
+        np.testing.assert_allclose(processor.load_mesh(path).background_median, mesh.background_median)
+
+    stat = os.stat(paths[0])
+    os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert processor.load_mesh(paths[0]) is None
+
+
+def test_quality_metrics_are_computed_on_calibrated_frames(tmp_path):
+    pytest.importorskip('scipy')
+    from processing.quality import QualityProcessor
+
+    app = _App(tmp_path)
+    lights, _ = _write_lights(str(tmp_path), count=2)
+    bias, dark, flat = _masters()
+    quality = QualityProcessor(app, max_workers=1)
+
+    raw = quality.compute_metrics(lights)
+    calibrated = quality.compute_metrics(lights, bias, dark, {None: flat})
+
+    np.testing.assert_allclose(raw['background'], 1100.0, atol=5.0)
+    np.testing.assert_allclose(calibrated['background'], 1100.0 - 105.0, atol=15.0)
+    assert list(calibrated['n_stars']) == list(raw['n_stars'])